@@ -1,17 +1,35 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
-from notificaciones import crear_tablas, crear_notificacion, asignar_a_usuario, marcar_vista, listar_por_usuario
-from clases import crear_clases, eliminar_clase, dejar_clase, unirse_clase, clases_por_usuario
-from db import random_id, conectar
-from usuarios import obtener_usuario_por_id
+from notificaciones import UsuariosDesconocidos, crear_notificacion, obtener_notificacion, asignar_a_usuario, asignar_a_usuarios, asignar_a_clase, marcar_vista, listar_por_usuario, contar_no_vistas, codificar_cursor, decodificar_cursor
+from clases import crear_clases, eliminar_clase, dejar_clase, unirse_clase, clases_por_usuario, obtener_clase, inscribir_por_email
+from db import conectar, transaccion, init_app as init_db
+from migraciones import migrar
+from ids import nuevo_id
+import cache
+import hashing
+import correo
+import mensajes_chat
+import metricas
+import logs
+from usuarios import obtener_usuario_por_id, obtener_usuario_por_email as buscar_usuario_por_email
 from login import comp_login, comp_reg_alum, comp_reg_prof
 from datetime import datetime, timedelta, timezone
 import os
+import io
+import csv
+import sqlite3
+import json
 from dotenv import load_dotenv
-import traceback
+import logging
 import jwt
 from flask_socketio import SocketIO
-from call_signaling import register_signaling
+from call_signaling import register_signaling, sala_usuario
+from chat import register_chat
+from registro_sockets import RegistroRedis
+from cola_mensajes import AdministradorTCP
+from candidatos_ice import CoalescedorIce
+from presencia import Presencia, PresenciaRedis
+from salas_llamada import SalasLlamadaMemoria, SalasLlamadaRedis
 from storage import register_storage
 import tempfile
 import os
@@ -19,24 +37,97 @@ import os
 archivos_temporales = {}
 
 load_dotenv()
+logs.configurar()
+log = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("SECRET_KEY", "A99GJFJKSLKJi129873@#$$%&&/()=?¿")
 
 app = Flask(__name__)
 CORS(app)
-crear_tablas()
-
-# Socket.IO (Flask integration)
-socketio = SocketIO(app, cors_allowed_origins='*')
-
-# Registrar los manejadores de señalización de llamadas
-register_signaling(socketio)
+init_db(app)
+metricas.init_app(app)
+migrar()
+cache.configurar_desde_entorno()
+hashing.iniciar()
+correo.iniciar_remitente()
+mensajes_chat.iniciar_escritor()
+
+# Socket.IO (Flask integration). Con SOCKETIO_MESSAGE_QUEUE varios procesos
+# comparten los emits: redis://... (o cualquier URL de kombu) o tcp://host:puerto
+# para la cola local de cola_mensajes.py
+_cola_socketio = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+if _cola_socketio and _cola_socketio.startswith("tcp://"):
+    socketio = SocketIO(app, cors_allowed_origins='*', client_manager=AdministradorTCP(_cola_socketio))
+else:
+    socketio = SocketIO(app, cors_allowed_origins='*', message_queue=_cola_socketio)
+
+# Registrar los manejadores de señalización de llamadas. Con SOCKETS_REDIS_URL
+# el mapa usuario <-> sockets se comparte entre procesos.
+_sockets_redis_url = os.getenv("SOCKETS_REDIS_URL")
+coalescedor_ice = CoalescedorIce(socketio)
+presencia = Presencia(socketio, PresenciaRedis(_sockets_redis_url) if _sockets_redis_url else None)
+llamadas = SalasLlamadaRedis(_sockets_redis_url) if _sockets_redis_url else SalasLlamadaMemoria()
+registro_sockets = register_signaling(
+    socketio, RegistroRedis(_sockets_redis_url) if _sockets_redis_url else None, coalescedor_ice, presencia, llamadas)
+
+# Estado que otros modulos ya llevan; se lee al exponer /metrics
+# Entradas del registro usuario <-> sid, no conexiones vivas: las conexiones
+# abiertas son learned_socketio_clientes_conectados (metricas.py)
+metricas.Medidor("learned_socketio_sockets_registrados",
+                 "Sockets en el registro de usuarios (de todos los procesos con SOCKETS_REDIS_URL).",
+                 funcion=registro_sockets.cantidad)
+metricas.Medidor("learned_llamadas_activas", "Llamadas grupales con al menos un participante.",
+                 funcion=llamadas.activas)
+metricas.Contador("learned_cache_consultas_total", "Lecturas de la cache por resultado.", ("resultado",),
+                  funcion=lambda: {("hit",): cache.estadisticas()["hits"], ("miss",): cache.estadisticas()["misses"]})
+metricas.Contador("learned_ice_candidatos_total", "Candidatos ICE recibidos por el coalescedor.",
+                  funcion=lambda: coalescedor_ice.estadisticas()["candidatos"])
+metricas.Contador("learned_ice_lotes_total", "Lotes webrtc_ice_candidates emitidos.",
+                  funcion=lambda: coalescedor_ice.estadisticas()["lotes"])
+
+# Chat por clase (salas clase:<id>)
+register_chat(socketio, registro_sockets)
 
 # Registrar endpoints de storage (subida/descarga)
 register_storage(app)
 
 @app.route("/api/notificaciones/<usuario_id>", methods=["GET"])
 def obtener_notificaciones(usuario_id):
-    data = listar_por_usuario(usuario_id)
+    """
+    Query params opcionales:
+      - limit, cursor: paginacion por keyset; devuelve {"notificaciones": [...], "siguiente": cursor|null}
+      - desde: token de la ultima notificacion recibida (evento notification o
+        campo token); devuelve solo las posteriores, de la mas vieja a la mas
+        nueva, y en "siguiente" el token para seguir si quedan mas
+      - no_vistas=1, sin_responder=1: filtros
+    Sin limit, cursor ni desde devuelve la lista completa como antes, por
+    fecha de creacion de la notificacion. Paginado el orden es por cuando
+    le llego al usuario (recibida_en).
+    """
+    paginado = "limit" in request.args or "cursor" in request.args or "desde" in request.args
+    limite = None
+    despues_de = None
+    desde = None
+    if paginado:
+        limite = request.args.get("limit", default=20, type=int)
+        if limite < 1 or limite > 100:
+            return jsonify({"error": "limit debe estar entre 1 y 100"}), 400
+        if request.args.get("cursor"):
+            despues_de = decodificar_cursor(request.args["cursor"])
+            if not despues_de:
+                return jsonify({"error": "Cursor inválido"}), 400
+        if request.args.get("desde"):
+            desde = decodificar_cursor(request.args["desde"])
+            if not desde:
+                return jsonify({"error": "Token inválido"}), 400
+
+    data = listar_por_usuario(
+        usuario_id,
+        limite=limite,
+        despues_de=despues_de,
+        solo_no_vistas=request.args.get("no_vistas") == "1",
+        solo_sin_responder=request.args.get("sin_responder") == "1",
+        desde=desde
+    )
     notis = [
         {
             "asignacion_id": r[0],
@@ -45,18 +136,29 @@ def obtener_notificaciones(usuario_id):
             "vista": bool(r[3]),
             "respondida": bool(r[4]),
             "tipo": r[5],
-            "creada_en": r[6]
+            "creada_en": r[6],
+            "token": codificar_cursor(r[7], r[0])
         }
         for r in data
     ]
-    return jsonify(notis)
+    if not paginado:
+        return jsonify(notis)
+
+    siguiente = None
+    if len(data) == limite:
+        siguiente = codificar_cursor(data[-1][7], data[-1][0])
+    return jsonify({"notificaciones": notis, "siguiente": siguiente})
+
+@app.route("/api/notificaciones/<usuario_id>/unread_count", methods=["GET"])
+def contar_notificaciones_no_vistas(usuario_id):
+    return jsonify({"no_vistas": contar_no_vistas(usuario_id)})
 
 
 
 @app.route("/api/notificaciones", methods=["POST"])
 def nueva_notificacion():
     body = request.json
-    noti_id = random_id("notificaciones")
+    noti_id = nuevo_id()
     crear_notificacion(
         id=noti_id,
         tipo=body["tipo"],
@@ -67,15 +169,36 @@ def nueva_notificacion():
     )
     return jsonify({"status": "ok", "id": noti_id})
 
+def avisar_asignaciones(noti, asignaciones):
+    """
+    Empuja el evento notification a la sala de cada destinatario. noti es un
+    dict con id, tipo, titulo y clase_id; asignaciones son tuplas
+    (asignacion_id, usuario_id, recibida_en). El token permite al cliente
+    pedir con ?desde= lo que se perdio mientras estaba desconectado.
+    """
+    for asignacion_id, usuario_id, recibida_en in asignaciones:
+        socketio.emit('notification', {
+            "asignacion_id": asignacion_id,
+            "notificacion_id": noti["id"],
+            "tipo": noti["tipo"],
+            "titulo": noti["titulo"],
+            "clase_id": noti.get("clase_id"),
+            "recibida_en": recibida_en,
+            "token": codificar_cursor(recibida_en, asignacion_id),
+        }, to=sala_usuario(usuario_id))
+
 @app.route("/api/notificaciones/asignar", methods=["POST"])
 def asignar():
     body = request.json
-    asignacion_id = random_id("notificaciones_usuarios")
-    asignar_a_usuario(
+    asignacion_id = nuevo_id()
+    recibida_en = asignar_a_usuario(
         noti_id=body["notificacion_id"],
         usuario_id=body["usuario_id"],
         asignacion_id=asignacion_id
     )
+    noti = obtener_notificacion(body["notificacion_id"])
+    if noti:
+        avisar_asignaciones(noti, [(asignacion_id, body["usuario_id"], recibida_en)])
     return jsonify({"status": "ok", "asignacion_id": asignacion_id})
 
 @app.route("/api/notificaciones/vista/<asignacion_id>", methods=["POST"])
@@ -85,26 +208,53 @@ def marcar_como_vista(asignacion_id):
 
 @app.route("/api/notificaciones/crear", methods=["POST"])
 def crear_y_asignar():
+    """
+    Crea la notificacion y sus asignaciones en una sola transaccion.
+    Body: { tipo, titulo, descripcion, creado_por, usuarios: [...] }
+    o, para avisar a toda la clase sin mandar la lista de alumnos:
+          { tipo, titulo, descripcion, creado_por, clase_id, toda_la_clase: true }
+    """
     body = request.json
 
-    if not all(k in body for k in ["tipo", "titulo", "descripcion", "creado_por", "usuarios"]):
+    if not all(k in body for k in ["tipo", "titulo", "descripcion", "creado_por"]):
         return jsonify({"error": "Faltan campos obligatorios"}), 400
 
-    noti_id = random_id("notificaciones")
-    crear_notificacion(
-        id=noti_id,
-        tipo=body["tipo"],
-        clase_id=body.get("clase_id"),
-        titulo=body["titulo"],
-        descripcion=body["descripcion"],
-        creado_por=body["creado_por"]
-    )
+    toda_la_clase = bool(body.get("toda_la_clase"))
+    if toda_la_clase and not body.get("clase_id"):
+        return jsonify({"error": "Falta el campo clase_id"}), 400
+    if not toda_la_clase and not isinstance(body.get("usuarios"), list):
+        return jsonify({"error": "Faltan campos obligatorios"}), 400
+    if not toda_la_clase and not all(isinstance(u, str) and u for u in body["usuarios"]):
+        return jsonify({"error": "usuarios debe ser una lista de ids"}), 400
 
-    asignaciones = []
-    for usuario_id in body["usuarios"]:
-        asignacion_id = random_id("notificaciones_usuarios")
-        asignar_a_usuario(noti_id, usuario_id, asignacion_id)
-        asignaciones.append({"usuario_id": usuario_id, "asignacion_id": asignacion_id})
+    noti_id = nuevo_id()
+    try:
+        with transaccion():
+            crear_notificacion(
+                id=noti_id,
+                tipo=body["tipo"],
+                clase_id=body.get("clase_id"),
+                titulo=body["titulo"],
+                descripcion=body["descripcion"],
+                creado_por=body["creado_por"]
+            )
+            if toda_la_clase:
+                filas = asignar_a_clase(noti_id, body["clase_id"], excluir_usuario_id=body["creado_por"])
+            else:
+                filas = asignar_a_usuarios(noti_id, body["usuarios"])
+    except UsuariosDesconocidos as e:
+        return jsonify({"error": "Usuarios desconocidos", "usuarios": e.ids}), 400
+    except sqlite3.IntegrityError:
+        # tipo fuera del CHECK, o creado_por / clase_id que no existen (foreign_keys)
+        return jsonify({"error": "tipo, creado_por o clase_id invalidos"}), 400
+
+    # Despues del commit: el cliente que reanude con el token ya ve las filas
+    avisar_asignaciones({"id": noti_id, "tipo": body["tipo"], "titulo": body["titulo"],
+                         "clase_id": body.get("clase_id")}, filas)
+    asignaciones = [
+        {"usuario_id": usuario_id, "asignacion_id": asignacion_id}
+        for asignacion_id, usuario_id, _ in filas
+    ]
 
     return jsonify({
         "status": "ok",
@@ -124,6 +274,7 @@ def nueva_clase():
         descripcion=body["descripcion"],
         profesor_id=body["profesor_id"]
     )
+    presencia.unido_a_clase(body["profesor_id"], clase_id)
 
     return jsonify({"status": "ok", "clase_id": clase_id})
 
@@ -134,9 +285,54 @@ def unirse():
     if not all(k in body for k in ["usuario_id", "clase_id"]):
         return jsonify({"error": "Faltan campos obligatorios"}), 400
     
-    unirse_clase(body["usuario_id"], body["clase_id"])
+    creada = unirse_clase(body["usuario_id"], body["clase_id"])
+    presencia.unido_a_clase(body["usuario_id"], body["clase_id"], creada)
     return jsonify({"status": "ok", "mensaje": "Usuario unido a la clase"})
 
+def _leer_roster(stream, content_type):
+    """Genera (numero_de_fila, email) leyendo el body linea por linea."""
+    # utf-8-sig: los CSV que exporta Excel empiezan con BOM
+    texto = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        for numero, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+            except ValueError:
+                yield numero, None
+                continue
+            yield numero, fila.get("email") if isinstance(fila, dict) else fila
+        return
+    lector = csv.reader(texto)
+    columna = 0
+    for numero, fila in enumerate(lector, start=1):
+        if not fila:
+            continue
+        # primera fila con encabezado: buscar la columna email
+        if numero == 1 and "email" in [c.strip().lower() for c in fila]:
+            columna = [c.strip().lower() for c in fila].index("email")
+            continue
+        yield numero, fila[columna] if columna < len(fila) else None
+
+@app.route("/api/clases/<clase_id>/alumnos/importar", methods=["POST"])
+def importar_alumnos(clase_id):
+    """
+    Inscripcion masiva desde un CSV (columna email o primera columna) o
+    NDJSON ({"email": ...} por linea). El body se lee en streaming.
+    Devuelve un resumen y el resultado de cada fila.
+    """
+    if not obtener_clase(clase_id):
+        return jsonify({"error": "Clase no encontrada"}), 404
+
+    reporte = inscribir_por_email(clase_id, _leer_roster(request.stream, request.content_type or ""))
+    resumen = {}
+    for fila in reporte:
+        resumen[fila["resultado"]] = resumen.get(fila["resultado"], 0) + 1
+        if fila["resultado"] == "inscripto":
+            presencia.unido_a_clase(fila["usuario_id"], clase_id)
+    return jsonify({"status": "ok", "resumen": resumen, "filas": reporte})
+
 @app.route("/api/clases/abandonar", methods=["POST"])
 def abandonar_clase():
     body = request.json
@@ -144,6 +340,7 @@ def abandonar_clase():
         return jsonify({"error": "Faltan campos obligatorios"}), 400
 
     dejar_clase(body["usuario_id"], body["clase_id"])
+    presencia.salio_de_clase(body["usuario_id"], body["clase_id"])
     return jsonify({"status": "ok", "mensaje": "Usuario ha abandonado la clase"})
 
 @app.route("/upload", methods=["POST"])
@@ -177,6 +374,7 @@ def eliminar_clase_api():
         return jsonify({"error": "Falta el campo clase_id"}), 400
 
     eliminar_clase(body["clase_id"])
+    presencia.clase_eliminada(body["clase_id"])
     return jsonify({"status": "ok", "mensaje": "Clase eliminada correctamente"})
 
 @app.route("/api/clases/<usuario_id>", methods=["GET"])
@@ -197,35 +395,37 @@ def obtener_clases(usuario_id):
 
 @app.route("/api/clase/<clase_id>", methods=["GET"])
 def obtener_clase_por_id(clase_id):
-    conn = conectar()
-    cursor = conn.cursor()
-
-    query = """
-        SELECT 
-            id,
-            nombre,
-            descripcion,
-            profesor_id,
-            creado_en
-        FROM clases
-        WHERE id = ?
-    """
-    cursor.execute(query, (clase_id,))
-    resultado = cursor.fetchone()
-    conn.close()
-    
-    if resultado:
-        clase = {
-            "id": resultado[0],
-            "nombre": resultado[1],
-            "descripcion": resultado[2],
-            "profesor_id": resultado[3],
-            "creado_en": resultado[4]
-        }
+    clase = obtener_clase(clase_id)
+    if clase:
         return jsonify(clase)
     else:
         return jsonify({"error": "Clase no encontrada"}), 404
 
+@app.route("/api/clases/<clase_id>/mensajes", methods=["GET"])
+def historial_chat(clase_id):
+    """
+    Historial del chat, del mensaje mas nuevo al mas viejo.
+    Query params: limit (1-100, por defecto 50) y cursor (el "siguiente" de la pagina anterior).
+    """
+    limite = request.args.get("limit", default=50, type=int)
+    if limite < 1 or limite > 100:
+        return jsonify({"error": "limit debe estar entre 1 y 100"}), 400
+    despues_de = None
+    if request.args.get("cursor"):
+        despues_de = decodificar_cursor(request.args["cursor"])
+        if not despues_de:
+            return jsonify({"error": "Cursor inválido"}), 400
+
+    filas = mensajes_chat.listar_por_clase(clase_id, limite=limite, despues_de=despues_de)
+    mensajes = [
+        {"id": f[0], "clase_id": f[1], "usuario_id": f[2], "texto": f[3], "enviado_en": f[4]}
+        for f in filas
+    ]
+    siguiente = None
+    if len(filas) == limite:
+        siguiente = codificar_cursor(filas[-1][4], filas[-1][0])
+    return jsonify({"mensajes": mensajes, "siguiente": siguiente})
+
 @app.route("/api/trabajos/<clase_id>/<alumno_id>", methods=["GET"])
 def obtener_trabajos_por_clase(clase_id, alumno_id):
     conn = conectar()
@@ -271,7 +471,7 @@ def crear_trabajo(clase_id):
     if not all(k in body for k in required):
         return jsonify({"error": "Faltan campos obligatorios"}), 400
 
-    trabajo_id = random_id("trabajos")
+    trabajo_id = nuevo_id()
 
     conn = conectar()
     cursor = conn.cursor()
@@ -287,7 +487,7 @@ def crear_trabajo(clase_id):
 @app.route("/api/clases/<clase_id>/usuarios")
 def obtener_usuarios_de_clase(clase_id):
     try:
-        print("DEBUG: obtener_usuarios_de_clase llamado con clase_id:", clase_id)
+        log.debug("obtener_usuarios_de_clase", extra={"clase_id": clase_id})
         conn = conectar()
         cursor = conn.cursor()
 
@@ -301,22 +501,34 @@ def obtener_usuarios_de_clase(clase_id):
         filas = cursor.fetchall()
         conn.close()
 
+        en_linea = presencia.en_linea(clase_id)
         usuarios_con_foto = []
         for i, u in enumerate(filas):
             usuarios_con_foto.append({
                 "id": u[0],
                 "nombre": u[1],
-                "estado": "desconectado",   # valor por defecto; adaptá si querés otro comportamiento
+                "estado": "conectado" if u[0] in en_linea else "desconectado",
                 "foto": "https://static.vecteezy.com/system/resources/previews/036/594/092/non_2x/man-empty-avatar-photo-placeholder-for-social-networks-resumes-forums-and-dating-sites-male-and-female-no-photo-images-for-unfilled-user-profile-free-vector.jpg"
             })
 
-        print("DEBUG: usuarios encontrados:", len(usuarios_con_foto))
+        log.debug("usuarios encontrados", extra={"clase_id": clase_id, "cantidad": len(usuarios_con_foto)})
         return jsonify(usuarios_con_foto)
     except Exception as e:
-        print("Error en obtener_usuarios_de_clase:", e)
-        traceback.print_exc()
+        log.exception("Error en obtener_usuarios_de_clase")
         return jsonify({"error": "Error interno del servidor", "detail": str(e)}), 500
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Metricas de la app en formato de texto de Prometheus."""
+    return Response(metricas.exponer(), content_type=metricas.CONTENT_TYPE)
+
+@app.errorhandler(hashing.PoolSaturado)
+def hashing_saturado(e):
+    # Rafaga de logins/registros: mejor rechazar rapido que congelar el servidor
+    respuesta = jsonify({"error": "Servidor ocupado, intentá de nuevo en unos segundos"})
+    respuesta.headers["Retry-After"] = "2"
+    return respuesta, 503
+
 # Registro de profesor con validaciones
 @app.route("/api/register/profesor", methods=["POST"])
 def register_profesor():
@@ -327,7 +539,10 @@ def register_profesor():
 
     # iniciamos el flujo de verificación que envía un código al email
     from usuarios import iniciar_registro_con_verificacion
-    token = iniciar_registro_con_verificacion(body["nombre"], body["email"], body["password"], rol="profesor")
+    try:
+        token = iniciar_registro_con_verificacion(body["nombre"], body["email"], body["password"], rol="profesor")
+    except ValueError:
+        return jsonify({"error": "Email invalido"}), 400
     if not token:
         return jsonify({"error": "No se pudo iniciar la verificación"}), 500
     return jsonify({"status": "ok", "token": token}), 200
@@ -342,7 +557,10 @@ def register_alumno():
         return jsonify({"error": "Faltan campos obligatorios"}), 400
 
     from usuarios import iniciar_registro_con_verificacion
-    token = iniciar_registro_con_verificacion(body["nombre"], body["email"], body["password"], rol="estudiante")
+    try:
+        token = iniciar_registro_con_verificacion(body["nombre"], body["email"], body["password"], rol="estudiante")
+    except ValueError:
+        return jsonify({"error": "Email invalido"}), 400
     if not token:
         return jsonify({"error": "No se pudo iniciar la verificación"}), 500
     return jsonify({"status": "ok", "token": token}), 200
@@ -399,18 +617,9 @@ def obtener_usuario(usuario_id):
     
 @app.route("/api/usuarios/email/<email>", methods=["GET"])
 def obtener_usuario_por_email(email):
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nombre, email, rol FROM usuarios WHERE email = ?", (email,))
-    usuario = cursor.fetchone()
-    conn.close()
+    usuario = buscar_usuario_por_email(email)
     if usuario:
-        return jsonify({"usuario": {
-            "id": usuario[0],
-            "nombre": usuario[1],
-            "email": usuario[2],
-            "rol": usuario[3]
-        }})
+        return jsonify({"usuario": usuario})
     else:
         return jsonify({"error": "Usuario no encontrado"}), 404
 
@@ -427,40 +636,40 @@ def responder_notificacion(asignacion_id):
     if action not in ("aceptar", "rechazar"):
         return jsonify({"error": "Acción no válida"}), 400
 
+    unido = None
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
-        # Obtener la asignación: id (asignacion) -> notificacion_id, usuario_id
-        cursor.execute("SELECT notificacion_id, usuario_id FROM notificaciones_usuarios WHERE id = ?", (asignacion_id,))
-        asign = cursor.fetchone()
-        if not asign:
-            conn.close()
-            return jsonify({"error": "Asignación no encontrada"}), 404
-
-        noti_id, usuario_id = asign[0], asign[1]
-
-        if action == "aceptar":
-            # obtener clase asociada a la notificación
-            cursor.execute("SELECT clase_id FROM notificaciones WHERE id = ?", (noti_id,))
-            fila = cursor.fetchone()
-            if fila and fila[0]:
-                clase_id = fila[0]
-                try:
-                    # unirse_clase debe crear la relación en clases_usuarios
-                    unirse_clase(usuario_id, clase_id)
-                except Exception as e:
-                    # ignorar si ya estaba unido o similar, solo loguear
-                    print("Warning al unir usuario a clase:", e)
-
-        # En ambos casos (aceptar o rechazar) eliminamos la asignación para que no aparezca más
-        cursor.execute("DELETE FROM notificaciones_usuarios WHERE id = ?", (asignacion_id,))
-        conn.commit()
-        conn.close()
-
+        with transaccion() as cursor:
+            # Obtener la asignación: id (asignacion) -> notificacion_id, usuario_id
+            cursor.execute("SELECT notificacion_id, usuario_id FROM notificaciones_usuarios WHERE id = ?", (asignacion_id,))
+            asign = cursor.fetchone()
+            if not asign:
+                return jsonify({"error": "Asignación no encontrada"}), 404
+
+            noti_id, usuario_id = asign[0], asign[1]
+
+            if action == "aceptar":
+                # obtener clase asociada a la notificación
+                cursor.execute("SELECT clase_id FROM notificaciones WHERE id = ?", (noti_id,))
+                fila = cursor.fetchone()
+                if fila and fila[0]:
+                    clase_id = fila[0]
+                    try:
+                        # unirse_clase debe crear la relación en clases_usuarios
+                        if unirse_clase(usuario_id, clase_id):
+                            unido = (usuario_id, clase_id)
+                    except Exception as e:
+                        # ignorar si ya estaba unido o similar, solo loguear
+                        log.warning("No se pudo unir el usuario a la clase", extra={"error": str(e)})
+
+            # En ambos casos (aceptar o rechazar) eliminamos la asignación para que no aparezca más
+            cursor.execute("DELETE FROM notificaciones_usuarios WHERE id = ?", (asignacion_id,))
+
+        # Despues del commit, para no anunciar una union que se deshizo
+        if unido:
+            presencia.unido_a_clase(*unido)
         return jsonify({"status": "ok"})
     except Exception as e:
-        print("Error en responder_notificacion:", e)
+        log.exception("Error en responder_notificacion")
         return jsonify({"error": "Error interno del servidor"}), 500
 
 
@@ -479,27 +688,9 @@ def eliminar_asignacion(asignacion_id):
         conn.close()
         return jsonify({"status": "ok"})
     except Exception as e:
-        print("Error al eliminar asignacion:", e)
+        log.exception("Error al eliminar asignacion")
         return jsonify({"error": "Error interno del servidor"}), 500
 
-@socketio.on('connect')
-def handle_connect():
-    print('🔌 Cliente conectado')
-
-
-@socketio.on('chat_message')
-def handle_chat_message(data):
-    print(f'Mensaje recibido: {data}')
-    # Reenviamos el mensaje a todos los clientes conectados
-    # flask-socketio.server.emit no acepta broadcast kwarg en algunas versiones;
-    # llamar emit(event, data) enviará a todos en namespace global.
-    socketio.emit('chat_message', data)
-
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    print('❌ Cliente desconectado')
-
 
 if __name__ == '__main__':
     # usamos eventlet/uWSGI/gunicorn en producción; para desarrollo socketio.run funciona bien
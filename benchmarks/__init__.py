@@ -0,0 +1 @@
+"""Benchmarks del backend. Cada modulo se ejecuta con `python -m benchmarks.<modulo>`."""
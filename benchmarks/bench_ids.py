@@ -0,0 +1,73 @@
+"""
+Compara el throughput de INSERT usando el viejo db.random_id (conexion
+nueva + SELECT por cada id) contra ids.nuevo_id() / ids.allocate(n).
+
+    python -m benchmarks.bench_ids [filas]
+"""
+
+import os
+import secrets
+import sqlite3
+import sys
+import tempfile
+import time
+
+import ids
+
+
+def _random_id_legacy(db_path, tabla):
+    # Reproduce el comportamiento de db.random_id antes de ids.py
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    while True:
+        nuevo_id = secrets.token_hex(10)
+        cursor.execute(f"SELECT 1 FROM {tabla} WHERE id = ?", (nuevo_id,))
+        if not cursor.fetchone():
+            conn.close()
+            return nuevo_id
+
+
+def _crear_tabla(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS filas (id TEXT PRIMARY KEY, valor TEXT)")
+    conn.commit()
+    return conn
+
+
+def medir(nombre, db_path, filas, generar):
+    conn = _crear_tabla(db_path)
+    inicio = time.perf_counter()
+    for i in range(filas):
+        conn.execute("INSERT INTO filas (id, valor) VALUES (?, ?)", (generar(), str(i)))
+    conn.commit()
+    duracion = time.perf_counter() - inicio
+    conn.close()
+    print(f"{nombre:<22} {filas} filas en {duracion:.3f}s -> {filas / duracion:,.0f} filas/s")
+    return duracion
+
+
+def medir_bulk(db_path, filas):
+    conn = _crear_tabla(db_path)
+    inicio = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO filas (id, valor) VALUES (?, ?)",
+        ((id_, str(i)) for i, id_ in enumerate(ids.allocate(filas)))
+    )
+    conn.commit()
+    duracion = time.perf_counter() - inicio
+    conn.close()
+    print(f"{'ids.allocate(n)':<22} {filas} filas en {duracion:.3f}s -> {filas / duracion:,.0f} filas/s")
+    return duracion
+
+
+def main(filas=20000):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "legacy.db")
+        medir("db.random_id (viejo)", legacy, filas, lambda: _random_id_legacy(legacy, "filas"))
+        medir("ids.nuevo_id", os.path.join(tmp, "nuevo.db"), filas, ids.nuevo_id)
+        medir_bulk(os.path.join(tmp, "bulk.db"), filas)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
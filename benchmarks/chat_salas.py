@@ -0,0 +1,122 @@
+"""
+Prueba de carga del chat por clase.
+
+Conecta N clientes de prueba de Socket.IO, mete R de ellos en la sala de
+una clase y mide cuanto cuesta emitir cada mensaje. Para comparar tambien
+mide el broadcast global que se usaba antes: el costo por mensaje en la sala
+tiene que crecer con R y quedar plano al aumentar N.
+
+    python -m benchmarks.chat_salas --conectados 500 2000 --salas 10 50 200
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from ids import allocate
+
+
+def cargar_app(db_path):
+    os.environ["SMTP_HOST"] = ""
+    # Los avisos de arranque (migraciones) no se mezclan con la tabla de resultados
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import db
+    from migraciones import migrar
+    db.cerrar_pool()
+    db.DB_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as aplicacion
+        # app solo migra la primera vez que se importa
+        migrar()
+    return aplicacion
+
+
+def crear_datos(conectados, salas):
+    """Crea los usuarios y una clase por tamaño de sala con sus primeros R usuarios."""
+    from db import transaccion
+    usuarios = allocate(conectados)
+    clases = {}
+    with transaccion() as cursor:
+        cursor.executemany("""
+            INSERT INTO usuarios (id, nombre, email, password_hash, rol)
+            VALUES (?, ?, ?, x'00', 'estudiante')
+        """, [(u, f"u{i}", f"u{i}@bench.local") for i, u in enumerate(usuarios)])
+        for tamano in salas:
+            clase_id, = allocate(1)
+            clases[tamano] = clase_id
+            cursor.execute("""
+                INSERT INTO clases (id, nombre, profesor_id) VALUES (?, ?, ?)
+            """, (clase_id, f"sala {tamano}", usuarios[0]))
+            cursor.executemany("""
+                INSERT INTO participaciones (id, usuario_id, clase_id) VALUES (?, ?, ?)
+            """, [(p, u, clase_id) for p, u in zip(allocate(tamano), usuarios[:tamano])])
+    return usuarios, clases
+
+
+def medir(fn, mensajes, clientes):
+    inicio = time.perf_counter()
+    for i in range(mensajes):
+        fn(i)
+    duracion = time.perf_counter() - inicio
+    for cliente in clientes:
+        cliente.get_received()
+    return duracion / mensajes * 1000
+
+
+def correr(conectados, salas, mensajes):
+    with tempfile.TemporaryDirectory() as tmp:
+        aplicacion = cargar_app(os.path.join(tmp, "chat.db"))
+        socketio = aplicacion.socketio
+        usuarios, clases = crear_datos(conectados, salas)
+        clientes = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for usuario_id in usuarios:
+                cliente = socketio.test_client(aplicacion.app)
+                cliente.emit('register_user', {'usuario_id': usuario_id})
+                clientes.append(cliente)
+        for cliente in clientes:
+            cliente.get_received()
+
+        filas = []
+        for tamano in salas:
+            clase_id = clases[tamano]
+            for cliente in clientes[:tamano]:
+                respuesta = cliente.emit('join_clase', {'clase_id': clase_id}, callback=True)
+                assert respuesta == {"status": "ok"}, respuesta
+            emisor = clientes[0]
+            sala_ms = medir(lambda i: emisor.emit('chat_message', {'clase_id': clase_id, 'texto': f"m{i}"}),
+                            mensajes, clientes)
+            for cliente in clientes[:tamano]:
+                cliente.emit('leave_clase', {'clase_id': clase_id})
+            filas.append((tamano, sala_ms))
+
+        global_ms = medir(lambda i: socketio.emit('chat_message', {'texto': f"m{i}"}),
+                          mensajes, clientes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for cliente in clientes:
+                cliente.disconnect()
+        import db
+        db.cerrar_pool()
+        return filas, global_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conectados", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--salas", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--mensajes", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'conectados':>10} {'sala':>6} {'ms/msg sala':>12} {'ms/msg global':>14}")
+    for conectados in args.conectados:
+        salas = [s for s in args.salas if s <= conectados]
+        filas, global_ms = correr(conectados, salas, args.mensajes)
+        for tamano, sala_ms in filas:
+            print(f"{conectados:>10} {tamano:>6} {sala_ms:>12.3f} {global_ms:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
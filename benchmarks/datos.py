@@ -0,0 +1,201 @@
+"""
+Generador determinista de datos sinteticos para benchmarks.
+
+Con la misma semilla y escala siempre produce exactamente las mismas filas.
+La escala 1.0 equivale a 50k usuarios, 2k clases y 1M asignaciones de
+notificaciones; escalas chicas (0.01) sirven para pruebas rapidas.
+
+    python -m benchmarks.datos bench.db --escala 1.0 --semilla 42
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import bcrypt
+
+import db
+from migraciones import migrar
+
+# Todos los usuarios generados comparten esta contraseña (cumple validar_password)
+PASSWORD = "Benchmark1!"
+
+VOLUMENES = {
+    "usuarios": 50_000,
+    "clases": 2_000,
+    "alumnos_por_clase": 30,
+    "trabajos_por_clase": 10,
+    "asignaciones": 1_000_000,
+    "mensajes_por_clase": 50,
+}
+
+_ALFABETO = "0123456789abcdefghjkmnpqrstvwxyz"
+_FECHA_BASE = 1_735_689_600  # 2025-01-01
+
+
+def _id(rng):
+    return "".join(rng.choice(_ALFABETO) for _ in range(26))
+
+
+def _fecha(rng, dias=300):
+    segundos = _FECHA_BASE + rng.randrange(dias * 86400)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(segundos))
+
+
+def volumenes(escala):
+    return {
+        "usuarios": max(10, int(VOLUMENES["usuarios"] * escala)),
+        "clases": max(2, int(VOLUMENES["clases"] * escala)),
+        "alumnos_por_clase": VOLUMENES["alumnos_por_clase"],
+        "trabajos_por_clase": VOLUMENES["trabajos_por_clase"],
+        "asignaciones": max(10, int(VOLUMENES["asignaciones"] * escala)),
+        "mensajes_por_clase": VOLUMENES["mensajes_por_clase"],
+    }
+
+
+def _crear_esquema(db_path):
+    ruta_anterior = db.DB_PATH
+    db.cerrar_pool()
+    db.DB_PATH = db_path
+    try:
+        migrar()
+    finally:
+        db.cerrar_pool()
+        db.DB_PATH = ruta_anterior
+
+
+def generar(db_path, escala=1.0, semilla=42):
+    """Crea (o reemplaza) db_path con el dataset. Devuelve los volumenes usados."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    _crear_esquema(db_path)
+
+    v = volumenes(escala)
+    rng = random.Random(semilla)
+    # bcrypt usa sal aleatoria; se calcula una vez y es lo unico no determinista
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt())
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = OFF")
+    cursor = conn.cursor()
+
+    # usuarios: 5% profesores
+    usuarios = []
+    profesores = []
+    filas = []
+    for i in range(v["usuarios"]):
+        usuario_id = _id(rng)
+        rol = "profesor" if i % 20 == 0 else "estudiante"
+        usuarios.append(usuario_id)
+        if rol == "profesor":
+            profesores.append(usuario_id)
+        filas.append((usuario_id, f"Usuario {i}", f"usuario{i}@learned.test", password_hash, rol, _fecha(rng)))
+    cursor.executemany("""
+        INSERT INTO usuarios (id, nombre, email, password_hash, rol, creado_en)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, filas)
+
+    es_profesor = set(profesores)
+    alumnos = [u for u in usuarios if u not in es_profesor]
+
+    # clases con su profesor y alumnos
+    miembros = {}
+    clases = []
+    participaciones = []
+    for i in range(v["clases"]):
+        clase_id = _id(rng)
+        profesor_id = rng.choice(profesores)
+        clases.append((clase_id, f"Clase {i}", f"Descripcion de la clase {i}", profesor_id, _fecha(rng)))
+        inscriptos = rng.sample(alumnos, min(len(alumnos), v["alumnos_por_clase"]))
+        miembros[clase_id] = [profesor_id] + inscriptos
+        for usuario_id in miembros[clase_id]:
+            participaciones.append((_id(rng), usuario_id, clase_id, _fecha(rng)))
+    cursor.executemany("""
+        INSERT INTO clases (id, nombre, descripcion, profesor_id, creado_en)
+        VALUES (?, ?, ?, ?, ?)
+    """, clases)
+    cursor.executemany("""
+        INSERT INTO participaciones (id, usuario_id, clase_id, unido_en)
+        VALUES (?, ?, ?, ?)
+    """, participaciones)
+
+    # trabajos y estado por alumno
+    trabajos = []
+    trabajos_alumnos = []
+    for clase_id, *_ in clases:
+        for j in range(v["trabajos_por_clase"]):
+            trabajo_id = _id(rng)
+            trabajos.append((trabajo_id, f"Trabajo {j}", f"Consigna del trabajo {j}", clase_id))
+            for alumno_id in miembros[clase_id][1:]:
+                if rng.random() < 0.6:
+                    estado = rng.choice(("sin_hacer", "en_proceso", "realizado"))
+                    trabajos_alumnos.append((_id(rng), trabajo_id, alumno_id, estado))
+    cursor.executemany("""
+        INSERT INTO trabajos (id, titulo, descripcion, clase_id)
+        VALUES (?, ?, ?, ?)
+    """, trabajos)
+    cursor.executemany("""
+        INSERT INTO trabajos_alumnos (id, trabajo_id, alumno_id, estado)
+        VALUES (?, ?, ?, ?)
+    """, trabajos_alumnos)
+
+    # notificaciones repartidas a toda la clase hasta llegar a las asignaciones pedidas
+    restantes = v["asignaciones"]
+    notificaciones = []
+    asignaciones = []
+    while restantes > 0:
+        clase_id, _, _, profesor_id, _ = rng.choice(clases)
+        noti_id = _id(rng)
+        creada_en = _fecha(rng)
+        tipo = rng.choice(("tarea", "invitacion", "mensaje", "otro"))
+        notificaciones.append((noti_id, tipo, clase_id, f"Aviso {len(notificaciones)}", "Texto del aviso", profesor_id, creada_en))
+        for usuario_id in miembros[clase_id][1:restantes + 1]:
+            asignaciones.append((_id(rng), noti_id, usuario_id, int(rng.random() < 0.7), 0, creada_en))
+        restantes -= len(miembros[clase_id]) - 1
+        if len(asignaciones) >= 100_000:
+            cursor.executemany("""
+                INSERT INTO notificaciones_usuarios (id, notificacion_id, usuario_id, vista, respondida, recibida_en)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, asignaciones)
+            asignaciones = []
+    cursor.executemany("""
+        INSERT INTO notificaciones (id, tipo, clase_id, titulo, descripcion, creado_por, creada_en)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, notificaciones)
+    cursor.executemany("""
+        INSERT INTO notificaciones_usuarios (id, notificacion_id, usuario_id, vista, respondida, recibida_en)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, asignaciones)
+
+    # historial de chat de cada clase
+    mensajes = []
+    for clase_id, *_ in clases:
+        for k in range(v["mensajes_por_clase"]):
+            mensajes.append((_id(rng), clase_id, rng.choice(miembros[clase_id]), f"Mensaje {k}", _fecha(rng)))
+    cursor.executemany("""
+        INSERT INTO mensajes_chat (id, clase_id, usuario_id, texto, enviado_en)
+        VALUES (?, ?, ?, ?, ?)
+    """, mensajes)
+
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return v
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un dataset sintetico para benchmarks")
+    parser.add_argument("salida", help="ruta del archivo sqlite a generar")
+    parser.add_argument("--escala", type=float, default=1.0)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    v = generar(args.salida, args.escala, args.semilla)
+    print(f"Dataset generado en {time.perf_counter() - inicio:.1f}s: {v}")
+
+
+if __name__ == "__main__":
+    main()
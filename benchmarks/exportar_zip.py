@@ -0,0 +1,140 @@
+"""
+Mide la memoria de GET /api/clases/<id>/archivos/zip con exportaciones de
+distintos tamanos: el pico de tracemalloc y el RSS tienen que quedar
+planos aunque el zip crezca.
+
+Cada clase tiene trabajos con videos (incompresibles, van sin comprimir)
+y textos (van con deflate). El zip se consume por tramos, como lo haria
+el servidor, y solo se cuentan los bytes.
+
+    python -m benchmarks.exportar_zip --mb 16 128 512
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+MB = 1024 * 1024
+ARCHIVOS_POR_TRABAJO = 4
+
+
+def cargar_app(db_path, uploads_dir):
+    os.environ["SMTP_HOST"] = ""
+    # Los avisos de arranque (migraciones) no se mezclan con la tabla de resultados
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import db
+    from migraciones import migrar
+    db.cerrar_pool()
+    db.DB_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as aplicacion
+        import file_storage
+        file_storage.STORAGE_DIR = uploads_dir
+        migrar()
+    return aplicacion.app
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _escribir_staging(n, tamano, texto):
+    import file_storage
+    ruta = os.path.join(file_storage.staging_dir(), f"bench_{n}")
+    if texto:
+        bloque = (f"Entrega {n}: " + "lorem ipsum dolor sit amet " * 40 + "\n").encode() * 100
+    else:
+        bloque = os.urandom(MB)
+    with open(ruta, "wb") as f:
+        # El numero al principio hace unico cada archivo (el almacen deduplica)
+        f.write(f"{n}\n".encode())
+        escrito = 0
+        while escrito < tamano:
+            f.write(bloque[:tamano - escrito])
+            escrito += len(bloque)
+    return ruta
+
+
+def poblar(clase_id, total_mb, tamano_mb):
+    """Crea una clase con total_mb repartidos en archivos de tamano_mb."""
+    import file_storage
+    from db import transaccion
+    archivos = max(1, total_mb // tamano_mb)
+    with transaccion() as cursor:
+        cursor.execute("INSERT OR IGNORE INTO usuarios (id, nombre, email, password_hash, rol) VALUES ('bench', 'Bench', 'bench@x', x'00', 'profesor')")
+        cursor.execute("INSERT INTO clases (id, nombre, descripcion, profesor_id) VALUES (?, ?, '', 'bench')",
+                       (clase_id, f"Clase {clase_id}"))
+        for t in range((archivos + ARCHIVOS_POR_TRABAJO - 1) // ARCHIVOS_POR_TRABAJO):
+            cursor.execute("INSERT INTO trabajos (id, titulo, descripcion, clase_id) VALUES (?, ?, '', ?)",
+                           (f"{clase_id}_t{t}", f"Trabajo {t}", clase_id))
+    for n in range(archivos):
+        texto = n % 2 == 1
+        ruta = _escribir_staging(f"{clase_id}_{n}", tamano_mb * MB, texto)
+        sha256, tamano = file_storage.hash_file(ruta)
+        file_storage.store_for_task(f"{clase_id}_t{n // ARCHIVOS_POR_TRABAJO}", ruta, sha256, tamano,
+                                    f"entrega {n}.txt" if texto else f"entrega {n}.mp4")
+    return archivos
+
+
+def medir(client, clase_id):
+    rss_inicial = _rss_kb()
+    rss_max = rss_inicial
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    respuesta = client.get(f"/api/clases/{clase_id}/archivos/zip")
+    total = 0
+    tramos = 0
+    for tramo in respuesta.response:
+        total += len(tramo)
+        tramos += 1
+        rss = _rss_kb()
+        if rss is not None:
+            rss_max = max(rss_max, rss)
+    respuesta.close()
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "estado": respuesta.status_code,
+        "zip_mb": total / MB,
+        "tramos": tramos,
+        "pico_mb": pico / MB,
+        "rss_mb": (rss_max - rss_inicial) / 1024 if rss_inicial is not None else None,
+        "segundos": segundos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=int, nargs="+", default=[16, 128, 512], help="tamano de cada exportacion")
+    parser.add_argument("--archivo-mb", type=int, default=8, help="tamano de cada archivo")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = cargar_app(os.path.join(tmp, "zip.db"), os.path.join(tmp, "uploads"))
+        client = app.test_client()
+        print(f"{'datos MB':>9} {'archivos':>9} {'zip MB':>8} {'tramos':>7} "
+              f"{'pico tracemalloc MB':>20} {'RSS +MB':>8} {'MB/s':>7}")
+        for total_mb in args.mb:
+            clase_id = f"c{total_mb}"
+            archivos = poblar(clase_id, total_mb, args.archivo_mb)
+            r = medir(client, clase_id)
+            rss = f"{r['rss_mb']:>8.1f}" if r["rss_mb"] is not None else f"{'-':>8}"
+            print(f"{total_mb:>9} {archivos:>9} {r['zip_mb']:>8.1f} {r['tramos']:>7} "
+                  f"{r['pico_mb']:>20.2f} {rss} {r['zip_mb'] / r['segundos']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Mide cuantos eventos genera el trickle ICE de una clase que arranca una
+llamada grupal (malla completa: cada alumno abre una conexion con cada uno
+de los demas) con y sin el agrupado de candidatos.
+
+    python -m benchmarks.ice --alumnos 30 --candidatos 10 --ventana-ms 30
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+
+def cargar_app(db_path):
+    os.environ["SMTP_HOST"] = ""
+    # Los avisos de arranque (migraciones) no se mezclan con la tabla de resultados
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import db
+    from migraciones import migrar
+    db.cerrar_pool()
+    db.DB_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as aplicacion
+        migrar()
+    return aplicacion
+
+
+def crear_alumnos(alumnos):
+    # El relay solo entrega a usuarios que existen
+    from db import transaccion
+    usuarios = [f"alumno{i}" for i in range(alumnos)]
+    with transaccion() as cursor:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO usuarios (id, nombre, email, password_hash, rol) VALUES (?, ?, ?, x'00', 'estudiante')
+        """, [(u, u, f"{u}@ice.local") for u in usuarios])
+    return usuarios
+
+
+def correr(aplicacion, alumnos, candidatos, ventana_ms, lotes):
+    coalescedor = aplicacion.coalescedor_ice
+    coalescedor.ventana = ventana_ms / 1000
+    coalescedor.candidatos = coalescedor.lotes = 0
+    usuarios = crear_alumnos(alumnos)
+    with contextlib.redirect_stdout(io.StringIO()):
+        clientes = [aplicacion.socketio.test_client(aplicacion.app) for _ in usuarios]
+        for usuario_id, cliente in zip(usuarios, clientes):
+            cliente.emit('register_user', {'usuario_id': usuario_id, 'ice_lotes': lotes})
+    for cliente in clientes:
+        cliente.get_received()
+
+    inicio = time.perf_counter()
+    for origen, cliente in zip(usuarios, clientes):
+        for destino in usuarios:
+            if destino == origen:
+                continue
+            for n in range(candidatos):
+                cliente.emit('webrtc_ice_candidate', {
+                    'from': origen, 'to': destino,
+                    'candidate': f"candidate:{n} 1 udp 2122260223 10.0.0.{n} 5000{n} typ host"})
+    duracion = time.perf_counter() - inicio
+    time.sleep(coalescedor.ventana + 0.2)
+
+    eventos = 0
+    recibidos = 0
+    for cliente in clientes:
+        for paquete in cliente.get_received():
+            eventos += 1
+            if paquete['name'] == 'webrtc_ice_candidates':
+                recibidos += len(paquete['args'][0]['candidatos'])
+            else:
+                recibidos += 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        for cliente in clientes:
+            cliente.disconnect()
+    return {"eventos": eventos, "candidatos": recibidos, "segundos": duracion}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alumnos", type=int, default=30)
+    parser.add_argument("--candidatos", type=int, default=10, help="candidatos por conexion")
+    parser.add_argument("--ventana-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        aplicacion = cargar_app(os.path.join(tmp, "ice.db"))
+        print(f"{'modo':<22} {'candidatos':>10} {'eventos':>8} {'ev/candidato':>13} {'envio s':>8}")
+        for modo, ventana, lotes in (("sin agrupar", 0, False),
+                                     ("clientes viejos", args.ventana_ms, False),
+                                     ("agrupado", args.ventana_ms, True)):
+            r = correr(aplicacion, args.alumnos, args.candidatos, ventana, lotes)
+            print(f"{modo:<22} {r['candidatos']:>10} {r['eventos']:>8} "
+                  f"{r['eventos'] / r['candidatos']:>13.3f} {r['segundos']:>8.2f}")
+
+    from call_signaling import estadisticas_relay
+    relay = estadisticas_relay()["webrtc_ice_candidate"]
+    print(f"relay webrtc_ice_candidate: p50 {relay['latencia_ms_p50']} ms, "
+          f"p95 {relay['latencia_ms_p95']} ms, limitados {relay['limitados']}")
+
+
+if __name__ == "__main__":
+    main()
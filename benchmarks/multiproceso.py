@@ -0,0 +1,163 @@
+"""
+Prueba de entrega entre workers de Socket.IO.
+
+Levanta la cola local (cola_mensajes), N procesos de la app escuchando en
+puertos distintos y conecta clientes reales repartidos entre ellos. Verifica
+que call_request, webrtc_offer y chat_message lleguen aunque emisor y
+destinatario esten en workers diferentes (y a todos los dispositivos del
+destinatario) y mide la latencia de entrega.
+
+Necesita el cliente de python-socketio: pip install "python-socketio[client]"
+
+    python -m benchmarks.multiproceso --workers 3 --mensajes 50
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WORKER = (
+    "import sys, app; "
+    "app.socketio.run(app.app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)"
+)
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def esperar_puerto(puerto, timeout=30):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", puerto), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"el worker en el puerto {puerto} no arranco")
+
+
+def preparar_db(directorio):
+    """Migra la DB antes de levantar los workers y crea dos usuarios en una clase."""
+    sys.path.insert(0, RAIZ)
+    import db
+    from migraciones import migrar
+    from ids import allocate
+    db.DB_PATH = os.path.join(directorio, "db", "app.db")
+    migrar()
+    a, b, clase_id, p1, p2 = allocate(5)
+    with db.transaccion() as cursor:
+        cursor.executemany("""
+            INSERT INTO usuarios (id, nombre, email, password_hash, rol) VALUES (?, ?, ?, x'00', 'estudiante')
+        """, [(a, "A", "a@multi.local"), (b, "B", "b@multi.local")])
+        cursor.execute("INSERT INTO clases (id, nombre, profesor_id) VALUES (?, 'Multi', ?)", (clase_id, a))
+        cursor.executemany("INSERT INTO participaciones (id, usuario_id, clase_id) VALUES (?, ?, ?)",
+                           [(p1, a, clase_id), (p2, b, clase_id)])
+    db.cerrar_pool()
+    return a, b, clase_id
+
+
+class Receptor:
+    """Cliente que anota cuando le llega cada evento."""
+
+    def __init__(self, url, usuario_id):
+        import socketio
+        self.recibidos = {}
+        self.evento = threading.Event()
+        self.cliente = socketio.Client()
+        for nombre in ("call_request", "webrtc_offer", "chat_message"):
+            self.cliente.on(nombre, self._anotar(nombre))
+        self.cliente.connect(url, transports=["polling"])
+        self.cliente.call("register_user", {"usuario_id": usuario_id})
+
+    def _anotar(self, nombre):
+        def manejar(data):
+            self.recibidos.setdefault(nombre, {})[data.get("n")] = time.perf_counter()
+            self.evento.set()
+        return manejar
+
+
+def correr(workers, mensajes):
+    from cola_mensajes import iniciar_broker
+    broker = iniciar_broker(puerto=0)
+    cola = f"tcp://127.0.0.1:{broker.server_address[1]}"
+    procesos = []
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b, clase_id = preparar_db(tmp)
+        entorno = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=cola, SMTP_HOST="", HASH_WORKERS="0",
+                       PYTHONPATH=RAIZ)
+        puertos = [puerto_libre() for _ in range(workers)]
+        try:
+            for puerto in puertos:
+                procesos.append(subprocess.Popen(
+                    [sys.executable, "-c", _WORKER, str(puerto)], cwd=tmp, env=entorno,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            for puerto in puertos:
+                esperar_puerto(puerto)
+
+            urls = [f"http://127.0.0.1:{p}" for p in puertos]
+            emisor = Receptor(urls[0], a)
+            # B con un dispositivo en cada uno de los otros workers
+            destinos = [Receptor(url, b) for url in urls[1:]] or [Receptor(urls[0], b)]
+            for cliente in [emisor] + destinos:
+                cliente.cliente.call("join_clase", {"clase_id": clase_id})
+
+            latencias = {}
+            fallas = 0
+            for evento in ("call_request", "webrtc_offer", "chat_message"):
+                for n in range(mensajes):
+                    if evento == "chat_message":
+                        data = {"clase_id": clase_id, "texto": f"hola {n}", "n": n}
+                    else:
+                        data = {"to": b, "from": a, "n": n}
+                    enviado = time.perf_counter()
+                    emisor.cliente.emit(evento, data)
+                    limite = time.monotonic() + 5
+                    while time.monotonic() < limite and not all(
+                            n in d.recibidos.get(evento, {}) for d in destinos):
+                        time.sleep(0.001)
+                    for destino in destinos:
+                        llegada = destino.recibidos.get(evento, {}).get(n)
+                        if llegada is None:
+                            fallas += 1
+                        else:
+                            latencias.setdefault(evento, []).append((llegada - enviado) * 1000)
+            for cliente in [emisor] + destinos:
+                cliente.cliente.disconnect()
+            return latencias, fallas, len(destinos) * mensajes * 3
+        finally:
+            for proceso in procesos:
+                proceso.terminate()
+            for proceso in procesos:
+                proceso.wait(timeout=10)
+            broker.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--mensajes", type=int, default=50)
+    args = parser.parse_args()
+
+    latencias, fallas, esperados = correr(args.workers, args.mensajes)
+    print(f"{'evento':<14} {'entregas':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for evento, valores in latencias.items():
+        valores.sort()
+        p95 = valores[min(len(valores) - 1, int(len(valores) * 0.95))]
+        print(f"{evento:<14} {len(valores):>8} {statistics.median(valores):>8.2f} {p95:>8.2f}")
+    print(f"entregas fallidas: {fallas} de {esperados}")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
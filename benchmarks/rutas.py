@@ -0,0 +1,423 @@
+"""
+Benchmark de latencia por ruta.
+
+Recorre todas las rutas de app.py con el test client de Flask sobre una
+copia del dataset de benchmarks.datos y reporta p50/p95/p99, consultas SQL
+por request y throughput. Los resultados se guardan como JSON para poder
+compararlos entre commits.
+
+    python -m benchmarks.rutas --escala 0.1 --iteraciones 200
+    python -m benchmarks.rutas --comparar resultados/a.json resultados/b.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import jwt
+
+from benchmarks import datos
+
+DIR_RESULTADOS = os.path.join(os.path.dirname(__file__), "resultados")
+# Las rutas que hashean contraseñas son lentas a proposito; se miden menos veces
+ITERACIONES_BCRYPT = 10
+
+
+class Contador:
+    """Cuenta las sentencias SQL ejecutadas desde el ultimo reinicio."""
+
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, sentencia):
+        self.consultas += 1
+
+    def reiniciar(self):
+        self.consultas = 0
+
+
+def cargar_app(db_path, uploads_dir, contador):
+    # Nunca mandar mails reales desde un benchmark (load_dotenv no pisa variables ya definidas)
+    os.environ["SMTP_HOST"] = ""
+    # Los avisos de arranque (migraciones) no se mezclan con la tabla de resultados
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import db
+    db.cerrar_pool()
+    db.DB_PATH = db_path
+    db.registrar_trazador(contador)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as aplicacion
+    import file_storage
+    file_storage.STORAGE_DIR = uploads_dir
+    return aplicacion.app
+
+
+def cargar_contexto(db_path, rng):
+    """IDs reales del dataset para armar las URLs y los bodies."""
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+
+    def columna(sql):
+        return [f[0] for f in conn.execute(sql).fetchall()]
+
+    ctx = {
+        "usuarios": conn.execute("SELECT id, email FROM usuarios WHERE rol = 'estudiante'").fetchall(),
+        "profesores": columna("SELECT id FROM usuarios WHERE rol = 'profesor'"),
+        "clases": columna("SELECT id FROM clases"),
+        "trabajos": columna("SELECT id FROM trabajos"),
+        "asignaciones": columna("SELECT id FROM notificaciones_usuarios ORDER BY random() LIMIT 5000"),
+        "notificaciones": columna("SELECT id FROM notificaciones LIMIT 1000"),
+        "subidos": [],
+        "archivos": [],
+        "subidas": [],
+        "subidas_llenas": [],
+        "subidas_cancelar": [],
+        "clases_creadas": [],
+        "rng": rng,
+    }
+    conn.close()
+    return ctx
+
+
+def _usuario(ctx):
+    return ctx["rng"].choice(ctx["usuarios"])
+
+
+def _registro(ctx, rol):
+    n = ctx["rng"].randrange(10**9)
+    return {"json": {"nombre": "Usuario Bench", "email": f"nuevo{n}@learned.test", "password": datos.PASSWORD}}
+
+
+def _confirmar(ctx):
+    # El codigo viaja dentro del token (solo firmado), asi que se puede leer sin el mail
+    from usuarios import iniciar_registro_con_verificacion
+    n = ctx["rng"].randrange(10**9)
+    with contextlib.redirect_stdout(io.StringIO()):
+        token = iniciar_registro_con_verificacion("Usuario Bench", f"confirma{n}@learned.test", datos.PASSWORD)
+    codigo = jwt.decode(token, options={"verify_signature": False})["codigo"]
+    return "/api/register/confirm", {"json": {"token": token, "codigo": codigo}}
+
+
+def _archivo():
+    return (io.BytesIO(b"%PDF-1.4 benchmark\n" * 64), "consigna.pdf")
+
+
+# (metodo, regla) -> funcion(ctx) que devuelve (url, kwargs del test client)
+ESCENARIOS = {
+    ("GET", "/api/notificaciones/<usuario_id>"):
+        lambda ctx: (f"/api/notificaciones/{_usuario(ctx)[0]}", {}),
+    ("GET", "/api/notificaciones/<usuario_id>/unread_count"):
+        lambda ctx: (f"/api/notificaciones/{_usuario(ctx)[0]}/unread_count", {}),
+    ("POST", "/api/notificaciones"):
+        lambda ctx: ("/api/notificaciones", {"json": {
+            "tipo": "mensaje", "clase_id": ctx["rng"].choice(ctx["clases"]),
+            "titulo": "Aviso", "descripcion": "Texto", "creado_por": ctx["rng"].choice(ctx["profesores"])}}),
+    ("POST", "/api/notificaciones/asignar"):
+        lambda ctx: ("/api/notificaciones/asignar", {"json": {
+            "notificacion_id": ctx["rng"].choice(ctx["notificaciones"]), "usuario_id": _usuario(ctx)[0]}}),
+    ("POST", "/api/notificaciones/vista/<asignacion_id>"):
+        lambda ctx: (f"/api/notificaciones/vista/{ctx['rng'].choice(ctx['asignaciones'])}", {}),
+    ("POST", "/api/notificaciones/crear"):
+        lambda ctx: ("/api/notificaciones/crear", {"json": {
+            "tipo": "tarea", "titulo": "Nueva tarea", "descripcion": "Texto",
+            "creado_por": ctx["rng"].choice(ctx["profesores"]),
+            "clase_id": ctx["rng"].choice(ctx["clases"]), "toda_la_clase": True}}),
+    ("POST", "/api/clases"):
+        lambda ctx: ("/api/clases", {"json": {
+            "nombre": "Clase bench", "descripcion": "Texto", "profesor_id": ctx["rng"].choice(ctx["profesores"])}}),
+    ("POST", "/api/clases/unirse"):
+        lambda ctx: ("/api/clases/unirse", {"json": {
+            "usuario_id": _usuario(ctx)[0], "clase_id": ctx["rng"].choice(ctx["clases"])}}),
+    ("POST", "/api/clases/<clase_id>/alumnos/importar"):
+        lambda ctx: (f"/api/clases/{ctx['rng'].choice(ctx['clases'])}/alumnos/importar", {
+            "data": "email\n" + "".join(f"{email}\n" for _, email in ctx["rng"].sample(ctx["usuarios"], 30)),
+            "content_type": "text/csv"}),
+    ("POST", "/api/clases/abandonar"):
+        lambda ctx: ("/api/clases/abandonar", {"json": {
+            "usuario_id": _usuario(ctx)[0], "clase_id": ctx["rng"].choice(ctx["clases"])}}),
+    ("POST", "/upload"):
+        lambda ctx: ("/upload", {"data": {"archivo": _archivo()}, "content_type": "multipart/form-data"}),
+    ("GET", "/download/<nombre>"):
+        lambda ctx: ("/download/consigna.pdf", {}),
+    ("POST", "/api/clases/eliminar"):
+        lambda ctx: ("/api/clases/eliminar", {"json": {"clase_id": ctx["clases_creadas"].pop()}})
+        if ctx["clases_creadas"] else None,
+    ("GET", "/api/clases/<usuario_id>"):
+        lambda ctx: (f"/api/clases/{_usuario(ctx)[0]}", {}),
+    ("GET", "/api/clase/<clase_id>"):
+        lambda ctx: (f"/api/clase/{ctx['rng'].choice(ctx['clases'])}", {}),
+    ("GET", "/metrics"):
+        lambda ctx: ("/metrics", {}),
+    ("GET", "/api/clases/<clase_id>/mensajes"):
+        lambda ctx: (f"/api/clases/{ctx['rng'].choice(ctx['clases'])}/mensajes?limit=50", {}),
+    ("GET", "/api/trabajos/<clase_id>/<alumno_id>"):
+        lambda ctx: (f"/api/trabajos/{ctx['rng'].choice(ctx['clases'])}/{_usuario(ctx)[0]}", {}),
+    ("POST", "/api/trabajos/<clase_id>"):
+        lambda ctx: (f"/api/trabajos/{ctx['rng'].choice(ctx['clases'])}", {"json": {
+            "titulo": "Trabajo bench", "descripcion": "Consigna"}}),
+    ("GET", "/api/clases/<clase_id>/usuarios"):
+        lambda ctx: (f"/api/clases/{ctx['rng'].choice(ctx['clases'])}/usuarios", {}),
+    ("POST", "/api/register/profesor"):
+        lambda ctx: ("/api/register/profesor", _registro(ctx, "profesor")),
+    ("POST", "/api/register/alumno"):
+        lambda ctx: ("/api/register/alumno", _registro(ctx, "estudiante")),
+    ("POST", "/api/register/confirm"): _confirmar,
+    ("POST", "/api/login"):
+        lambda ctx: ("/api/login", {"json": {"email": _usuario(ctx)[1], "password": datos.PASSWORD}}),
+    ("GET", "/api/usuarios/<usuario_id>"):
+        lambda ctx: (f"/api/usuarios/{_usuario(ctx)[0]}", {}),
+    ("GET", "/api/usuarios/email/<email>"):
+        lambda ctx: (f"/api/usuarios/email/{_usuario(ctx)[1]}", {}),
+    ("POST", "/api/notificaciones/respond/<asignacion_id>"):
+        lambda ctx: (f"/api/notificaciones/respond/{ctx['asignaciones'].pop()}", {"json": {
+            "action": ctx["rng"].choice(("aceptar", "rechazar"))}}),
+    ("DELETE", "/api/notificaciones/asignacion/<asignacion_id>"):
+        lambda ctx: (f"/api/notificaciones/asignacion/{ctx['asignaciones'].pop()}", {}),
+    ("GET", "/api/clases/<clase_id>/archivos"):
+        lambda ctx: (f"/api/clases/{ctx['rng'].choice(ctx['clases'])}/archivos", {}),
+    ("GET", "/api/trabajos/<trabajo_id>/archivos"):
+        lambda ctx: (f"/api/trabajos/{ctx['rng'].choice(ctx['trabajos'][:20])}/archivos", {}),
+    ("POST", "/api/trabajos/<trabajo_id>/archivos"):
+        lambda ctx: (f"/api/trabajos/{ctx['rng'].choice(ctx['trabajos'][:20])}/archivos", {
+            "data": {"files": [_archivo()], "usuario_id": _usuario(ctx)[0]}, "content_type": "multipart/form-data"}),
+    ("GET", "/api/uploads/trabajos/<trabajo_id>/<path:filename>"): None,
+    # buffered: que el tiempo incluya armar y mandar todo el zip, no solo el primer tramo
+    ("GET", "/api/trabajos/<trabajo_id>/archivos/zip"):
+        lambda ctx: (f"/api/trabajos/{ctx['rng'].choice(ctx['trabajos'][:20])}/archivos/zip", {"buffered": True}),
+    ("GET", "/api/clases/<clase_id>/archivos/zip"):
+        lambda ctx: (f"/api/clases/{ctx['rng'].choice(ctx['clases'])}/archivos/zip", {"buffered": True}),
+}
+
+RUTAS_BCRYPT = {"/api/register/profesor", "/api/register/alumno", "/api/register/confirm", "/api/login"}
+
+
+def _servir_subido(ctx):
+    if not ctx["subidos"]:
+        return None
+    url = ctx["rng"].choice(ctx["subidos"])
+    return url, {}
+
+
+ESCENARIOS[("GET", "/api/uploads/trabajos/<trabajo_id>/<path:filename>")] = _servir_subido
+ESCENARIOS[("GET", "/api/trabajos/archivos/download/<filename>")] = \
+    lambda ctx: (f"/api/trabajos/archivos/download/{ctx['rng'].choice(ctx['archivos'])[1]}", {}) if ctx["archivos"] else None
+
+# Subidas por tramos: cada sesion se crea, se llena con un tramo y despues
+# la mitad se finaliza y la otra mitad se cancela
+TRAMO_BENCH = b"%PDF-1.4 tramo\n" * 4096
+
+
+def _crear_subida(ctx):
+    trabajo_id = ctx["rng"].choice(ctx["trabajos"][:20])
+    return f"/api/trabajos/{trabajo_id}/subidas", {"json": {"nombre": "entrega.pdf", "tamano": len(TRAMO_BENCH)}}
+
+
+def _subir_tramo(ctx):
+    if not ctx["subidas"]:
+        return None
+    subida_id = ctx["subidas"].pop()
+    # Una para finalizar, la siguiente para cancelar
+    llenas, cancelar = ctx["subidas_llenas"], ctx["subidas_cancelar"]
+    (llenas if len(llenas) <= len(cancelar) else cancelar).append(subida_id)
+    return f"/api/subidas/{subida_id}?offset=0", {"data": TRAMO_BENCH}
+
+
+def _de_a_una(clave, plantilla):
+    def escenario(ctx):
+        if not ctx[clave]:
+            return None
+        return plantilla.format(ctx[clave].pop()), {}
+    return escenario
+
+
+ESCENARIOS[("POST", "/api/trabajos/<trabajo_id>/subidas")] = _crear_subida
+ESCENARIOS[("GET", "/api/subidas/<subida_id>")] = \
+    lambda ctx: (f"/api/subidas/{ctx['rng'].choice(ctx['subidas'])}", {}) if ctx["subidas"] else None
+ESCENARIOS[("PUT", "/api/subidas/<subida_id>")] = _subir_tramo
+ESCENARIOS[("POST", "/api/subidas/<subida_id>/finalizar")] = _de_a_una("subidas_llenas", "/api/subidas/{}/finalizar")
+ESCENARIOS[("DELETE", "/api/subidas/<subida_id>")] = _de_a_una("subidas_cancelar", "/api/subidas/{}")
+# Va al final: borra lo que subieron los escenarios anteriores
+ESCENARIOS[("DELETE", "/api/trabajos/archivos/<file_id>")] = \
+    lambda ctx: (f"/api/trabajos/archivos/{ctx['archivos'].pop()[0]}", {}) if ctx["archivos"] else None
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def rutas_de(app):
+    rutas = set()
+    for regla in app.url_map.iter_rules():
+        if regla.endpoint == "static":
+            continue
+        for metodo in regla.methods - {"HEAD", "OPTIONS"}:
+            rutas.add((metodo, regla.rule))
+    return rutas
+
+
+def medir_ruta(client, contador, ctx, metodo, escenario, iteraciones):
+    latencias = []
+    consultas = []
+    errores = 0
+    for _ in range(iteraciones):
+        armado = escenario(ctx)
+        if armado is None:
+            continue
+        url, kwargs = armado
+        contador.reiniciar()
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            respuesta = client.open(url, method=metodo, **kwargs)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(contador.consultas)
+        if respuesta.status_code >= 500:
+            errores += 1
+        _despues(ctx, url, respuesta)
+    if not latencias:
+        return None
+    total_s = sum(latencias) / 1000
+    return {
+        "n": len(latencias),
+        "errores": errores,
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "media_ms": round(statistics.fmean(latencias), 3),
+        "consultas_por_request": round(statistics.fmean(consultas), 2),
+        "throughput_rps": round(len(latencias) / total_s, 1) if total_s else None,
+    }
+
+
+def _despues(ctx, url, respuesta):
+    # Guardar lo creado por los escenarios de alta para los de descarga/borrado
+    if respuesta.is_json and isinstance(respuesta.json, dict):
+        if url == "/api/clases" and "clase_id" in respuesta.json:
+            ctx["clases_creadas"].append(respuesta.json["clase_id"])
+        if url.endswith("/subidas") and "id" in respuesta.json:
+            ctx["subidas"].append(respuesta.json["id"])
+        for archivo in respuesta.json.get("files") or []:
+            if "url" in archivo:
+                ctx["subidos"].append("/" + archivo["url"].split("/", 3)[3])
+            if "id" in archivo:
+                ctx["archivos"].append((archivo["id"], archivo["filename"]))
+
+
+def revision_git():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__), text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def correr(escala=0.05, iteraciones=100, semilla=42, dataset=None):
+    tmp = tempfile.mkdtemp(prefix="learned-bench-")
+    try:
+        if dataset is None:
+            dataset = os.path.join(tmp, "dataset.db")
+            datos.generar(dataset, escala, semilla)
+        copia = os.path.join(tmp, "bench.db")
+        shutil.copy(dataset, copia)
+        uploads = os.path.join(tmp, "uploads")
+        os.makedirs(uploads)
+
+        contador = Contador()
+        app = cargar_app(copia, uploads, contador)
+        client = app.test_client()
+        ctx = cargar_contexto(copia, random.Random(semilla))
+
+        resultados = {}
+        rutas = rutas_de(app)
+        faltantes = sorted(rutas - set(ESCENARIOS))
+        for (metodo, regla), escenario in ESCENARIOS.items():
+            if (metodo, regla) not in rutas:
+                continue
+            n = min(iteraciones, ITERACIONES_BCRYPT) if regla in RUTAS_BCRYPT else iteraciones
+            r = medir_ruta(client, contador, ctx, metodo, escenario, n)
+            if r:
+                resultados[f"{metodo} {regla}"] = r
+        return {
+            "revision": revision_git(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "escala": escala,
+            "semilla": semilla,
+            "iteraciones": iteraciones,
+            "rutas": resultados,
+            "rutas_sin_escenario": [f"{m} {r}" for m, r in faltantes],
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def imprimir(resultado):
+    print(f"Revision {resultado['revision']} - escala {resultado['escala']}")
+    print(f"{'ruta':<62} {'p50':>8} {'p95':>8} {'p99':>8} {'sql/req':>8} {'req/s':>9}")
+    for ruta, r in sorted(resultado["rutas"].items()):
+        print(f"{ruta:<62} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['consultas_por_request']:>8.1f} {r['throughput_rps']:>9.1f}")
+    if resultado["rutas_sin_escenario"]:
+        print("Rutas sin escenario:", ", ".join(resultado["rutas_sin_escenario"]))
+
+
+def comparar(ruta_a, ruta_b):
+    with open(ruta_a, encoding="utf-8") as f:
+        a = json.load(f)
+    with open(ruta_b, encoding="utf-8") as f:
+        b = json.load(f)
+    print(f"{a['revision']} -> {b['revision']}")
+    print(f"{'ruta':<62} {'p50':>16} {'p99':>16} {'sql/req':>12}")
+    for ruta in sorted(set(a["rutas"]) | set(b["rutas"])):
+        ra, rb = a["rutas"].get(ruta), b["rutas"].get(ruta)
+        if not ra or not rb:
+            print(f"{ruta:<62} {'(solo en ' + ('b' if rb else 'a') + ')':>16}")
+            continue
+
+        def delta(campo):
+            if not ra[campo]:
+                return f"{rb[campo]:.2f}"
+            return f"{rb[campo]:.2f} ({(rb[campo] - ra[campo]) / ra[campo] * 100:+.0f}%)"
+
+        print(f"{ruta:<62} {delta('p50_ms'):>16} {delta('p99_ms'):>16} "
+              f"{ra['consultas_por_request']:.1f}->{rb['consultas_por_request']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia por ruta")
+    parser.add_argument("--escala", type=float, default=0.05)
+    parser.add_argument("--iteraciones", type=int, default=100)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--dataset", help="usar un dataset ya generado con benchmarks.datos")
+    parser.add_argument("--salida", help="archivo JSON de resultados (default: resultados/<revision>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("A", "B"), help="comparar dos resultados guardados")
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    resultado = correr(args.escala, args.iteraciones, args.semilla, args.dataset)
+    imprimir(resultado)
+    salida = args.salida or os.path.join(DIR_RESULTADOS, f"{resultado['revision']}.json")
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print("Resultados guardados en", salida)
+
+
+if __name__ == "__main__":
+    main()
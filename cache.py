@@ -0,0 +1,164 @@
+"""
+Cache de lectura para datos que casi no cambian (usuarios y clases).
+
+obtener(clave, cargar) devuelve el valor cacheado o llama a cargar() y lo
+guarda. Los caminos de escritura llaman a invalidar() con las claves que
+tocan. El almacenamiento es intercambiable: por defecto un LRU con TTL en
+memoria del proceso; con varios workers se puede usar BackendRedis para que
+todos compartan (e invaliden) la misma cache.
+
+Los resultados None (no encontrado) no se cachean, asi un alta nueva se ve
+enseguida sin tener que invalidar busquedas fallidas.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class BackendMemoria:
+    """LRU acotado con vencimiento por TTL, local al proceso."""
+
+    def __init__(self, max_items=10000):
+        self.max_items = max_items
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return False, None
+            valor, vence = item
+            if vence < time.monotonic():
+                del self._datos[clave]
+                return False, None
+            self._datos.move_to_end(clave)
+            return True, valor
+
+    def set(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class BackendRedis:
+    """Cache compartida entre procesos. Requiere el paquete redis."""
+
+    def __init__(self, url, prefijo="learned:cache:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+
+    def get(self, clave):
+        valor = self._redis.get(self.prefijo + clave)
+        if valor is None:
+            return False, None
+        return True, json.loads(valor)
+
+    def set(self, clave, valor, ttl):
+        self._redis.set(self.prefijo + clave, json.dumps(valor), ex=max(1, int(ttl)))
+
+    def delete(self, clave):
+        self._redis.delete(self.prefijo + clave)
+
+    def clear(self):
+        for clave in self._redis.scan_iter(self.prefijo + "*"):
+            self._redis.delete(clave)
+
+
+class Cache:
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # += no es atomico entre hilos; el backend puede no tener lock (Redis)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, cargar):
+        encontrado, valor = self.backend.get(clave)
+        with self._lock:
+            if encontrado:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if encontrado:
+            return valor
+        valor = cargar()
+        if valor is not None:
+            self.backend.set(clave, valor, self.ttl)
+        return valor
+
+    def invalidar(self, *claves):
+        for clave in claves:
+            self.backend.delete(clave)
+
+    def estadisticas(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+        }
+
+
+_cache = Cache(BackendMemoria(int(os.getenv("CACHE_MAX_ITEMS", "10000"))),
+               ttl=float(os.getenv("CACHE_TTL", "300")))
+
+
+def configurar(backend=None, ttl=None):
+    """Cambia el backend y/o el TTL de la cache global."""
+    if backend is not None:
+        _cache.backend = backend
+    if ttl is not None:
+        _cache.ttl = ttl
+
+
+def configurar_desde_entorno():
+    """Usa Redis si CACHE_REDIS_URL esta definido; si no, queda la cache en memoria."""
+    url = os.getenv("CACHE_REDIS_URL")
+    if url:
+        configurar(BackendRedis(url))
+
+
+def obtener(clave, cargar):
+    return _cache.obtener(clave, cargar)
+
+
+def invalidar(*claves):
+    _cache.invalidar(*claves)
+
+
+def limpiar():
+    _cache.backend.clear()
+
+
+def estadisticas():
+    return _cache.estadisticas()
+
+
+def clave_usuario(usuario_id):
+    return f"usuario:{usuario_id}"
+
+
+def clave_usuario_email(email):
+    return f"usuario_email:{email}"
+
+
+def clave_clase(clase_id):
+    return f"clase:{clase_id}"
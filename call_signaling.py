@@ -1,135 +1,328 @@
 from flask import current_app, request
-import traceback
+from flask_socketio import join_room, leave_room
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from registro_sockets import RegistroMemoria
+from candidatos_ice import CoalescedorIce
+from salas_llamada import SalasLlamadaMemoria
+from clases import es_participante
+from usuarios import obtener_usuario_por_id
+from metricas import Contador, Histograma, medir_evento, milisegundos, socketio_conectados
 
+log = logging.getLogger(__name__)
 
-def register_signaling(socketio):
+# Como se reenvia cada evento de señalizacion. Solo estos eventos se
+# reenvian; por conexion se permiten por_segundo eventos sostenidos con
+# rafagas de hasta rafaga, y payloads de hasta max_bytes.
+Ruta = namedtuple("Ruta", "por_segundo rafaga max_bytes entrega")
+
+RUTAS_RELAY = {
+    'call_request': Ruta(por_segundo=2, rafaga=10, max_bytes=4 * 1024, entrega='emit'),
+    'call_response': Ruta(por_segundo=2, rafaga=10, max_bytes=4 * 1024, entrega='emit'),
+    'webrtc_offer': Ruta(por_segundo=10, rafaga=40, max_bytes=256 * 1024, entrega='emit'),
+    'webrtc_answer': Ruta(por_segundo=10, rafaga=40, max_bytes=256 * 1024, entrega='emit'),
+    'webrtc_ice_candidate': Ruta(por_segundo=100, rafaga=500, max_bytes=4 * 1024, entrega='ice'),
+}
+
+
+def sala_usuario(usuario_id):
+    """Room every socket of the user joins on register_user."""
+    return f"usuario:{usuario_id}"
+
+
+def sala_llamada(clase_id):
+    """Room with the sockets currently in the class's group call."""
+    return f"llamada:{clase_id}"
+
+
+def sala_ice(usuario_id, lotes):
+    """Sockets of the user that accept batched ICE candidates (or not)."""
+    return f"{sala_usuario(usuario_id)}:ice_{'lotes' if lotes else 'simple'}"
+
+
+def _destino(data):
+    """Devuelve (to, error).
+
+    Ademas del dict de siempre se aceptan payloads binarios: un dict con el
+    SDP en bytes (se reenvia sin tocar, Socket.IO lo manda como adjunto
+    binario) o el mensaje entero codificado con MessagePack, que necesita el
+    paquete msgpack para leer el destino.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            import msgpack
+        except ImportError:
+            return None, "Codificacion binaria no disponible en el servidor"
+        try:
+            data = msgpack.unpackb(data)
+        except Exception:
+            return None, "Payload binario invalido"
+    if not isinstance(data, dict):
+        return None, "Payload invalido"
+    to = data.get('to')
+    if not to or not isinstance(to, str):
+        return None, "Falta el campo to"
+    return to, None
+
+
+def _tamano(data):
+    """Largo del payload serializado; los adjuntos binarios cuentan por su largo."""
+    if isinstance(data, (bytes, bytearray, str)):
+        return len(data)
+    binarios = []
+
+    def adjunto(valor):
+        if isinstance(valor, (bytes, bytearray)):
+            binarios.append(len(valor))
+            return None
+        raise TypeError(f"{type(valor).__name__} no se puede serializar")
+
+    return len(json.dumps(data, default=adjunto)) + sum(binarios)
+
+
+class LimitadorEventos:
+    """Token bucket por conexion y evento."""
+
+    def __init__(self):
+        self._cubetas = {}  # sid -> {evento: [fichas, ultimo]}
+        self._lock = threading.Lock()
+
+    def permitir(self, sid, evento, ruta):
+        ahora = time.monotonic()
+        with self._lock:
+            cubeta = self._cubetas.setdefault(sid, {}).get(evento)
+            if cubeta is None:
+                cubeta = self._cubetas[sid][evento] = [ruta.rafaga, ahora]
+            cubeta[0] = min(ruta.rafaga, cubeta[0] + (ahora - cubeta[1]) * ruta.por_segundo)
+            cubeta[1] = ahora
+            if cubeta[0] < 1:
+                return False
+            cubeta[0] -= 1
+            return True
+
+    def olvidar(self, sid):
+        with self._lock:
+            self._cubetas.pop(sid, None)
+
+
+relay_resultados = Contador(
+    "learned_signaling_relay_total", "Eventos de señalizacion por resultado del relay.",
+    ("evento", "resultado"))
+relay_duracion = Histograma(
+    "learned_signaling_relay_segundos", "Tiempo en reenviar cada evento de señalizacion.",
+    ("evento",))
+
+
+def estadisticas_relay():
+    """Por evento: reenviados, rechazados y latencia del relay (de los histogramas)."""
+    return {
+        evento: {
+            "reenviados": relay_resultados.valor(evento=evento, resultado="reenviado"),
+            "limitados": relay_resultados.valor(evento=evento, resultado="limitado"),
+            "invalidos": relay_resultados.valor(evento=evento, resultado="invalido"),
+            "latencia_ms_p50": milisegundos(relay_duracion.cuantil(0.5, evento=evento)),
+            "latencia_ms_p95": milisegundos(relay_duracion.cuantil(0.95, evento=evento)),
+        }
+        for evento in RUTAS_RELAY
+    }
+
+
+def register_signaling(socketio, registro=None, coalescedor=None, presencia=None, llamadas=None):
     """Register simple call signaling events on the provided SocketIO server.
 
     This module keeps signaling modular and only relays messages between
     connected clients. It expects clients to provide a 'to' field with the
-    target socket id or user id depending on your application mapping.
+    target user id, or the socket id of a peer in the sender's group call;
+    anything else is rejected.
+    The relayed events, their rate limits and size caps come from
+    RUTAS_RELAY; every relay goes through the same path.
+
+    Returns the socket registry (usuario_id <-> sids) so other modules can
+    resolve users to sockets. Pass ``registro`` to use a shared backend.
+
+    Events are delivered through Socket.IO rooms (``usuario:<id>`` and the
+    sid itself), so with a message queue configured they reach sockets held
+    by any worker process.
+
+    Clients that send ``ice_lotes: true`` in register_user get trickle ICE
+    candidates batched per (from, to) pair in ``webrtc_ice_candidates``
+    events; see candidatos_ice.py.
+
+    ``presencia`` (presencia.Presencia) is told when a user connects the
+    first device and disconnects the last one.
+
+    Group calls: ``call_join`` puts the socket in the call of a class and
+    answers with one ``call_participants`` event listing the sockets already
+    there, so the client can send its offers straight away (``to`` = each
+    sid). The others get ``call_peer_joined`` / ``call_peer_left``.
+    ``llamadas`` holds that state (salas_llamada.py).
     """
 
-    # Mapa en memoria: usuario_id -> socket sid
-    user_sockets = {}
+    # Registro en memoria: usuario_id -> {sids} y sid -> usuario_id
+    if registro is None:
+        registro = RegistroMemoria()
+    if coalescedor is None:
+        coalescedor = CoalescedorIce(socketio)
+    if llamadas is None:
+        llamadas = SalasLlamadaMemoria()
+    limitador = LimitadorEventos()
+
+    def resolver_destino(to):
+        """
+        Devuelve (sala, es_sid) para reenviar a 'to', o None si no se permite.
+
+        'to' puede ser la sid de alguien en la misma llamada que quien manda
+        o el id de un usuario existente (todos sus dispositivos). Nunca se
+        usa tal cual como sala: asi un cliente no puede mandar a salas de
+        clases, llamadas u otras salas internas.
+        """
+        clase_id = llamadas.clase_de(request.sid)
+        if clase_id is not None and llamadas.clase_de(to) == clase_id:
+            return to, True
+        if obtener_usuario_por_id(to) is not None:
+            return sala_usuario(to), False
+        return None
+
+    def emit_to_user(event, data, to, destino):
+        # Cada sid es tambien una sala: llega este en el worker que este
+        socketio.emit(event, data, to=destino[0])
 
     @socketio.on('connect')
     def _on_connect():
-        print('Signaling: cliente conectado', request.sid if 'request' in globals() else '')
+        socketio_conectados.inc()
+        log.debug('Cliente conectado', extra={'sid': request.sid})
+
+    def salir(sid):
+        # O(1): el registro sabe de que usuario era esta sid
+        usuario_id, era_ultimo = registro.desregistrar(sid)
+        if usuario_id is None:
+            return
+        log.debug('Usuario desconectado', extra={'usuario_id': usuario_id, 'sid': sid})
+        if era_ultimo and presencia is not None:
+            presencia.usuario_desconectado(usuario_id)
 
     @socketio.on('register_user')
+    @medir_evento('register_user')
     def on_register_user(data):
         try:
             usuario_id = data.get('usuario_id')
             if not usuario_id:
                 return
-            user_sockets[str(usuario_id)] = request.sid
-            print(f'Registrado usuario {usuario_id} -> sid {request.sid}')
-        except Exception as e:
-            print('Error en on_register_user:', e)
-            traceback.print_exc()
+            usuario_id = str(usuario_id)
+            anterior = registro.usuario_de(request.sid)
+            if anterior is not None and anterior != usuario_id:
+                # la misma conexion cambio de usuario
+                salir(request.sid)
+                leave_room(sala_usuario(anterior))
+                leave_room(sala_ice(anterior, True))
+                leave_room(sala_ice(anterior, False))
+            primero = registro.registrar(usuario_id, request.sid)
+            join_room(sala_usuario(usuario_id))
+            join_room(sala_ice(usuario_id, bool(data.get('ice_lotes'))))
+            log.debug('Usuario registrado', extra={'usuario_id': usuario_id, 'sid': request.sid})
+            if primero and presencia is not None:
+                presencia.usuario_conectado(usuario_id)
+        except Exception:
+            log.exception('Error en on_register_user')
+
+    def salir_de_llamada(sid):
+        clase_id, usuario_id = llamadas.salir(sid)
+        if clase_id is None:
+            return
+        leave_room(sala_llamada(clase_id), sid=sid)
+        socketio.emit('call_peer_left', {"clase_id": clase_id, "sid": sid, "usuario_id": usuario_id},
+                      to=sala_llamada(clase_id))
+
+    @socketio.on('call_join')
+    @medir_evento('call_join')
+    def on_call_join(data):
+        try:
+            clase_id = data.get('clase_id')
+            if not clase_id:
+                return {"error": "Falta clase_id"}
+            usuario_id = registro.usuario_de(request.sid)
+            if usuario_id is None:
+                return {"error": "Usuario no registrado"}
+            if llamadas.clase_de(request.sid) == clase_id:
+                return {"status": "ok"}
+            if not es_participante(usuario_id, clase_id):
+                return {"error": "El usuario no participa en la clase"}
+            # Una conexion esta en una sola llamada a la vez
+            salir_de_llamada(request.sid)
+            otros = llamadas.entrar(clase_id, request.sid, usuario_id)
+            join_room(sala_llamada(clase_id))
+            socketio.emit('call_participants', {
+                "clase_id": clase_id,
+                "participantes": [{"sid": sid, "usuario_id": u} for sid, u in otros],
+            }, to=request.sid)
+            socketio.emit('call_peer_joined', {"clase_id": clase_id, "sid": request.sid, "usuario_id": usuario_id},
+                          to=sala_llamada(clase_id), skip_sid=request.sid)
+            return {"status": "ok"}
+        except Exception:
+            log.exception('Error en on_call_join')
+            return {"error": "Error interno del servidor"}
+
+    @socketio.on('call_leave')
+    @medir_evento('call_leave')
+    def on_call_leave(data=None):
+        salir_de_llamada(request.sid)
+        return {"status": "ok"}
 
     @socketio.on('disconnect')
     def _on_disconnect():
-        # limpiar cualquier mapeo que apunte a esta sid
-        sid = request.sid
-        keys_to_remove = [k for k, v in user_sockets.items() if v == sid]
-        for k in keys_to_remove:
-            del user_sockets[k]
-            print(f'Usuario {k} desconectado; limpiado mapping')
-
-    @socketio.on('call_request')
-    def on_call_request(data):
-        try:
-            # data: { to: <socketId or userId>, from: <socketId or userId>, ... }
-            to = data.get('to')
-            if not to:
-                return
-            # if target is a known usuario_id, map to sid
-            target_sid = None
-            if str(to) in user_sockets:
-                target_sid = user_sockets[str(to)]
-
-            if target_sid:
-                socketio.emit('call_request', data, to=target_sid)
-            else:
-                # fallback: try emitting to 'to' as sid directly
-                try:
-                    socketio.emit('call_request', data, to=to)
-                except TypeError:
-                    socketio.emit('call_request', data)
-        except Exception as e:
-            print('Error en on_call_request:', e)
-            traceback.print_exc()
-
-    @socketio.on('call_response')
-    def on_call_response(data):
-        try:
-            to = data.get('to')
-            if not to:
-                return
-            target_sid = user_sockets.get(str(to))
-            if target_sid:
-                socketio.emit('call_response', data, to=target_sid)
-            else:
-                try:
-                    socketio.emit('call_response', data, to=to)
-                except TypeError:
-                    socketio.emit('call_response', data)
-        except Exception as e:
-            print('Error en on_call_response:', e)
-            traceback.print_exc()
-
-    @socketio.on('webrtc_offer')
-    def on_webrtc_offer(data):
-        try:
-            to = data.get('to')
-            if not to:
-                return
-            target_sid = user_sockets.get(str(to))
-            if target_sid:
-                socketio.emit('webrtc_offer', data, to=target_sid)
-            else:
-                try:
-                    socketio.emit('webrtc_offer', data, to=to)
-                except TypeError:
-                    socketio.emit('webrtc_offer', data)
-        except Exception as e:
-            print('Error en on_webrtc_offer:', e)
-            traceback.print_exc()
-
-    @socketio.on('webrtc_answer')
-    def on_webrtc_answer(data):
-        try:
-            to = data.get('to')
-            if not to:
-                return
-            target_sid = user_sockets.get(str(to))
-            if target_sid:
-                socketio.emit('webrtc_answer', data, to=target_sid)
-            else:
-                try:
-                    socketio.emit('webrtc_answer', data, to=to)
-                except TypeError:
-                    socketio.emit('webrtc_answer', data)
-        except Exception as e:
-            print('Error en on_webrtc_answer:', e)
-            traceback.print_exc()
-
-    @socketio.on('webrtc_ice_candidate')
-    def on_webrtc_ice(data):
-        try:
-            to = data.get('to')
-            if not to:
-                return
-            target_sid = user_sockets.get(str(to))
-            if target_sid:
-                socketio.emit('webrtc_ice_candidate', data, to=target_sid)
-            else:
-                try:
-                    socketio.emit('webrtc_ice_candidate', data, to=to)
-                except TypeError:
-                    socketio.emit('webrtc_ice_candidate', data)
-        except Exception as e:
-            print('Error en on_webrtc_ice:', e)
-            traceback.print_exc()
+        socketio_conectados.inc(-1)
+        salir_de_llamada(request.sid)
+        salir(request.sid)
+        limitador.olvidar(request.sid)
+
+    def entregar_ice(evento, data, to, destino):
+        sala, es_sid = destino
+        # Los lotes son por usuario; a una sid el candidato va directo
+        if not coalescedor.activo or es_sid:
+            socketio.emit(evento, data, to=sala)
+            return
+        # Los clientes viejos reciben cada candidato enseguida; los que
+        # soportan lotes, uno por par (from, to) al cerrar la ventana
+        socketio.emit(evento, data, to=sala_ice(to, False))
+        origen = (data.get('from') if isinstance(data, dict) else None) \
+            or registro.usuario_de(request.sid) or request.sid
+        coalescedor.agregar(origen, to, sala_ice(to, True), data)
+
+    entregas = {'emit': emit_to_user, 'ice': entregar_ice}
+
+    def relay(evento, ruta):
+        entregar = entregas[ruta.entrega]
+
+        def manejar(data):
+            inicio = time.perf_counter()
+            try:
+                to, error = _destino(data)
+                if error is None and _tamano(data) > ruta.max_bytes:
+                    error = "Payload demasiado grande"
+                if error is not None:
+                    relay_resultados.inc(evento=evento, resultado="invalido")
+                    return {"error": error}
+                if not limitador.permitir(request.sid, evento, ruta):
+                    relay_resultados.inc(evento=evento, resultado="limitado")
+                    return {"error": "Demasiados eventos, esperá un momento"}
+                destino = resolver_destino(to)
+                if destino is None:
+                    relay_resultados.inc(evento=evento, resultado="invalido")
+                    return {"error": "Destino desconocido"}
+                entregar(evento, data, to, destino)
+                relay_duracion.observar(time.perf_counter() - inicio, evento=evento)
+                relay_resultados.inc(evento=evento, resultado="reenviado")
+            except Exception:
+                log.exception('Error en relay', extra={'evento': evento})
+
+        manejar.__name__ = f'relay_{evento}'
+        socketio.on(evento)(medir_evento(evento)(manejar))
+
+    # Solo se reenvian los eventos de la tabla
+    for evento, ruta in RUTAS_RELAY.items():
+        relay(evento, ruta)
+
+    return registro
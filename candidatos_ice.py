@@ -0,0 +1,98 @@
+"""
+Agrupado de candidatos ICE (trickle ICE) del lado del servidor.
+
+Cada conexion WebRTC genera decenas de candidatos en rafaga. Con el agrupado
+activo, los candidatos de un mismo par (from, to) se juntan durante una
+ventana corta y se entregan en un solo evento webrtc_ice_candidates a los
+clientes que lo soportan (register_user con ice_lotes: true). Los clientes
+viejos siguen recibiendo un webrtc_ice_candidate por candidato.
+
+Variables de entorno:
+    ICE_VENTANA_MS   espera antes de mandar el lote (0 desactiva el agrupado)
+    ICE_LOTE_MAX     candidatos que disparan el envio sin esperar la ventana
+"""
+
+import itertools
+import os
+import threading
+
+from socketio import PubSubManager
+
+VENTANA_MS = float(os.getenv("ICE_VENTANA_MS", "30"))
+LOTE_MAX = int(os.getenv("ICE_LOTE_MAX", "50"))
+
+
+class CoalescedorIce:
+    def __init__(self, socketio, ventana_ms=VENTANA_MS, lote_max=LOTE_MAX):
+        self.socketio = socketio
+        self.ventana = ventana_ms / 1000
+        self.lote_max = lote_max
+        # (origen, destino) -> (turno, [candidatos]); el turno identifica al
+        # lote, asi el temporizador de un lote ya enviado no vacia el siguiente
+        self._pendientes = {}
+        self._turnos = itertools.count()
+        self._lock = threading.Lock()
+        # Solo lo que efectivamente se emitio a alguien
+        self.candidatos = 0
+        self.lotes = 0
+
+    @property
+    def activo(self):
+        return self.ventana > 0
+
+    def _sala_vacia(self, sala):
+        manager = getattr(getattr(self.socketio, "server", None), "manager", None)
+        # Con una cola de mensajes los sockets de la sala pueden estar en otro proceso
+        if manager is None or isinstance(manager, PubSubManager):
+            return False
+        return next(iter(manager.get_participants("/", sala)), None) is None
+
+    def agregar(self, origen, destino, sala, data):
+        """Suma el candidato al lote del par; el primero programa el envio."""
+        if self._sala_vacia(sala):
+            # Ninguna conexion del destino acepta lotes
+            return
+        clave = (origen, destino)
+        with self._lock:
+            pendiente = self._pendientes.get(clave)
+            if pendiente is None:
+                pendiente = self._pendientes[clave] = (next(self._turnos), [])
+                self.socketio.start_background_task(self._vaciar_despues, clave, sala, pendiente[0])
+            turno, lote = pendiente
+            lote.append(data)
+            lleno = len(lote) >= self.lote_max
+        if lleno:
+            self.vaciar(clave, sala, turno)
+
+    def _vaciar_despues(self, clave, sala, turno):
+        self.socketio.sleep(self.ventana)
+        self.vaciar(clave, sala, turno)
+
+    def vaciar(self, clave, sala, turno=None):
+        """Emite el lote pendiente del par (solo el de ese turno, si se pasa)."""
+        with self._lock:
+            pendiente = self._pendientes.get(clave)
+            if pendiente is None or (turno is not None and pendiente[0] != turno):
+                return
+            del self._pendientes[clave]
+        lote = pendiente[1]
+        if not lote or self._sala_vacia(sala):
+            return
+        origen, destino = clave
+        self.socketio.emit('webrtc_ice_candidates', {
+            "from": origen,
+            "to": destino,
+            "candidatos": lote,
+        }, to=sala)
+        with self._lock:
+            self.candidatos += len(lote)
+            self.lotes += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "ventana_ms": self.ventana * 1000,
+                "candidatos": self.candidatos,
+                "lotes": self.lotes,
+                "candidatos_por_lote": round(self.candidatos / self.lotes, 2) if self.lotes else None,
+            }
@@ -0,0 +1,92 @@
+"""
+Chat por clase sobre salas de Socket.IO.
+
+Cada socket se une a la sala clase:<id> de las clases en las que participa
+(join_clase) y los mensajes se emiten solo a esa sala: el costo de cada
+mensaje depende de cuantos alumnos tiene la clase, no de cuantos clientes
+hay conectados en todo el servidor.
+
+Cada mensaje se guarda en el historial (mensajes_chat) antes de emitirse;
+el guardado es write-behind, asi que no agrega una escritura a la DB por
+mensaje.
+"""
+
+import logging
+
+from flask import request
+from flask_socketio import join_room, leave_room, rooms
+
+from clases import es_participante
+import mensajes_chat
+from metricas import medir_evento
+
+log = logging.getLogger(__name__)
+
+LARGO_MAXIMO = 4000
+
+
+def sala_clase(clase_id):
+    return f"clase:{clase_id}"
+
+
+def register_chat(socketio, registro):
+    """
+    Registra los eventos de chat. registro es el registro de sockets de
+    call_signaling; de ahi sale el usuario de cada socket.
+    """
+
+    @socketio.on('join_clase')
+    @medir_evento('join_clase')
+    def on_join_clase(data):
+        try:
+            clase_id = data.get('clase_id')
+            if not clase_id:
+                return {"error": "Falta clase_id"}
+            # El usuario sale de register_user (call_signaling)
+            usuario_id = registro.usuario_de(request.sid)
+            if usuario_id is None:
+                return {"error": "Usuario no registrado"}
+            if not es_participante(usuario_id, clase_id):
+                return {"error": "El usuario no participa en la clase"}
+            join_room(sala_clase(clase_id))
+            return {"status": "ok"}
+        except Exception:
+            log.exception('Error en on_join_clase')
+            return {"error": "Error interno del servidor"}
+
+    @socketio.on('leave_clase')
+    def on_leave_clase(data=None):
+        try:
+            clase_id = data.get('clase_id') if isinstance(data, dict) else None
+            if not clase_id:
+                return {"error": "Falta clase_id"}
+            leave_room(sala_clase(clase_id))
+            return {"status": "ok"}
+        except Exception:
+            log.exception('Error en on_leave_clase')
+            return {"error": "Error interno del servidor"}
+
+    @socketio.on('chat_message')
+    @medir_evento('chat_message')
+    def on_chat_message(data):
+        try:
+            clase_id = data.get('clase_id')
+            if not clase_id:
+                return {"error": "Falta clase_id"}
+            texto = data.get('texto')
+            if not isinstance(texto, str) or not texto.strip():
+                return {"error": "Falta texto"}
+            if len(texto) > LARGO_MAXIMO:
+                return {"error": f"El mensaje supera los {LARGO_MAXIMO} caracteres"}
+            sala = sala_clase(clase_id)
+            # Solo puede escribir quien ya se unio (y fue validado) a la sala
+            if sala not in rooms():
+                return {"error": "No estas unido a la clase"}
+            usuario_id = registro.usuario_de(request.sid)
+            mensaje_id, enviado_en = mensajes_chat.guardar(clase_id, usuario_id, texto)
+            data.update(id=mensaje_id, usuario_id=usuario_id, enviado_en=enviado_en)
+            socketio.emit('chat_message', data, to=sala)
+            return {"status": "ok", "id": mensaje_id}
+        except Exception:
+            log.exception('Error en on_chat_message')
+            return {"error": "Error interno del servidor"}
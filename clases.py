@@ -1,54 +1,152 @@
-from db import conectar, random_id
+from db import conectar, transaccion
+from ids import nuevo_id, allocate
 from datetime import datetime
-from usuarios import obtener_usuario_por_id
+import cache
+import file_storage
+import subidas
 
 def crear_clases(nombre, descripcion, profesor_id):
-    conn = conectar()
-    cursor = conn.cursor()
-    clase_id = random_id("clases")
-    creada_en = datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO clases (id, nombre, descripcion, profesor_id, creado_en)
-        VALUES (?, ?, ?, ?, ?)
-    """, (clase_id, nombre, descripcion, profesor_id, creada_en))
-    conn.commit()
-    conn.close()
-    unirse_clase(profesor_id, clase_id)
+    # La clase y la participacion del profesor se crean en una sola transaccion
+    with transaccion() as cursor:
+        clase_id = nuevo_id()
+        creada_en = datetime.now().isoformat()
+        cursor.execute("""
+            INSERT INTO clases (id, nombre, descripcion, profesor_id, creado_en)
+            VALUES (?, ?, ?, ?, ?)
+        """, (clase_id, nombre, descripcion, profesor_id, creada_en))
+        unirse_clase(profesor_id, clase_id)
     return clase_id
 
 def eliminar_clase(clase_id):
     """
-    Elimina la clase indicada y todas las participaciones asociadas.
+    Elimina la clase indicada y todo lo que depende de ella (participaciones,
+    trabajos y sus archivos, notificaciones y chat), necesario porque
+    foreign_keys esta activo.
     """
-    conn = conectar()
-    cursor = conn.cursor()
-    # Eliminar participaciones de la clase
-    cursor.execute("""
-        DELETE FROM participaciones WHERE clase_id = ?
-    """, (clase_id,))
-    # Eliminar la clase
-    cursor.execute("""
-        DELETE FROM clases WHERE id = ?
-    """, (clase_id,))
-    conn.commit()
-    conn.close()
+    with transaccion() as cursor:
+        cursor.execute("""
+            DELETE FROM notificaciones_usuarios
+            WHERE notificacion_id IN (SELECT id FROM notificaciones WHERE clase_id = ?)
+        """, (clase_id,))
+        cursor.execute("""
+            DELETE FROM notificaciones WHERE clase_id = ?
+        """, (clase_id,))
+        cursor.execute("""
+            DELETE FROM mensajes_chat WHERE clase_id = ?
+        """, (clase_id,))
+        cursor.execute("""
+            DELETE FROM trabajos_alumnos
+            WHERE trabajo_id IN (SELECT id FROM trabajos WHERE clase_id = ?)
+        """, (clase_id,))
+        # Los adjuntos se borran aca (no en cascada) para descontar sus blobs
+        file_storage.delete_files_for_clase(cursor, clase_id)
+        subidas.cancelar_de_clase(cursor, clase_id)
+        cursor.execute("""
+            DELETE FROM trabajos WHERE clase_id = ?
+        """, (clase_id,))
+        # Eliminar participaciones de la clase
+        cursor.execute("""
+            DELETE FROM participaciones WHERE clase_id = ?
+        """, (clase_id,))
+        # Eliminar la clase
+        cursor.execute("""
+            DELETE FROM clases WHERE id = ?
+        """, (clase_id,))
+    cache.invalidar(cache.clave_clase(clase_id))
 
 def unirse_clase(usuario_id, clase_id):
-    clases = clases_por_usuario(usuario_id)
-    if any(clase_id == c[0] for c in clases):
-        return  # Ya está unido a la clase
-
+    """
+    Inscribe al usuario en la clase. Es idempotente: si ya estaba unido no
+    hace nada (lo garantiza el indice unico de participaciones, tambien
+    ante uniones concurrentes). Devuelve True si se creo la participacion.
+    """
     conn = conectar()
     cursor = conn.cursor()
-    participacion_id = random_id("participaciones")
+    participacion_id = nuevo_id()
     unido_en = datetime.now().isoformat()
     cursor.execute("""
         INSERT INTO participaciones (id, usuario_id, clase_id, unido_en)
         VALUES (?, ?, ?, ?)
+        ON CONFLICT (usuario_id, clase_id) DO NOTHING
     """, (participacion_id, usuario_id, clase_id, unido_en))
+    creada = cursor.rowcount == 1
     conn.commit()
     conn.close()
-    
+    return creada
+
+def inscribir_por_email(clase_id, filas, tamano_lote=500):
+    """
+    Inscripcion masiva. filas es un iterable de (numero_de_fila, email) que
+    se consume de a lotes (se puede pasar un generador que lee el request).
+    Los emails de cada lote se resuelven a usuarios con una sola consulta y
+    todas las inscripciones se insertan en una unica transaccion al final.
+    Devuelve una lista de dicts {fila, email, resultado}, en el orden de las
+    filas, donde resultado es inscripto, ya_inscripto, no_encontrado,
+    duplicado o invalido (tambien si el email no es un texto).
+    """
+    reporte = []
+    a_inscribir = []  # (indice en reporte, usuario_id)
+    vistos = set()
+    lote = []
+
+    def resolver(lote):
+        emails = list({email for _, email in lote})
+        conn = conectar()
+        cursor = conn.cursor()
+        marcadores = ",".join("?" * len(emails))
+        cursor.execute(f"SELECT email, id FROM usuarios WHERE email IN ({marcadores})", emails)
+        ids_por_email = dict(cursor.fetchall())
+        conn.close()
+        for numero, email in lote:
+            usuario_id = ids_por_email.get(email)
+            if usuario_id is None:
+                reporte.append({"fila": numero, "email": email, "resultado": "no_encontrado"})
+            else:
+                a_inscribir.append((len(reporte), usuario_id))
+                reporte.append({"fila": numero, "email": email, "resultado": "ya_inscripto"})
+
+    for numero, email in filas:
+        # En NDJSON el email puede venir como numero, objeto, null...
+        email = email.strip() if isinstance(email, str) else ""
+        if not email or "@" not in email:
+            reporte.append({"fila": numero, "email": email, "resultado": "invalido"})
+            continue
+        if email in vistos:
+            reporte.append({"fila": numero, "email": email, "resultado": "duplicado"})
+            continue
+        vistos.add(email)
+        lote.append((numero, email))
+        if len(lote) >= tamano_lote:
+            resolver(lote)
+            lote = []
+    if lote:
+        resolver(lote)
+
+    # Lo que el INSERT devuelve es lo nuevo; el resto ya estaba inscripto
+    unido_en = datetime.now().isoformat()
+    insertados = set()
+    with transaccion() as cursor:
+        for inicio in range(0, len(a_inscribir), tamano_lote):
+            tramo = a_inscribir[inicio:inicio + tamano_lote]
+            ids_nuevos = allocate(len(tramo))
+            valores = []
+            for (_, usuario_id), participacion_id in zip(tramo, ids_nuevos):
+                valores.extend((participacion_id, usuario_id, clase_id, unido_en))
+            cursor.execute(f"""
+                INSERT INTO participaciones (id, usuario_id, clase_id, unido_en)
+                VALUES {",".join(["(?, ?, ?, ?)"] * len(tramo))}
+                ON CONFLICT (usuario_id, clase_id) DO NOTHING
+                RETURNING usuario_id
+            """, valores)
+            insertados.update(f[0] for f in cursor.fetchall())
+    for indice, usuario_id in a_inscribir:
+        if usuario_id in insertados:
+            reporte[indice]["resultado"] = "inscripto"
+            reporte[indice]["usuario_id"] = usuario_id
+    # Los invalidos y duplicados se anotan antes que los lotes resueltos
+    reporte.sort(key=lambda f: f["fila"])
+    return reporte
+
 def dejar_clase(usuario_id, clase_id):
     conn = conectar()
     cursor = conn.cursor()
@@ -79,3 +177,54 @@ def clases_por_usuario(usuario_id):
     clases = cursor.fetchall()
     conn.close()
     return clases
+
+def obtener_clase(clase_id):
+    return cache.obtener(cache.clave_clase(clase_id), lambda: _cargar_clase(clase_id))
+
+def _cargar_clase(clase_id):
+    conn = conectar()
+    cursor = conn.cursor()
+    query = """
+        SELECT 
+            id,
+            nombre,
+            descripcion,
+            profesor_id,
+            creado_en
+        FROM clases
+        WHERE id = ?
+    """
+    cursor.execute(query, (clase_id,))
+    resultado = cursor.fetchone()
+    conn.close()
+    if resultado:
+        return {
+            "id": resultado[0],
+            "nombre": resultado[1],
+            "descripcion": resultado[2],
+            "profesor_id": resultado[3],
+            "creado_en": resultado[4]
+        }
+    return None
+
+def es_participante(usuario_id, clase_id):
+    """True si el usuario esta inscripto en la clase (el profesor tambien lo esta)."""
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT 1 FROM participaciones WHERE usuario_id = ? AND clase_id = ?
+    """, (usuario_id, clase_id))
+    participa = cursor.fetchone() is not None
+    conn.close()
+    return participa
+
+def clase_ids_por_usuario(usuario_id):
+    """Ids de las clases en las que participa el usuario."""
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT clase_id FROM participaciones WHERE usuario_id = ?
+    """, (usuario_id,))
+    clase_ids = [fila[0] for fila in cursor.fetchall()]
+    conn.close()
+    return clase_ids
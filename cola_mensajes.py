@@ -0,0 +1,201 @@
+"""
+Cola de mensajes TCP minima para correr Socket.IO en varios procesos.
+
+Cada worker publica sus emits en la cola y recibe los de los demas, asi un
+emit(..., to=sala) llega tambien a los sockets conectados a otro proceso.
+Es un reemplazo local de Redis: sin dependencias, sin persistencia y con
+un solo broker. En produccion conviene Redis (SOCKETIO_MESSAGE_QUEUE=redis://...).
+
+    python -m cola_mensajes --puerto 6390
+    SOCKETIO_MESSAGE_QUEUE=tcp://127.0.0.1:6390 python app.py
+
+Protocolo: el cliente manda un byte de rol (P publica, S se suscribe) y
+despues marcos de 4 bytes de largo + JSON. El broker reenvia cada marco
+publicado a todos los suscriptores. Los bytes de los payloads binarios
+(SDP comprimido, msgpack) viajan como {"__bytes__": "<base64>"}; no se usa
+pickle para que un cliente de la cola no pueda ejecutar codigo en los workers.
+"""
+
+import argparse
+import base64
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+PUERTO_POR_DEFECTO = 6390
+_LARGO = struct.Struct("!I")
+_BYTES = "__bytes__"
+
+
+def _leer_exacto(sock, n):
+    datos = b""
+    while len(datos) < n:
+        parte = sock.recv(n - len(datos))
+        if not parte:
+            return None
+        datos += parte
+    return datos
+
+
+def _leer_marco(sock):
+    cabecera = _leer_exacto(sock, _LARGO.size)
+    if cabecera is None:
+        return None
+    return _leer_exacto(sock, _LARGO.unpack(cabecera)[0])
+
+
+def _marco(cuerpo):
+    return _LARGO.pack(len(cuerpo)) + cuerpo
+
+
+def _codificar_bytes(valor):
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return {_BYTES: base64.b64encode(valor).decode("ascii")}
+    raise TypeError(f"{type(valor).__name__} no se puede mandar por la cola")
+
+
+def _decodificar_bytes(objeto):
+    if len(objeto) == 1 and _BYTES in objeto:
+        return base64.b64decode(objeto[_BYTES])
+    return objeto
+
+
+def codificar(mensaje):
+    """Cuerpo de un marco: el mensaje en JSON, con los bytes en base64."""
+    return json.dumps(mensaje, default=_codificar_bytes).encode()
+
+
+def decodificar(cuerpo):
+    return json.loads(cuerpo, object_hook=_decodificar_bytes)
+
+
+class _ManejadorConexion(socketserver.BaseRequestHandler):
+    def handle(self):
+        rol = _leer_exacto(self.request, 1)
+        if rol == b"S":
+            self.server.suscribir(self.request)
+            try:
+                # El suscriptor no manda nada mas; esperar a que cierre
+                while self.request.recv(1024):
+                    pass
+            except OSError:
+                pass
+            finally:
+                self.server.desuscribir(self.request)
+        elif rol == b"P":
+            while True:
+                try:
+                    cuerpo = _leer_marco(self.request)
+                except OSError:
+                    return
+                if cuerpo is None:
+                    return
+                self.server.publicar(_marco(cuerpo))
+
+
+class Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", puerto=PUERTO_POR_DEFECTO):
+        super().__init__((host, puerto), _ManejadorConexion)
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+        self.publicados = 0
+
+    def suscribir(self, sock):
+        with self._lock:
+            self._suscriptores.add(sock)
+
+    def desuscribir(self, sock):
+        with self._lock:
+            self._suscriptores.discard(sock)
+
+    def publicar(self, marco):
+        # Un solo lock: los marcos de distintos publicadores no se mezclan
+        with self._lock:
+            self.publicados += 1
+            for sock in list(self._suscriptores):
+                try:
+                    sock.sendall(marco)
+                except OSError:
+                    self._suscriptores.discard(sock)
+
+
+def iniciar_broker(host="127.0.0.1", puerto=PUERTO_POR_DEFECTO):
+    """Arranca un broker en un hilo y lo devuelve (puerto 0 = uno libre)."""
+    broker = Broker(host, puerto)
+    threading.Thread(target=broker.serve_forever, name="broker-socketio", daemon=True).start()
+    return broker
+
+
+class AdministradorTCP(socketio.PubSubManager):
+    """Client manager de python-socketio que usa el Broker como pub/sub."""
+
+    name = "tcp"
+
+    def __init__(self, url=f"tcp://127.0.0.1:{PUERTO_POR_DEFECTO}", channel="flask-socketio",
+                 write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        destino = urlparse(url)
+        self.direccion = (destino.hostname or "127.0.0.1", destino.port or PUERTO_POR_DEFECTO)
+        self._publicador = None
+        self._lock = threading.Lock()
+
+    def _conectar(self, rol):
+        sock = socket.create_connection(self.direccion, timeout=5)
+        sock.settimeout(None)
+        sock.sendall(rol)
+        return sock
+
+    def _publish(self, data):
+        marco = _marco(codificar({"canal": self.channel, "datos": data}))
+        with self._lock:
+            for intentos_restantes in (1, 0):
+                try:
+                    if self._publicador is None:
+                        self._publicador = self._conectar(b"P")
+                    self._publicador.sendall(marco)
+                    return
+                except OSError as e:
+                    self._publicador = None
+                    if not intentos_restantes:
+                        self._get_logger().error("No se pudo publicar en la cola: %s", e)
+
+    def _listen(self):
+        espera = 1
+        while True:
+            try:
+                sock = self._conectar(b"S")
+                espera = 1
+                while True:
+                    cuerpo = _leer_marco(sock)
+                    if cuerpo is None:
+                        raise ConnectionError("el broker cerro la conexion")
+                    mensaje = decodificar(cuerpo)
+                    if mensaje.get("canal") == self.channel:
+                        yield mensaje["datos"]
+            except OSError as e:
+                self._get_logger().error("Sin conexion con la cola, reintento en %ss: %s", espera, e)
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker local para Socket.IO multi-proceso")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    args = parser.parse_args()
+    broker = Broker(args.host, args.puerto)
+    print(f"Cola de mensajes escuchando en tcp://{args.host}:{args.puerto}")
+    broker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
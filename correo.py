@@ -0,0 +1,249 @@
+"""
+Envio de emails en segundo plano a traves de una bandeja de salida en la DB.
+
+encolar_email() solo inserta una fila en emails_pendientes y despierta al
+remitente, asi el request HTTP no espera al servidor SMTP. El remitente es
+un hilo que toma lotes de mensajes, los manda reutilizando una unica sesion
+SMTP autenticada y reintenta los fallidos con backoff exponencial.
+
+Los mensajes se "reservan" moviendo proximo_intento hacia adelante en la
+misma sentencia que los selecciona; si un proceso muere a mitad de un envio,
+otro los retoma cuando vence la reserva.
+
+Variables de entorno:
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, EMAIL_FROM
+    SMTP_STARTTLS        0 para servidores locales sin TLS (por defecto 1)
+    EMAIL_LOTE           mensajes por vuelta
+    EMAIL_MAX_INTENTOS   intentos antes de marcar el mensaje como fallido
+"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from db import conectar, transaccion
+from ids import nuevo_id
+import metricas
+
+log = logging.getLogger(__name__)
+
+LOTE = int(os.getenv("EMAIL_LOTE", "50"))
+MAX_INTENTOS = int(os.getenv("EMAIL_MAX_INTENTOS", "6"))
+BACKOFF_BASE_S = 5
+BACKOFF_MAX_S = 600
+# Tiempo que un mensaje queda reservado mientras se intenta mandar
+RESERVA_S = 60
+# Espera para juntar mas mensajes en el mismo lote despues de despertar
+ESPERA_LOTE_S = 0.05
+# Cerrar la sesion SMTP si no se uso en este tiempo (los servidores cortan las ociosas)
+SESION_OCIOSA_S = 60
+
+smtp_envio = metricas.Histograma(
+    "learned_smtp_envio_segundos", "Duracion de cada envio SMTP (incluye conectar si hace falta).")
+smtp_emails = metricas.Contador(
+    "learned_smtp_emails_total", "Emails procesados por resultado.", ("resultado",))
+
+
+def encolar_email(destinatario, asunto, cuerpo):
+    """
+    Guarda el mensaje en la bandeja de salida y devuelve su id. ValueError
+    si el destinatario o el asunto no entran en un encabezado (saltos de
+    linea: no se pueden agregar encabezados desde un email de registro).
+    """
+    for valor in (destinatario, asunto):
+        if not isinstance(valor, str) or "\r" in valor or "\n" in valor:
+            raise ValueError("Destinatario o asunto invalido")
+    email_id = nuevo_id()
+    ahora = time.time()
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO emails_pendientes (id, destinatario, asunto, cuerpo, estado, intentos, proximo_intento, creado_en)
+        VALUES (?, ?, ?, ?, 'pendiente', 0, ?, ?)
+    """, (email_id, destinatario, asunto, cuerpo, ahora, ahora))
+    conn.commit()
+    conn.close()
+    if _remitente is not None:
+        _remitente.despertar()
+    return email_id
+
+
+def _backoff(intentos):
+    return min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (intentos - 1))
+
+
+class RemitenteCorreo(threading.Thread):
+    def __init__(self, host=None, port=None, usuario=None, password=None, remitente=None, starttls=None):
+        super().__init__(name="remitente-correo", daemon=True)
+        self.host = host if host is not None else os.getenv("SMTP_HOST")
+        self.port = port if port is not None else int(os.getenv("SMTP_PORT", "587"))
+        self.usuario = usuario if usuario is not None else os.getenv("SMTP_USER")
+        self.password = password if password is not None else os.getenv("SMTP_PASS")
+        self.remitente = remitente if remitente is not None else os.getenv("EMAIL_FROM", self.usuario)
+        self.starttls = starttls if starttls is not None else os.getenv("SMTP_STARTTLS", "1") != "0"
+        self._smtp = None
+        self._ultimo_uso = 0.0
+        self._evento = threading.Event()
+        self._detener = threading.Event()
+        self.enviados = 0
+        self.fallidos = 0
+
+    def despertar(self):
+        self._evento.set()
+
+    def detener(self):
+        self._detener.set()
+        self._evento.set()
+
+    def run(self):
+        while not self._detener.is_set():
+            self._evento.wait(timeout=BACKOFF_BASE_S)
+            self._evento.clear()
+            time.sleep(ESPERA_LOTE_S)
+            try:
+                while self.procesar_pendientes() == LOTE:
+                    pass
+            except Exception:
+                log.exception("Error en el remitente de correo")
+            if self._smtp is not None and time.time() - self._ultimo_uso > SESION_OCIOSA_S:
+                self._cerrar_sesion()
+        self._cerrar_sesion()
+
+    def _reservar_lote(self):
+        ahora = time.time()
+        with transaccion() as cursor:
+            cursor.execute("""
+                UPDATE emails_pendientes
+                SET proximo_intento = ?, intentos = intentos + 1
+                WHERE id IN (
+                    SELECT id FROM emails_pendientes
+                    WHERE estado = 'pendiente' AND proximo_intento <= ?
+                    ORDER BY proximo_intento
+                    LIMIT ?
+                )
+                RETURNING id, destinatario, asunto, cuerpo, intentos
+            """, (ahora + RESERVA_S, ahora, LOTE))
+            return cursor.fetchall()
+
+    def _sesion(self):
+        if self._smtp is not None:
+            return self._smtp
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            smtp.starttls()
+        if self.usuario and self.password:
+            smtp.login(self.usuario, self.password)
+        self._smtp = smtp
+        return smtp
+
+    def _cerrar_sesion(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    def _mensaje(self, destinatario, asunto, cuerpo):
+        msg = EmailMessage()
+        msg['Subject'] = asunto
+        msg['From'] = self.remitente
+        msg['To'] = destinatario
+        msg.set_content(cuerpo)
+        return msg
+
+    def _enviar(self, destinatario, asunto, cuerpo):
+        msg = self._mensaje(destinatario, asunto, cuerpo)
+        inicio = time.perf_counter()
+        try:
+            self._sesion().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # la sesion reutilizada se corto: reconectar una vez
+            self._smtp = None
+            self._sesion().send_message(msg)
+        finally:
+            smtp_envio.observar(time.perf_counter() - inicio)
+        self._ultimo_uso = time.time()
+
+    def procesar_pendientes(self):
+        """Manda un lote de mensajes vencidos. Devuelve cuantos se tomaron."""
+        lote = self._reservar_lote()
+        resultados = []
+        try:
+            for email_id, destinatario, asunto, cuerpo, intentos in lote:
+                resultados.append(self._procesar(email_id, destinatario, asunto, cuerpo, intentos))
+        finally:
+            # Tambien si algo corta el lote: lo ya enviado no se vuelve a mandar
+            if resultados:
+                self._guardar_resultados(resultados)
+        return len(lote)
+
+    def _procesar(self, email_id, destinatario, asunto, cuerpo, intentos):
+        """Manda un mensaje; devuelve (email_id, estado, proximo_intento, error)."""
+        if not self.host:
+            # Sin SMTP configurado se muestra el mensaje, igual que antes
+            log.warning('SMTP no configurado. Mensaje:\n%s', cuerpo, extra={'destinatario': destinatario})
+            smtp_emails.inc(resultado="sin_smtp")
+            return email_id, "sin_smtp", None, None
+        try:
+            self._enviar(destinatario, asunto, cuerpo)
+        except (smtplib.SMTPException, OSError) as e:
+            log.warning('Error enviando SMTP', extra={'email_id': email_id, 'intentos': intentos, 'error': str(e)})
+            # Un rechazo del destinatario no invalida la sesion; el resto si
+            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                self._cerrar_sesion()
+            if intentos < MAX_INTENTOS:
+                smtp_emails.inc(resultado="reintento")
+                return email_id, "pendiente", time.time() + _backoff(intentos), str(e)
+            return self._fallido(email_id, e)
+        except Exception as e:
+            # El mensaje no se puede armar (p. ej. un encabezado invalido):
+            # reintentarlo daria lo mismo
+            log.exception('Mensaje invalido, no se reintenta', extra={'email_id': email_id})
+            return self._fallido(email_id, e)
+        self.enviados += 1
+        smtp_emails.inc(resultado="enviado")
+        return email_id, "enviado", None, None
+
+    def _fallido(self, email_id, error):
+        self.fallidos += 1
+        smtp_emails.inc(resultado="fallido")
+        return email_id, "fallido", None, str(error) or type(error).__name__
+
+    def _guardar_resultados(self, resultados):
+        ahora = time.time()
+        with transaccion() as cursor:
+            cursor.executemany("""
+                UPDATE emails_pendientes
+                SET estado = ?,
+                    proximo_intento = COALESCE(?, proximo_intento),
+                    ultimo_error = ?,
+                    enviado_en = CASE WHEN ? IN ('enviado', 'sin_smtp') THEN ? ELSE enviado_en END
+                WHERE id = ?
+            """, [(estado, proximo, error, estado, ahora, email_id)
+                  for email_id, estado, proximo, error in resultados])
+
+
+_remitente = None
+
+
+def iniciar_remitente(**config):
+    """Arranca el hilo remitente (una vez por proceso) y lo devuelve."""
+    global _remitente
+    if _remitente is None:
+        _remitente = RemitenteCorreo(**config)
+        _remitente.start()
+        _remitente.despertar()
+    return _remitente
+
+
+def detener_remitente():
+    global _remitente
+    if _remitente is not None:
+        _remitente.detener()
+        _remitente.join(timeout=5)
+        _remitente = None
@@ -1,11 +1,101 @@
 import sqlite3
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-import secrets
+from ids import nuevo_id
 
 DB_PATH = "./db/app.db"
 SCHEMA_PATH = "./db/schema.sql"
 
+# Cantidad maxima de conexiones ociosas que se guardan para reutilizar
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "16"))
+# Milisegundos que sqlite espera un lock antes de devolver SQLITE_BUSY
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# PRAGMAs que se aplican una sola vez, al abrir cada conexion fisica
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -20000",
+)
+
+_pool = []
+# Funciones que reciben cada sentencia SQL ejecutada (ver registrar_trazador)
+_trazadores = []
+# Funciones que reciben (sentencia, segundos) de cada execute (ver registrar_medidor)
+_medidores = []
+_pool_lock = threading.Lock()
+_dir_lock = threading.Lock()
+_dir_listo = False
+# threading.local pasa a ser local por greenlet cuando eventlet/gevent parchean threading
+_local = threading.local()
+
+
+class Cursor(sqlite3.Cursor):
+    """Cursor que mide cada execute cuando hay medidores registrados."""
+
+    def execute(self, sentencia, parametros=()):
+        if not _medidores:
+            return super().execute(sentencia, parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sentencia, parametros)
+        finally:
+            _medir(sentencia, time.perf_counter() - inicio)
+
+    def executemany(self, sentencia, parametros):
+        if not _medidores:
+            return super().executemany(sentencia, parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sentencia, parametros)
+        finally:
+            _medir(sentencia, time.perf_counter() - inicio)
+
+
+class Conexion(sqlite3.Connection):
+    """
+    Conexion reutilizable del pool.
+    - close() no cierra el archivo: deshace lo pendiente y deja la conexion
+      asignada al hilo/greenlet actual hasta que se libere.
+    - commit() dentro de transaccion() no hace nada; confirma la transaccion externa.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profundidad = 0
+        # Funciones a llamar cuando se confirme la transaccion externa (al_confirmar)
+        self.pendientes = []
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    # Los atajos de sqlite3.Connection crean un cursor comun; estos usan Cursor
+    def execute(self, sentencia, parametros=()):
+        return self.cursor().execute(sentencia, parametros)
+
+    def executemany(self, sentencia, parametros):
+        return self.cursor().executemany(sentencia, parametros)
+
+    def commit(self):
+        if self.profundidad > 0:
+            return
+        super().commit()
+
+    def close(self):
+        if self.profundidad == 0 and self.in_transaction:
+            self.rollback()
+
+    def cerrar(self):
+        super().close()
+
+
 def ejecutar_schema(path_sql, db_name=DB_PATH):
     with open(path_sql, "r", encoding="utf-8") as f:
         schema = f.read()
@@ -15,17 +105,138 @@ def ejecutar_schema(path_sql, db_name=DB_PATH):
     conn.commit()
     conn.close()
 
+def _asegurar_directorio():
+    # Las tablas las crea migraciones.migrar(); aca solo hace falta la carpeta
+    global _dir_listo
+    if _dir_listo:
+        return
+    with _dir_lock:
+        if not _dir_listo:
+            os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+            _dir_listo = True
+
+def _nueva_conexion():
+    _asegurar_directorio()
+    # El pool pasa conexiones de un hilo a otro (nunca dos a la vez), por eso
+    # se desactiva el chequeo de sqlite3 que las ata al hilo que las creo
+    conn = sqlite3.connect(DB_PATH, factory=Conexion, timeout=BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    # Permite generar IDs dentro de INSERT ... SELECT
+    conn.create_function("nuevo_id", 0, nuevo_id)
+    if _trazadores:
+        conn.set_trace_callback(_trazar)
+    return conn
+
+def _trazar(sentencia):
+    for trazador in _trazadores:
+        trazador(sentencia)
+
+def registrar_trazador(fn):
+    """
+    Llama a fn(sentencia) por cada sentencia SQL que ejecuten las conexiones
+    del pool. Se usa en benchmarks para contar consultas por request.
+    """
+    _trazadores.append(fn)
+    cerrar_pool()
+
+def _medir(sentencia, segundos):
+    for medidor in _medidores:
+        medidor(sentencia, segundos)
+
+def registrar_medidor(fn):
+    """
+    Llama a fn(sentencia, segundos) despues de cada execute/executemany de
+    las conexiones del pool. Lo usa metricas.py.
+    """
+    if fn not in _medidores:
+        _medidores.append(fn)
+
 def conectar():
-    if not os.path.exists(DB_PATH):
-        ejecutar_schema(SCHEMA_PATH)
-    return sqlite3.connect(DB_PATH)
+    """
+    Devuelve la conexion del hilo/greenlet actual, tomandola del pool
+    (o abriendo una nueva) la primera vez. Llamar a close() es seguro.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        with _pool_lock:
+            conn = _pool.pop() if _pool else None
+        if conn is None:
+            conn = _nueva_conexion()
+        _local.conn = conn
+    return conn
+
+def liberar_conexion(exc=None):
+    """Devuelve la conexion del hilo/greenlet actual al pool."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    conn.profundidad = 0
+    conn.pendientes.clear()
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        if len(_pool) < POOL_MAX:
+            _pool.append(conn)
+            return
+    conn.cerrar()
 
-def random_id(tabla, campo="id"):
+def cerrar_pool():
+    """
+    Cierra la conexion del hilo actual y todas las ociosas (por ejemplo al
+    cambiar DB_PATH o al registrar un trazador).
+    """
+    global _dir_listo
+    liberar_conexion()
+    with _pool_lock:
+        conexiones = list(_pool)
+        _pool.clear()
+        _dir_listo = False
+    for conn in conexiones:
+        conn.cerrar()
+
+@contextmanager
+def transaccion():
+    """
+    Abre una transaccion sobre la conexion del hilo actual y devuelve un cursor.
+    Confirma al salir sin errores y deshace si hay una excepcion. Las llamadas
+    anidadas (y los commit() de los helpers que se usen adentro) se suman a
+    la transaccion externa.
+    """
     conn = conectar()
-    cursor = conn.cursor()
-    while True:
-        nuevo_id = secrets.token_hex(10)
-        cursor.execute(f"SELECT 1 FROM {tabla} WHERE {campo} = ?", (nuevo_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return nuevo_id
+    externa = conn.profundidad == 0
+    if externa and not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    conn.profundidad += 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.profundidad -= 1
+        if externa:
+            conn.pendientes.clear()
+            conn.rollback()
+        raise
+    conn.profundidad -= 1
+    if externa:
+        conn.commit()
+        pendientes, conn.pendientes = conn.pendientes, []
+        for fn in pendientes:
+            fn()
+
+def al_confirmar(fn):
+    """
+    Llama a fn() cuando se confirme la transaccion en curso, para efectos
+    que no se pueden deshacer (borrar archivos). Si la transaccion se
+    deshace, fn no se llama. Fuera de transaccion() corre enseguida.
+    """
+    conn = conectar()
+    if conn.profundidad == 0:
+        fn()
+        return
+    conn.pendientes.append(fn)
+
+def init_app(app):
+    """Libera la conexion al pool al terminar cada request de Flask."""
+    app.teardown_appcontext(liberar_conexion)
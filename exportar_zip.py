@@ -0,0 +1,172 @@
+"""
+Exportacion en ZIP de los archivos de un trabajo o de todos los trabajos
+de una clase, para bajar las entregas de una sola vez.
+
+zip_en_tramos() es un generador que arma el ZIP mientras se envia: cada
+archivo del almacen se lee de a file_storage.CHUNK_SIZE y lo que produce
+zipfile sale por el generador enseguida, sin archivo temporal y sin tener
+el ZIP en memoria. Lo unico que crece con la exportacion es el directorio
+central que zipfile escribe al final (un ZipInfo por entrada, no por byte).
+
+Como la salida no es seekable, zipfile escribe cada entrada con data
+descriptor (el CRC y los tamanos van despues de los datos) y usa ZIP64
+cuando un archivo o el total pasan los limites del formato clasico.
+
+Los formatos que ya vienen comprimidos (imagenes, video, audio, pdf, zip,
+documentos de Office...) van sin comprimir (ZIP_STORED): deflate no les
+saca nada y solo gasta CPU.
+"""
+
+import logging
+import os
+import zipfile
+from datetime import datetime
+
+import file_storage
+from db import conectar
+
+log = logging.getLogger(__name__)
+
+_MIME_COMPRIMIDOS = ("image/", "video/", "audio/")
+# Dentro de esos tipos, los que si se comprimen bien
+_MIME_SIN_COMPRIMIR = {"image/bmp", "image/svg+xml", "image/tiff", "image/x-icon", "audio/wav", "audio/x-wav"}
+_EXT_COMPRIMIDAS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst", ".jar", ".apk",
+    ".pdf", ".epub", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp4", ".m4v", ".mov", ".mkv", ".webm", ".avi", ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".flac",
+}
+
+
+class _Salida:
+    """Destino de zipfile: junta lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def ya_comprimido(nombre, mime=None):
+    """True si el formato ya viene comprimido y conviene guardarlo tal cual."""
+    if os.path.splitext(nombre)[1].lower() in _EXT_COMPRIMIDAS:
+        return True
+    mime = (mime or file_storage.guess_mime(nombre)).lower()
+    return mime.startswith(_MIME_COMPRIMIDOS) and mime not in _MIME_SIN_COMPRIMIR
+
+
+def _limpiar(nombre):
+    # Sin separadores ni nombres ocultos: nada se extrae fuera de su carpeta
+    nombre = nombre.replace("/", "_").replace("\\", "_").strip().lstrip(".")
+    return nombre or "archivo"
+
+
+def _unico(nombre, usados):
+    base, ext = os.path.splitext(nombre)
+    candidato = nombre
+    n = 2
+    # Sin distinguir mayusculas, como los sistemas de archivos de Windows y macOS
+    while candidato.lower() in usados:
+        candidato = f"{base} ({n}){ext}"
+        n += 1
+    usados.add(candidato.lower())
+    return candidato
+
+
+def _fecha(uploaded_at):
+    try:
+        fecha = datetime.strptime(uploaded_at, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return (1980, 1, 1, 0, 0, 0)
+    # El formato ZIP no representa fechas anteriores a 1980
+    return max(fecha.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _entradas(archivos, carpeta=""):
+    # En orden de subida: ante nombres repetidos, el primero queda sin sufijo
+    archivos = sorted(archivos, key=lambda a: (a["uploaded_at"] or "", a["id"]))
+    usados = set()
+    return [(carpeta + _unico(_limpiar(a["original_name"]), usados), a) for a in archivos]
+
+
+def exportacion_de_trabajo(trabajo_id):
+    """(titulo, entradas) para el ZIP de un trabajo, o None si no existe."""
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("SELECT titulo FROM trabajos WHERE id = ?", (trabajo_id,))
+    fila = cursor.fetchone()
+    conn.close()
+    if fila is None:
+        return None
+    return fila[0], _entradas(file_storage.get_task_files(trabajo_id))
+
+
+def exportacion_de_clase(clase_id):
+    """
+    (nombre, entradas) para el ZIP de una clase, con una carpeta por
+    trabajo, o None si la clase no existe.
+    """
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("SELECT nombre FROM clases WHERE id = ?", (clase_id,))
+    fila = cursor.fetchone()
+    conn.close()
+    if fila is None:
+        return None
+    carpetas = set()
+    entradas = []
+    for trabajo in file_storage.get_clase_files(clase_id):
+        if trabajo["archivos"]:
+            carpeta = _unico(_limpiar(trabajo["titulo"] or trabajo["trabajo_id"]), carpetas)
+            entradas.extend(_entradas(trabajo["archivos"], carpeta + "/"))
+    return fila[0], entradas
+
+
+def zip_en_tramos(entradas):
+    """
+    Genera los bytes del ZIP de entradas [(nombre en el zip, registro de
+    file_storage)]. Los archivos que ya no estan en el almacen se saltean.
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, "w", allowZip64=True) as zf:
+        for nombre, registro in entradas:
+            try:
+                f = open(file_storage.blob_path(registro["sha256"]), "rb")
+            except (OSError, TypeError):
+                log.warning("Archivo sin contenido en el almacen, no va en el zip",
+                            extra={"archivo_id": registro["id"]})
+                continue
+            with f:
+                info = zipfile.ZipInfo(nombre, _fecha(registro["uploaded_at"]))
+                info.external_attr = 0o644 << 16
+                # Con el tamano de antemano zipfile sabe si la entrada necesita ZIP64
+                info.file_size = os.fstat(f.fileno()).st_size
+                if ya_comprimido(nombre, registro["mime"]):
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with zf.open(info, "w") as destino:
+                    while True:
+                        bloque = f.read(file_storage.CHUNK_SIZE)
+                        if not bloque:
+                            break
+                        destino.write(bloque)
+                        datos = salida.vaciar()
+                        if datos:
+                            yield datos
+            # El data descriptor de la entrada
+            datos = salida.vaciar()
+            if datos:
+                yield datos
+    # El directorio central
+    yield salida.vaciar()
@@ -1,183 +1,473 @@
 """
 Module to handle file storage operations for tasks.
-Manages file uploads, storage links, and downloads.
+
+Uploaded content is stored once, by SHA-256, in a sharded directory:
+
+    uploads/blobs/ab/cd/abcd1234...   (first two bytes of the hash)
+
+Uploads are hashed while they are streamed to a staging file in
+uploads/tmp/, so a file is read only once. The `blobs` table keeps a
+reference count per hash; every row of `trabajos_archivos` is one
+reference. When 30 students upload the same handout there is one file on
+disk and 30 rows pointing at it; the blob is removed when the last row
+goes away.
+
+Blob files are created inside the write transaction that adds their
+reference, and removed only after the transaction that dropped the last
+reference commits, from a new write transaction that checks the row is
+still gone. Write transactions are serialized (BEGIN IMMEDIATE), also
+across processes, so an upload can never reuse a blob that a concurrent
+delete is about to unlink, and a rolled back delete keeps its files.
 """
 
+import hashlib
+import logging
+import mimetypes
 import os
+import shutil
 import tempfile
 from datetime import datetime
-from db import conectar, random_id
+
+from werkzeug.utils import secure_filename
+
+from db import al_confirmar, conectar, transaccion
+from ids import nuevo_id
+
+log = logging.getLogger(__name__)
 
 # Directory for persistent file storage
 STORAGE_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+CHUNK_SIZE = 1024 * 1024
 
-def create_file_storage_table():
-    """Create the trabajos_archivos table if it doesn't exist."""
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS trabajos_archivos (
-            id TEXT PRIMARY KEY,
-            trabajo_id TEXT NOT NULL,
-            filename TEXT NOT NULL,
-            filepath TEXT NOT NULL,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (trabajo_id) REFERENCES trabajos(id) ON DELETE CASCADE
-        )
-    """)
+# Metadata columns of trabajos_archivos, in the order _file_record reads them
+_COLUMNS = "a.id, a.filename, a.trabajo_id, a.uploaded_at, a.sha256, a.tamano, a.mime, a.nombre_original, a.subido_por"
+
+
+def _file_record(r):
+    return {
+        'id': r[0],
+        'filename': r[1],
+        'trabajo_id': r[2],
+        'uploaded_at': r[3],
+        'sha256': r[4],
+        'size': r[5],
+        'mime': r[6],
+        'original_name': r[7] or r[1],
+        'uploaded_by': r[8],
+    }
+
+
+def guess_mime(name, declared=None):
+    """MIME type from the file name; the client's Content-Type only as a fallback."""
+    mime = mimetypes.guess_type(name or '')[0]
+    if mime:
+        return mime
+    if declared and declared != 'application/octet-stream':
+        return declared
+    return 'application/octet-stream'
+
+
+def blob_relpath(sha256):
+    """Path of a blob relative to STORAGE_DIR (what trabajos_archivos.filepath stores)."""
+    return os.path.join('blobs', sha256[:2], sha256[2:4], sha256)
+
+
+def blob_path(sha256):
+    return os.path.join(STORAGE_DIR, blob_relpath(sha256))
+
+
+def staging_dir():
+    """Staging area; on the same filesystem as the blobs so moves are atomic."""
+    path = os.path.join(STORAGE_DIR, 'tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_staging(stream):
+    """
+    Copy a file-like object to a new staging file, hashing it on the way.
+
+    Returns:
+        tuple: (staging path, sha256 hex digest, size in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir())
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def hash_file(path):
+    """SHA-256 hex digest and size of a file on disk."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def add_blob_reference(cursor, sha256, size, staging_path=None):
+    """
+    Count one more reference to a blob. Must run inside transaccion().
+
+    If the blob is not on disk yet the staging file becomes the blob;
+    otherwise the staging file is discarded (the content was a duplicate).
+    """
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_trabajos_archivos_trabajo_id 
-        ON trabajos_archivos(trabajo_id)
-    """)
-    conn.commit()
-    conn.close()
+        INSERT INTO blobs (sha256, tamano, referencias, creado_en)
+        VALUES (?, ?, 1, ?)
+        ON CONFLICT (sha256) DO UPDATE SET referencias = referencias + 1
+    """, (sha256, size, datetime.now().isoformat()))
+    destino = blob_path(sha256)
+    if os.path.exists(destino):
+        if staging_path is not None:
+            os.unlink(staging_path)
+        return
+    if staging_path is None:
+        raise FileNotFoundError(destino)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    os.replace(staging_path, destino)
 
 
-def save_file_for_task(trabajo_id, file_obj):
+def _release_blobs(cursor, hashes):
+    """
+    Drop one reference per entry of hashes (a repeated hash drops several).
+    Must run inside transaccion(). Unreferenced blobs are deleted; their
+    files only once the transaction commits (see _unlink_unreferenced).
+    """
+    cuentas = {}
+    for sha256 in hashes:
+        if sha256:
+            cuentas[sha256] = cuentas.get(sha256, 0) + 1
+    if not cuentas:
+        return
+    cursor.executemany("""
+        UPDATE blobs SET referencias = referencias - ? WHERE sha256 = ?
+    """, [(n, sha256) for sha256, n in cuentas.items()])
+    marcadores = ",".join("?" * len(cuentas))
+    cursor.execute(f"""
+        DELETE FROM blobs WHERE sha256 IN ({marcadores}) AND referencias <= 0
+        RETURNING sha256
+    """, list(cuentas))
+    sin_referencias = [r[0] for r in cursor.fetchall()]
+    if sin_referencias:
+        # If the transaction rolls back the rows come back, so the files stay
+        al_confirmar(lambda: _unlink_unreferenced(sin_referencias))
+
+
+def _unlink_unreferenced(hashes):
+    """
+    Delete the files of blobs that lost their last reference. Runs after
+    the commit, in its own write transaction: an upload of the same
+    content that got in between re-created the row and keeps the file.
+    A crash before this runs leaves an orphan file, which the next upload
+    of that content adopts.
+    """
+    try:
+        with transaccion() as cursor:
+            for sha256 in hashes:
+                cursor.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,))
+                if cursor.fetchone():
+                    continue
+                try:
+                    os.unlink(blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+    except Exception:
+        log.exception("Error deleting unreferenced blobs", extra={"blobs": len(hashes)})
+
+
+def store_for_task(trabajo_id, staging_path, sha256, size, original_name, mime=None, uploaded_by=None):
+    """
+    Register an already hashed staging file as an attachment of a task.
+    The metadata (size, MIME type, hash, uploader, original name) is
+    saved with the row so listings never touch the blobs.
+
+    Returns:
+        dict: File record (see get_task_files)
+    """
+    original_name = (original_name or '')[:255]
+    nombre = secure_filename(original_name) or 'archivo'
+    file_id = nuevo_id()
+    # The id prefix keeps stored names unique, also within a task
+    filename = f"{file_id}_{nombre}"
+    mime = guess_mime(original_name, mime)
+    try:
+        with transaccion() as cursor:
+            cursor.execute(f"""
+                INSERT INTO trabajos_archivos
+                    (id, trabajo_id, filename, filepath, sha256, tamano, mime, nombre_original, subido_por)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING {_COLUMNS.replace('a.', '')}
+            """, (file_id, trabajo_id, filename, blob_relpath(sha256), sha256, size, mime,
+                  original_name or nombre, uploaded_by))
+            record = _file_record(cursor.fetchone())
+            add_blob_reference(cursor, sha256, size, staging_path)
+    except BaseException:
+        # If the blob was already moved into place it stays as an orphan
+        # file; the next upload of the same content adopts it
+        if os.path.exists(staging_path):
+            os.unlink(staging_path)
+        raise
+    return record
+
+
+def save_file_for_task(trabajo_id, file_obj, uploaded_by=None):
     """
     Save a file and associate it with a task.
-    
+
     Args:
         trabajo_id (str): ID of the task
         file_obj: FileStorage object from request.files
-    
+        uploaded_by (str): ID of the user who uploads it, if known
+
     Returns:
-        dict: File record with id, filename, and status
+        dict: File record (see store_for_task) or None on error
     """
     if not file_obj or file_obj.filename == '':
         return None
 
     try:
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        safe_filename = timestamp + os.path.basename(file_obj.filename)
-        filepath = os.path.join(STORAGE_DIR, safe_filename)
-
-        # Save file to disk
-        file_obj.save(filepath)
-
-        # Register in database
-        file_id = random_id('trabajos_archivos')
-        conn = conectar()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO trabajos_archivos (id, trabajo_id, filename, filepath)
-            VALUES (?, ?, ?, ?)
-        """, (file_id, trabajo_id, safe_filename, filepath))
-        conn.commit()
-        conn.close()
-
-        return {
-            'id': file_id,
-            'filename': safe_filename,
-            'trabajo_id': trabajo_id,
-            'status': 'ok'
-        }
-    except Exception as e:
-        print(f"Error saving file for task {trabajo_id}: {e}")
+        staging_path, sha256, size = write_staging(file_obj.stream)
+        return store_for_task(trabajo_id, staging_path, sha256, size, file_obj.filename,
+                              file_obj.mimetype, uploaded_by)
+    except Exception:
+        log.exception("Error saving file for task", extra={"trabajo_id": trabajo_id})
         return None
 
 
 def get_task_files(trabajo_id):
     """
     Get all files associated with a task.
-    
+
     Args:
         trabajo_id (str): ID of the task
-    
+
     Returns:
         list: List of file records
     """
     try:
         conn = conectar()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, filename, trabajo_id, uploaded_at
-            FROM trabajos_archivos
-            WHERE trabajo_id = ?
-            ORDER BY uploaded_at DESC
+        cursor.execute(f"""
+            SELECT {_COLUMNS}
+            FROM trabajos_archivos a
+            WHERE a.trabajo_id = ?
+            ORDER BY a.uploaded_at DESC
         """, (trabajo_id,))
         rows = cursor.fetchall()
         conn.close()
 
-        files = [
-            {
-                'id': r[0],
-                'filename': r[1],
-                'trabajo_id': r[2],
-                'uploaded_at': r[3]
-            }
-            for r in rows
-        ]
-        return files
-    except Exception as e:
-        print(f"Error fetching files for task {trabajo_id}: {e}")
+        return [_file_record(r) for r in rows]
+    except Exception:
+        log.exception("Error fetching files for task", extra={"trabajo_id": trabajo_id})
         return []
 
 
-def get_file_path(filename):
+def get_file_path(filename, trabajo_id=None):
     """
     Get the full file path for a given filename.
-    
+
     Args:
         filename (str): Name of the file (as stored in DB)
-    
+        trabajo_id (str): Only look in this task's files
+
     Returns:
         str: Full path to file or None if not found
     """
+    record = get_file_record(filename, trabajo_id)
+    return blob_path(record['sha256']) if record and record['sha256'] else None
+
+
+def get_file_record(filename, trabajo_id=None):
+    """
+    Get the metadata of a stored file (see get_task_files).
+
+    Args:
+        filename (str): Name of the file (as stored in DB)
+        trabajo_id (str): Only look in this task's files
+
+    Returns:
+        dict: File record or None if not found
+    """
     try:
         conn = conectar()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT filepath FROM trabajos_archivos WHERE filename = ?
-        """, (filename,))
+        if trabajo_id is None:
+            cursor.execute(f"""
+                SELECT {_COLUMNS} FROM trabajos_archivos a WHERE a.filename = ?
+            """, (filename,))
+        else:
+            cursor.execute(f"""
+                SELECT {_COLUMNS} FROM trabajos_archivos a WHERE a.filename = ? AND a.trabajo_id = ?
+            """, (filename, trabajo_id))
         row = cursor.fetchone()
         conn.close()
 
-        if row:
-            return row[0]
-        return None
-    except Exception as e:
-        print(f"Error getting file path for {filename}: {e}")
+        return _file_record(row) if row else None
+    except Exception:
+        log.exception("Error getting file record", extra={"filename": filename})
         return None
 
 
+def get_clase_files(clase_id):
+    """
+    Get every task of a class with its files, in a single query.
+
+    Args:
+        clase_id (str): ID of the class
+
+    Returns:
+        list: [{trabajo_id, titulo, archivos: [file records]}], tasks
+        without files included
+    """
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT t.id, t.titulo, {_COLUMNS}
+        FROM trabajos t
+        LEFT JOIN trabajos_archivos a ON a.trabajo_id = t.id
+        WHERE t.clase_id = ?
+        ORDER BY t.id, a.uploaded_at DESC
+    """, (clase_id,))
+    rows = cursor.fetchall()
+    conn.close()
+
+    trabajos = {}
+    for r in rows:
+        trabajo = trabajos.get(r[0])
+        if trabajo is None:
+            trabajo = trabajos[r[0]] = {'trabajo_id': r[0], 'titulo': r[1], 'archivos': []}
+        if r[2] is not None:
+            trabajo['archivos'].append(_file_record(r[2:]))
+    return list(trabajos.values())
+
+
+def backfill_metadata(cursor):
+    """
+    Fill size, MIME type and original name of rows saved before those
+    columns existed. Runs from a migration.
+    """
+    cursor.execute("""
+        SELECT a.id, a.filename, b.tamano
+        FROM trabajos_archivos a
+        LEFT JOIN blobs b ON b.sha256 = a.sha256
+        WHERE a.mime IS NULL
+    """)
+    cursor.executemany("""
+        UPDATE trabajos_archivos SET tamano = ?, mime = ?, nombre_original = ? WHERE id = ?
+    """, [(tamano, guess_mime(filename), filename, file_id)
+          for file_id, filename, tamano in cursor.fetchall()])
+
+
 def delete_file_from_task(file_id):
     """
-    Delete a file from a task and the file system.
-    
+    Delete a file from a task; the blob goes away with its last reference.
+
     Args:
         file_id (str): ID of the file record
-    
+
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-        
-        # Get file path before deletion
-        cursor.execute("SELECT filepath FROM trabajos_archivos WHERE id = ?", (file_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            conn.close()
-            return False
-        
-        filepath = row[0]
-        
-        # Delete from database
-        cursor.execute("DELETE FROM trabajos_archivos WHERE id = ?", (file_id,))
-        conn.commit()
-        conn.close()
-
-        # Delete from filesystem
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        
+        with transaccion() as cursor:
+            cursor.execute("""
+                DELETE FROM trabajos_archivos WHERE id = ? RETURNING sha256
+            """, (file_id,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+            _release_blobs(cursor, [row[0]])
         return True
-    except Exception as e:
-        print(f"Error deleting file {file_id}: {e}")
+    except Exception:
+        log.exception("Error deleting file", extra={"file_id": file_id})
         return False
+
+
+def delete_files_for_clase(cursor, clase_id):
+    """
+    Delete the attachments of every task of a class. Used by
+    clases.eliminar_clase inside its transaction.
+    """
+    cursor.execute("""
+        DELETE FROM trabajos_archivos
+        WHERE trabajo_id IN (SELECT id FROM trabajos WHERE clase_id = ?)
+        RETURNING sha256
+    """, (clase_id,))
+    _release_blobs(cursor, [r[0] for r in cursor.fetchall()])
+
+
+def _adopt_legacy_file(cursor, path):
+    # Hard link into the blob store (no copy, same inode); the original
+    # stays where it was so a failed migration loses nothing
+    sha256, size = hash_file(path)
+    staging = None
+    if not os.path.exists(blob_path(sha256)):
+        staging = os.path.join(staging_dir(), f"legacy_{nuevo_id()}")
+        try:
+            os.link(path, staging)
+        except OSError:
+            shutil.copyfile(path, staging)
+    add_blob_reference(cursor, sha256, size, staging)
+    return sha256
+
+
+def import_legacy_files(cursor):
+    """
+    Move files written by the old storage code into the blob store: rows
+    of trabajos_archivos without a hash (flat uploads/ dir) and the
+    uploads/trabajos/<trabajo_id>/<name> folders that were never in the
+    DB. Runs from a migration. Returns how many files were adopted.
+    """
+    adoptados = 0
+    cursor.execute("SELECT id, filepath FROM trabajos_archivos WHERE sha256 IS NULL")
+    for file_id, filepath in cursor.fetchall():
+        path = filepath if os.path.isabs(filepath) else os.path.join(STORAGE_DIR, filepath)
+        if not os.path.isfile(path):
+            continue
+        sha256 = _adopt_legacy_file(cursor, path)
+        cursor.execute("""
+            UPDATE trabajos_archivos SET sha256 = ?, filepath = ? WHERE id = ?
+        """, (sha256, blob_relpath(sha256), file_id))
+        adoptados += 1
+
+    carpeta = os.path.join(STORAGE_DIR, 'trabajos')
+    if not os.path.isdir(carpeta):
+        return adoptados
+    for trabajo_id in os.listdir(carpeta):
+        cursor.execute("SELECT 1 FROM trabajos WHERE id = ?", (trabajo_id,))
+        if not cursor.fetchone():
+            continue
+        dir_path = os.path.join(carpeta, trabajo_id)
+        for filename in sorted(os.listdir(dir_path)):
+            path = os.path.join(dir_path, filename)
+            if filename.startswith('.') or not os.path.isfile(path):
+                continue
+            # The old URLs (/api/uploads/trabajos/<id>/<name>) keep working
+            sha256 = _adopt_legacy_file(cursor, path)
+            cursor.execute("""
+                INSERT INTO trabajos_archivos (id, trabajo_id, filename, filepath, uploaded_at, sha256)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (nuevo_id(), trabajo_id, filename, blob_relpath(sha256),
+                  datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S'), sha256))
+            adoptados += 1
+    return adoptados
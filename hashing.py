@@ -0,0 +1,194 @@
+"""
+Hash y verificacion de contraseñas (bcrypt) fuera del hilo del request.
+
+bcrypt tarda cientos de milisegundos por llamada; corrido inline frena el
+event loop de eventlet/socketio y con el el chat y la señalizacion. Aca se
+mandan a un pool de procesos dedicado con una cola acotada: si ya hay
+HASH_MAX_PENDIENTES trabajos esperando se rechaza enseguida con
+PoolSaturado (la app responde 503) en vez de encolar sin limite.
+
+Cada trabajo ocupa un cupo hasta que termina en el pool, aunque el request
+deje de esperarlo por timeout; asi el limite vale tambien bajo carga. Si
+un worker muere (por ejemplo lo mata el OOM killer) el pool queda roto:
+se crea uno nuevo y el trabajo se reintenta una vez.
+
+Variables de entorno:
+    HASH_WORKERS          procesos del pool (0 = correr inline, util en desarrollo)
+    HASH_MAX_PENDIENTES   trabajos en vuelo permitidos antes de rechazar
+    HASH_TIMEOUT          segundos maximos esperando un resultado
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+import metricas
+
+log = logging.getLogger(__name__)
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", str(HASH_WORKERS * 8 or 8)))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "10"))
+
+
+class PoolSaturado(Exception):
+    """El pool de hashing tiene la cola llena."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(HASH_MAX_PENDIENTES)
+_en_vuelo_lock = threading.Lock()
+_en_vuelo = 0
+
+bcrypt_computo = metricas.Histograma(
+    "learned_bcrypt_computo_segundos", "Tiempo de bcrypt en el worker.", ("operacion",))
+bcrypt_espera = metricas.Histograma(
+    "learned_bcrypt_espera_segundos", "Espera en la cola del pool de hashing.", ("operacion",))
+bcrypt_rechazados = metricas.Contador(
+    "learned_bcrypt_rechazados_total", "Hashes rechazados por pool saturado o timeout.")
+bcrypt_en_vuelo = metricas.Medidor(
+    "learned_bcrypt_en_vuelo", "Trabajos de hashing en curso o en cola.",
+    funcion=lambda: _en_vuelo)
+
+
+def _hashear(password):
+    inicio = time.perf_counter()
+    resultado = bcrypt.hashpw(password, bcrypt.gensalt())
+    return resultado, time.perf_counter() - inicio
+
+
+def _verificar(password, password_hash):
+    inicio = time.perf_counter()
+    resultado = bcrypt.checkpw(password, password_hash)
+    return resultado, time.perf_counter() - inicio
+
+
+def _noop():
+    return None, 0.0
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _pool
+
+
+def iniciar():
+    """
+    Levanta los procesos del pool. Conviene llamarlo al arrancar, antes de
+    que existan otros hilos, para no hacer fork desde un proceso ocupado.
+    """
+    if HASH_WORKERS <= 0:
+        return
+    pool = _obtener_pool()
+    for futuro in [pool.submit(_noop) for _ in range(HASH_WORKERS)]:
+        futuro.result()
+
+
+def _reiniciar_pool(roto):
+    """Reemplaza un pool roto; varios hilos pueden verlo roto a la vez."""
+    global _pool
+    with _pool_lock:
+        if _pool is not roto:
+            return
+        _pool = None
+    log.warning("Se murio un worker del pool de hashing; se crea un pool nuevo")
+    roto.shutdown(wait=False, cancel_futures=True)
+
+
+def _rechazar():
+    bcrypt_rechazados.inc()
+    raise PoolSaturado()
+
+
+def _tomar_cupo():
+    global _en_vuelo
+    if not _cupos.acquire(blocking=False):
+        _rechazar()
+    with _en_vuelo_lock:
+        _en_vuelo += 1
+
+
+def _liberar_cupo(_futuro=None):
+    global _en_vuelo
+    _cupos.release()
+    with _en_vuelo_lock:
+        _en_vuelo -= 1
+
+
+def _esperar(pool, fn, args):
+    _tomar_cupo()
+    try:
+        futuro = pool.submit(fn, *args)
+    except BaseException:
+        _liberar_cupo()
+        raise
+    # El cupo se libera cuando el trabajo termina en el pool, no cuando el
+    # request deja de esperarlo
+    futuro.add_done_callback(_liberar_cupo)
+    try:
+        return futuro.result(timeout=HASH_TIMEOUT)
+    except TimeoutError:
+        _rechazar()
+
+
+def _en_pool(fn, args):
+    for intento in range(2):
+        pool = _obtener_pool()
+        try:
+            return _esperar(pool, fn, args)
+        except BrokenProcessPool:
+            if intento:
+                raise
+            _reiniciar_pool(pool)
+
+
+def _ejecutar(fn, *args):
+    enviado = time.perf_counter()
+    if HASH_WORKERS <= 0:
+        _tomar_cupo()
+        try:
+            resultado, computo = fn(*args)
+        finally:
+            _liberar_cupo()
+    else:
+        resultado, computo = _en_pool(fn, args)
+    total = time.perf_counter() - enviado
+    operacion = "hashear" if fn is _hashear else "verificar"
+    bcrypt_computo.observar(computo, operacion=operacion)
+    bcrypt_espera.observar(max(0.0, total - computo), operacion=operacion)
+    return resultado
+
+
+def hashear(password):
+    """Devuelve el hash bcrypt (bytes) de la contraseña."""
+    return _ejecutar(_hashear, password.encode())
+
+
+def verificar(password, password_hash):
+    """True si la contraseña coincide con el hash guardado."""
+    return _ejecutar(_verificar, password.encode(), password_hash)
+
+
+def estadisticas():
+    """Contadores y percentiles de espera en cola y computo, leidos de los histogramas."""
+    return {
+        "workers": HASH_WORKERS,
+        "max_pendientes": HASH_MAX_PENDIENTES,
+        "en_vuelo": _en_vuelo,
+        "completados": bcrypt_computo.total(),
+        "rechazados": bcrypt_rechazados.valor(),
+        "espera_ms_p50": metricas.milisegundos(bcrypt_espera.cuantil(0.5)),
+        "espera_ms_p95": metricas.milisegundos(bcrypt_espera.cuantil(0.95)),
+        "computo_ms_p50": metricas.milisegundos(bcrypt_computo.cuantil(0.5)),
+        "computo_ms_p95": metricas.milisegundos(bcrypt_computo.cuantil(0.95)),
+    }
@@ -0,0 +1,71 @@
+"""
+Generador de IDs ordenables por tiempo (estilo ULID).
+
+Cada ID tiene 26 caracteres en base32 de Crockford (en minusculas):
+48 bits de milisegundos desde epoch + 80 bits de azar. No consulta la
+base de datos: 80 bits aleatorios hacen despreciable la chance de
+colision, y como los IDs crecen con el tiempo los INSERT caen al final
+del B-tree en vez de repartirse por todo el indice.
+Dentro del mismo milisegundo el azar se incrementa, asi que los IDs de
+un mismo proceso son estrictamente crecientes.
+"""
+
+import secrets
+import threading
+import time
+
+_ALFABETO = "0123456789abcdefghjkmnpqrstvwxyz"
+_BITS_AZAR = 80
+_MAX_AZAR = (1 << _BITS_AZAR) - 1
+
+_lock = threading.Lock()
+_ultimo_ms = 0
+_ultimo_azar = 0
+
+
+def _codificar(valor):
+    chars = []
+    for _ in range(26):
+        chars.append(_ALFABETO[valor & 31])
+        valor >>= 5
+    return "".join(reversed(chars))
+
+
+def allocate(n):
+    """Devuelve una lista de n IDs nuevos, en orden creciente."""
+    global _ultimo_ms, _ultimo_azar
+    if n <= 0:
+        return []
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _ultimo_ms:
+            azar = secrets.randbits(_BITS_AZAR)
+            # dejar lugar para n incrementos sin desbordar
+            if azar > _MAX_AZAR - n:
+                azar >>= 1
+        else:
+            ms = _ultimo_ms
+            azar = _ultimo_azar + 1
+        ids = []
+        for _ in range(n):
+            if azar > _MAX_AZAR:
+                ms += 1
+                azar = secrets.randbits(_BITS_AZAR - 1)
+            ids.append(_codificar((ms << _BITS_AZAR) | azar))
+            azar += 1
+        _ultimo_ms = ms
+        _ultimo_azar = azar - 1
+    return ids
+
+
+def nuevo_id():
+    """Devuelve un ID nuevo."""
+    return allocate(1)[0]
+
+
+def timestamp_de(id_):
+    """Milisegundos desde epoch codificados en un ID."""
+    valor = 0
+    for c in id_[:10]:
+        valor = (valor << 5) | _ALFABETO.index(c)
+    return valor
@@ -1,4 +1,3 @@
-import bcrypt
 import re
 from usuarios import login_usuario, registrar_usuario
 
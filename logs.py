@@ -0,0 +1,61 @@
+"""
+Configuracion de logging de la app.
+
+Los modulos usan logging.getLogger(__name__) y pasan los datos del evento
+en extra= (usuario_id, sid, clase_id...); asi el texto es fijo y los
+campos se pueden filtrar.
+
+Variables de entorno:
+    LOG_LEVEL     DEBUG, INFO, WARNING... (por defecto INFO; los mensajes
+                  por conexion/request van en DEBUG)
+    LOG_FORMATO   texto (por defecto) o json, una linea por evento
+"""
+
+import json
+import logging
+import os
+import time
+
+# Atributos que trae todo LogRecord; lo demas vino en extra=
+_ESTANDAR = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extra(record):
+    return {k: v for k, v in vars(record).items() if k not in _ESTANDAR}
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        linea = super().format(record)
+        campos = _extra(record)
+        if campos:
+            linea += " " + " ".join(f"{k}={v}" for k, v in campos.items())
+        return linea
+
+
+class FormatoJson(logging.Formatter):
+    def format(self, record):
+        datos = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        datos.update(_extra(record))
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(datos, default=str, ensure_ascii=False)
+
+
+def configurar(nivel=None, formato=None):
+    """Configura el logger raiz segun LOG_LEVEL y LOG_FORMATO."""
+    nivel = (nivel or os.getenv("LOG_LEVEL", "INFO")).upper()
+    formato = formato or os.getenv("LOG_FORMATO", "texto")
+    handler = logging.StreamHandler()
+    handler.setFormatter(FormatoJson() if formato == "json" else FormatoTexto())
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [handler]
+    raiz.setLevel(nivel)
@@ -0,0 +1,193 @@
+"""
+Historial persistente del chat por clase.
+
+Los mensajes no se escriben en la DB desde el handler del socket: guardar()
+les asigna id y fecha, los deja en un buffer en memoria y vuelve enseguida.
+Un hilo escritor vacia el buffer en una sola transaccion cada
+CHAT_INTERVALO_MS milisegundos, o antes si se juntan CHAT_LOTE mensajes, asi
+el camino caliente del chat nunca espera un fsync.
+
+Mientras un mensaje esta en el buffer listar_por_clase() lo mezcla con lo
+que ya esta en la DB, para que el historial no tenga huecos.
+
+Variables de entorno:
+    CHAT_LOTE          mensajes que disparan una escritura inmediata
+    CHAT_INTERVALO_MS  espera maxima antes de escribir lo acumulado
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from db import conectar, transaccion
+from ids import nuevo_id
+
+log = logging.getLogger(__name__)
+
+LOTE = int(os.getenv("CHAT_LOTE", "200"))
+INTERVALO_MS = float(os.getenv("CHAT_INTERVALO_MS", "20"))
+
+_INSERT = """
+    INSERT INTO mensajes_chat (id, clase_id, usuario_id, texto, enviado_en)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+class EscritorChat(threading.Thread):
+    def __init__(self, lote=LOTE, intervalo_ms=INTERVALO_MS):
+        super().__init__(name="escritor-chat", daemon=True)
+        self.lote = lote
+        self.intervalo = intervalo_ms / 1000
+        self._pendientes = []
+        # Lote que se esta escribiendo: sigue visible para listar_por_clase
+        self._en_vuelo = []
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+        self._evento = threading.Event()
+        self._detener = threading.Event()
+        self.guardados = 0
+        self.descartados = 0
+        self.escrituras = 0
+
+    def agregar(self, fila):
+        with self._lock:
+            self._pendientes.append(fila)
+            lleno = len(self._pendientes) >= self.lote
+        if lleno:
+            self._evento.set()
+
+    def sin_guardar(self, clase_id):
+        """Filas de la clase que todavia no llegaron a la DB."""
+        with self._lock:
+            return [f for f in self._en_vuelo + self._pendientes if f[1] == clase_id]
+
+    def detener(self):
+        self._detener.set()
+        self._evento.set()
+
+    def run(self):
+        while not self._detener.is_set():
+            self._evento.wait(timeout=self.intervalo)
+            self._evento.clear()
+            try:
+                self.vaciar()
+            except Exception:
+                log.exception("Error guardando mensajes de chat")
+        self.vaciar()
+
+    def vaciar(self):
+        """Escribe todo lo acumulado. Devuelve cuantos mensajes se guardaron."""
+        with self._escritura:
+            with self._lock:
+                if not self._pendientes:
+                    return 0
+                lote, self._pendientes = self._pendientes, []
+                self._en_vuelo = lote
+            try:
+                guardados = self._escribir(lote)
+            except sqlite3.OperationalError:
+                # DB ocupada: se reintenta en la proxima vuelta sin perder el orden
+                with self._lock:
+                    self._pendientes = lote + self._pendientes
+                raise
+            finally:
+                with self._lock:
+                    self._en_vuelo = []
+            self.escrituras += 1
+            self.guardados += guardados
+            self.descartados += len(lote) - guardados
+            return guardados
+
+    def _escribir(self, lote):
+        try:
+            with transaccion() as cursor:
+                cursor.executemany(_INSERT, lote)
+            return len(lote)
+        except sqlite3.IntegrityError:
+            pass
+        # Algun mensaje apunta a una clase o usuario que ya no existe: se
+        # guardan los demas de a uno y se descartan solo los invalidos
+        guardados = 0
+        with transaccion() as cursor:
+            for fila in lote:
+                try:
+                    cursor.execute(_INSERT, fila)
+                    guardados += 1
+                except sqlite3.IntegrityError as e:
+                    log.warning("Mensaje de chat descartado", extra={"mensaje_id": fila[0], "error": str(e)})
+        return guardados
+
+
+_escritor = None
+
+
+def iniciar_escritor(**config):
+    """Arranca el hilo escritor (una vez por proceso) y lo devuelve."""
+    global _escritor
+    if _escritor is None:
+        _escritor = EscritorChat(**config)
+        _escritor.start()
+        atexit.register(detener_escritor)
+    return _escritor
+
+
+def detener_escritor():
+    """Detiene el escritor despues de guardar lo que quede en el buffer."""
+    global _escritor
+    if _escritor is not None:
+        _escritor.detener()
+        _escritor.join(timeout=5)
+        _escritor = None
+
+
+def guardar(clase_id, usuario_id, texto):
+    """
+    Registra el mensaje y devuelve (id, enviado_en). Con el escritor en
+    marcha solo lo encola; sin el (scripts, tests) lo inserta enseguida.
+    """
+    fila = (nuevo_id(), clase_id, usuario_id, texto, datetime.now().isoformat())
+    if _escritor is not None:
+        _escritor.agregar(fila)
+    else:
+        with transaccion() as cursor:
+            cursor.execute(_INSERT, fila)
+    return fila[0], fila[4]
+
+
+def listar_por_clase(clase_id, limite=50, despues_de=None):
+    """
+    Mensajes de la clase del mas nuevo al mas viejo. despues_de es el par
+    (enviado_en, mensaje_id) del ultimo mensaje ya entregado.
+    Devuelve filas (id, clase_id, usuario_id, texto, enviado_en).
+    """
+    condiciones = ["clase_id = ?"]
+    parametros = [clase_id]
+    if despues_de:
+        condiciones.append("(enviado_en, id) < (?, ?)")
+        parametros.extend(despues_de)
+    # La foto del buffer se toma antes de consultar: un lote que se escriba
+    # en el medio aparece en la consulta (y se descarta el duplicado)
+    pendientes = _escritor.sin_guardar(clase_id) if _escritor is not None else []
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id, clase_id, usuario_id, texto, enviado_en
+        FROM mensajes_chat
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY enviado_en DESC, id DESC
+        LIMIT ?
+    """, parametros + [limite])
+    filas = cursor.fetchall()
+    conn.close()
+
+    if despues_de:
+        pendientes = [f for f in pendientes if (f[4], f[0]) < tuple(despues_de)]
+    if pendientes:
+        vistos = {f[0] for f in filas}
+        filas += [f for f in pendientes if f[0] not in vistos]
+        filas.sort(key=lambda f: (f[4], f[0]), reverse=True)
+        filas = filas[:limite]
+    return filas
@@ -0,0 +1,291 @@
+"""
+Metricas en formato de texto de Prometheus, sin dependencias.
+
+Cada metrica se registra una vez por proceso (por nombre) y exponer()
+devuelve el texto que sirve /metrics. Los valores se guardan por
+combinacion de etiquetas; conviene usar etiquetas de pocos valores
+(la regla de la ruta y no la URL, el evento y no la sid).
+
+Contador y Medidor aceptan funcion=: el valor se lee al exponer, util
+para estadisticas que otro modulo ya lleva (cache, registro de sockets).
+La funcion devuelve un numero o un dict {(valores de etiquetas): numero}.
+
+Para leer los valores desde el propio proceso (benchmarks, estadisticas)
+estan valor() en Contador y Medidor y total() y cuantil() en Histograma;
+las etiquetas que no se pasan se suman.
+
+init_app(app) agrega la latencia de cada request por endpoint y cuantas
+consultas SQL hizo y cuanto tardaron (via db.registrar_medidor).
+"""
+
+import functools
+import threading
+import time
+
+from flask import request
+
+import db
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registro = {}
+_registro_lock = threading.Lock()
+# Consultas del request en curso (threading.local es por greenlet con eventlet)
+_local = threading.local()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formato(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self._valores = {}
+        self._lock = threading.Lock()
+        with _registro_lock:
+            _registro[nombre] = self
+
+    def _clave(self, etiquetas):
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def _filtrar(self, series, etiquetas):
+        """Las series cuyas etiquetas coinciden con las dadas (el resto da igual)."""
+        buscadas = {self.etiquetas.index(n): str(v) for n, v in etiquetas.items()}
+        return [valor for clave, valor in series
+                if all(clave[i] == v for i, v in buscadas.items())]
+
+    def valor(self, **etiquetas):
+        """Suma de las series que coinciden con las etiquetas dadas."""
+        return sum(self._filtrar(self._muestras(), etiquetas))
+
+    def _muestras(self):
+        if self.funcion is None:
+            with self._lock:
+                return list(self._valores.items())
+        valor = self.funcion()
+        if isinstance(valor, dict):
+            return [(tuple(str(v) for v in clave), n) for clave, n in valor.items() if n is not None]
+        return [] if valor is None else [((), valor)]
+
+    def lineas(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        for clave, valor in self._muestras():
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_formato(valor)}"
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+    def set(self, valor, **etiquetas):
+        with self._lock:
+            self._valores[self._clave(etiquetas)] = valor
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                # conteos por bucket (no acumulados), suma y total
+                serie = self._valores[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def _sumar(self, etiquetas):
+        with self._lock:
+            series = [(clave, (list(conteos), total)) for clave, (conteos, _, total) in self._valores.items()]
+        conteos, total = [0] * len(self.buckets), 0
+        for parciales, n in self._filtrar(series, etiquetas):
+            conteos = [a + b for a, b in zip(conteos, parciales)]
+            total += n
+        return conteos, total
+
+    def valor(self, **etiquetas):
+        raise TypeError("Un histograma no tiene un valor; usar total() o cuantil()")
+
+    def total(self, **etiquetas):
+        """Cantidad de observaciones de las series que coinciden."""
+        return self._sumar(etiquetas)[1]
+
+    def cuantil(self, q, **etiquetas):
+        """
+        Estimacion del cuantil q (0 a 1) a partir de los buckets, interpolando
+        dentro del bucket como histogram_quantile de Prometheus. None sin
+        observaciones; por encima del ultimo bucket devuelve su limite.
+        """
+        conteos, total = self._sumar(etiquetas)
+        if not total:
+            return None
+        rango = q * total
+        acumulado, inferior = 0, 0.0
+        for limite, conteo in zip(self.buckets, conteos):
+            if conteo and acumulado + conteo >= rango:
+                return inferior + (limite - inferior) * (rango - acumulado) / conteo
+            acumulado += conteo
+            inferior = limite
+        return float(self.buckets[-1])
+
+    def lineas(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        with self._lock:
+            series = [(clave, list(conteos), suma, total) for clave, (conteos, suma, total) in self._valores.items()]
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, [('le', _formato(float(limite)))])} {acumulado}"
+            yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, [('le', '+Inf')])} {total}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_formato(suma)}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}"
+
+
+def milisegundos(segundos):
+    """Segundos (o None) a milisegundos redondeados, para reportes legibles."""
+    return None if segundos is None else round(segundos * 1000, 3)
+
+
+def exponer():
+    """Todas las metricas registradas en formato de texto de Prometheus."""
+    with _registro_lock:
+        metricas = list(_registro.values())
+    lineas = []
+    for metrica in metricas:
+        try:
+            lineas.extend(metrica.lineas())
+        except Exception:
+            # una funcion que falla (p. ej. Redis caido) no tira el resto
+            continue
+    return "\n".join(lineas) + "\n"
+
+
+http_duracion = Histograma(
+    "learned_http_duracion_segundos", "Latencia de los requests HTTP por endpoint.",
+    ("endpoint", "metodo", "estado"))
+http_consultas = Histograma(
+    "learned_http_consultas_sql", "Consultas SQL ejecutadas por request.",
+    ("endpoint",), buckets=BUCKETS_CONSULTAS)
+http_sql = Histograma(
+    "learned_http_sql_segundos", "Tiempo total en SQL por request.", ("endpoint",))
+sql_duracion = Histograma(
+    "learned_sql_duracion_segundos", "Duracion de cada sentencia SQL (execute, sin el fetch).",
+    ("operacion",))
+socketio_eventos = Contador(
+    "learned_socketio_eventos_total", "Eventos de Socket.IO recibidos por resultado.",
+    ("evento", "resultado"))
+socketio_conectados = Medidor(
+    "learned_socketio_clientes_conectados", "Conexiones de Socket.IO abiertas en este proceso.")
+socketio_duracion = Histograma(
+    "learned_socketio_duracion_segundos", "Duracion de los manejadores de eventos de Socket.IO.",
+    ("evento",))
+
+_OPERACIONES = {"select", "insert", "update", "delete", "begin", "commit", "rollback", "pragma"}
+
+
+def _operacion(sentencia):
+    partes = sentencia.lstrip().split(None, 1)
+    operacion = partes[0].lower() if partes else ""
+    return operacion if operacion in _OPERACIONES else "otra"
+
+
+def _medir_sql(sentencia, segundos):
+    sql_duracion.observar(segundos, operacion=_operacion(sentencia))
+    cuenta = getattr(_local, "sql", None)
+    if cuenta is not None:
+        cuenta[0] += 1
+        cuenta[1] += segundos
+
+
+def medir_evento(evento):
+    """
+    Decorador para manejadores de Socket.IO: cuenta cada evento y mide su
+    duracion. Un dict con "error" como respuesta cuenta como error.
+    """
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            resultado = "excepcion"
+            try:
+                respuesta = fn(*args, **kwargs)
+                resultado = "error" if isinstance(respuesta, dict) and "error" in respuesta else "ok"
+                return respuesta
+            finally:
+                socketio_eventos.inc(evento=evento, resultado=resultado)
+                socketio_duracion.observar(time.perf_counter() - inicio, evento=evento)
+        return envoltura
+    return decorador
+
+
+def init_app(app):
+    """Mide cada request de Flask (latencia y SQL) por regla de ruta."""
+    db.registrar_medidor(_medir_sql)
+
+    @app.before_request
+    def _iniciar_medicion():
+        _local.inicio = time.perf_counter()
+        _local.sql = [0, 0.0]
+
+    @app.after_request
+    def _terminar_medicion(respuesta):
+        inicio = getattr(_local, "inicio", None)
+        if inicio is None:
+            return respuesta
+        consultas, segundos_sql = _local.sql
+        _local.inicio = _local.sql = None
+        endpoint = request.url_rule.rule if request.url_rule is not None else "sin_ruta"
+        http_duracion.observar(time.perf_counter() - inicio, endpoint=endpoint,
+                               metodo=request.method, estado=respuesta.status_code)
+        http_consultas.observar(consultas, endpoint=endpoint)
+        http_sql.observar(segundos_sql, endpoint=endpoint)
+        return respuesta
@@ -0,0 +1,449 @@
+"""
+Migraciones versionadas del esquema.
+
+Cada migracion tiene un numero de version, una descripcion y una lista de
+pasos (sentencias SQL o funciones que reciben el cursor). migrar() aplica
+en orden, cada una en su propia transaccion, solo las versiones que todavia
+no figuran en la tabla schema_version. Para cambiar el esquema se agrega una
+migracion nueva al final de MIGRACIONES; nunca se edita una ya publicada.
+
+    python -m migraciones     # aplica lo pendiente y muestra los planes de consulta
+"""
+
+import logging
+import os
+from datetime import datetime
+from db import conectar, transaccion, SCHEMA_PATH
+
+log = logging.getLogger(__name__)
+
+
+def _schema_legacy(cursor):
+    # Una base nueva se sigue creando con db/schema.sql si el archivo existe
+    if not os.path.exists(SCHEMA_PATH):
+        return
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usuarios'")
+    if cursor.fetchone():
+        return
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        sentencias = f.read().split(";")
+    for sentencia in sentencias:
+        if sentencia.strip():
+            cursor.execute(sentencia)
+
+
+def _indice_email(cursor):
+    # Solo se puede exigir unicidad si no hay emails repetidos cargados
+    cursor.execute("""
+        SELECT 1 FROM usuarios GROUP BY email HAVING COUNT(*) > 1 LIMIT 1
+    """)
+    if cursor.fetchone():
+        log.warning("Hay emails repetidos en usuarios; se crea un indice no unico")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_email ON usuarios(email)")
+    else:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_usuarios_email ON usuarios(email)")
+
+
+def _importar_archivos(cursor):
+    # Import diferido: file_storage crea la carpeta uploads al importarse
+    import file_storage
+    adoptados = file_storage.import_legacy_files(cursor)
+    if adoptados:
+        log.info("Archivos viejos pasados al almacen por hash; las copias originales se pueden borrar",
+                 extra={"adoptados": adoptados, "directorio": file_storage.STORAGE_DIR})
+
+
+def _metadatos_archivos(cursor):
+    import file_storage
+    file_storage.backfill_metadata(cursor)
+
+
+MIGRACIONES = [
+    (1, "esquema base", [
+        _schema_legacy,
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id TEXT PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            email TEXT NOT NULL,
+            password_hash BLOB NOT NULL,
+            rol TEXT NOT NULL,
+            creado_en DATETIME
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS clases (
+            id TEXT PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            descripcion TEXT,
+            profesor_id TEXT,
+            creado_en DATETIME,
+            FOREIGN KEY (profesor_id) REFERENCES usuarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS participaciones (
+            id TEXT PRIMARY KEY,
+            usuario_id TEXT NOT NULL,
+            clase_id TEXT NOT NULL,
+            unido_en DATETIME,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
+            FOREIGN KEY (clase_id) REFERENCES clases(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id TEXT PRIMARY KEY,
+            titulo TEXT NOT NULL,
+            descripcion TEXT,
+            clase_id TEXT NOT NULL,
+            FOREIGN KEY (clase_id) REFERENCES clases(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trabajos_alumnos (
+            id TEXT PRIMARY KEY,
+            trabajo_id TEXT NOT NULL,
+            alumno_id TEXT NOT NULL,
+            estado TEXT CHECK (estado IN ('sin_hacer', 'en_proceso', 'realizado')),
+            FOREIGN KEY (trabajo_id) REFERENCES trabajos(id),
+            FOREIGN KEY (alumno_id) REFERENCES usuarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS notificaciones (
+            id TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL CHECK (tipo IN ('tarea', 'invitacion', 'mensaje', 'otro')),
+            clase_id TEXT,
+            titulo TEXT,
+            descripcion TEXT,
+            creado_por TEXT,
+            creada_en DATETIME,
+            FOREIGN KEY (clase_id) REFERENCES clases(id),
+            FOREIGN KEY (creado_por) REFERENCES usuarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS notificaciones_usuarios (
+            id TEXT PRIMARY KEY,
+            notificacion_id TEXT NOT NULL,
+            usuario_id TEXT NOT NULL,
+            vista BOOLEAN DEFAULT 0,
+            respondida BOOLEAN DEFAULT 0,
+            recibida_en DATETIME,
+            FOREIGN KEY (notificacion_id) REFERENCES notificaciones(id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trabajos_archivos (
+            id TEXT PRIMARY KEY,
+            trabajo_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            filepath TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (trabajo_id) REFERENCES trabajos(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_trabajos_archivos_trabajo_id
+        ON trabajos_archivos(trabajo_id)
+        """,
+    ]),
+    (2, "indices de consultas frecuentes y unicidad de participaciones", [
+        # Antes de exigir unicidad se borran las participaciones duplicadas
+        """
+        DELETE FROM participaciones
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM participaciones GROUP BY usuario_id, clase_id
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_participaciones_usuario_clase
+        ON participaciones(usuario_id, clase_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_participaciones_clase
+        ON participaciones(clase_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_usuarios_usuario
+        ON notificaciones_usuarios(usuario_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_trabajos_clase
+        ON trabajos(clase_id)
+        """,
+        """
+        DELETE FROM trabajos_alumnos
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM trabajos_alumnos GROUP BY trabajo_id, alumno_id
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_trabajos_alumnos_trabajo_alumno
+        ON trabajos_alumnos(trabajo_id, alumno_id)
+        """,
+        _indice_email,
+    ]),
+    (3, "indices del feed de notificaciones", [
+        # Cubre el filtro por usuario y el orden del keyset; reemplaza al indice simple
+        """
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_usuarios_feed
+        ON notificaciones_usuarios(usuario_id, recibida_en, id)
+        """,
+        "DROP INDEX IF EXISTS idx_notificaciones_usuarios_usuario",
+        # Solo contiene las no vistas: el contador recorre unicamente esas filas
+        """
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_usuarios_no_vistas
+        ON notificaciones_usuarios(usuario_id, vista) WHERE vista = 0
+        """,
+    ]),
+    (4, "bandeja de salida de emails", [
+        """
+        CREATE TABLE IF NOT EXISTS emails_pendientes (
+            id TEXT PRIMARY KEY,
+            destinatario TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            cuerpo TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente'
+                CHECK (estado IN ('pendiente', 'enviado', 'fallido', 'sin_smtp')),
+            intentos INTEGER NOT NULL DEFAULT 0,
+            proximo_intento REAL NOT NULL,
+            ultimo_error TEXT,
+            creado_en REAL NOT NULL,
+            enviado_en REAL
+        )
+        """,
+        # Solo los pendientes: el remitente nunca recorre el historial enviado
+        """
+        CREATE INDEX IF NOT EXISTS idx_emails_pendientes_proximo
+        ON emails_pendientes(proximo_intento) WHERE estado = 'pendiente'
+        """,
+    ]),
+    (5, "historial del chat por clase", [
+        """
+        CREATE TABLE IF NOT EXISTS mensajes_chat (
+            id TEXT PRIMARY KEY,
+            clase_id TEXT NOT NULL,
+            usuario_id TEXT,
+            texto TEXT NOT NULL,
+            enviado_en DATETIME NOT NULL,
+            FOREIGN KEY (clase_id) REFERENCES clases(id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+        """,
+        # Filtro por clase y orden del keyset del historial
+        """
+        CREATE INDEX IF NOT EXISTS idx_mensajes_chat_clase
+        ON mensajes_chat(clase_id, enviado_en, id)
+        """,
+    ]),
+    (6, "almacen de archivos por contenido (sha256) con conteo de referencias", [
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            tamano INTEGER NOT NULL,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            creado_en DATETIME
+        )
+        """,
+        "ALTER TABLE trabajos_archivos ADD COLUMN sha256 TEXT",
+        _importar_archivos,
+    ]),
+    (7, "subidas por tramos reanudables", [
+        """
+        CREATE TABLE IF NOT EXISTS subidas (
+            id TEXT PRIMARY KEY,
+            trabajo_id TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            tamano INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'abierta',
+            escribiendo INTEGER NOT NULL DEFAULT 0,
+            creada_en REAL NOT NULL,
+            expira_en REAL NOT NULL,
+            FOREIGN KEY (trabajo_id) REFERENCES trabajos(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_subidas_expira ON subidas(expira_en)",
+        """
+        CREATE TABLE IF NOT EXISTS subidas_tramos (
+            subida_id TEXT NOT NULL,
+            inicio INTEGER NOT NULL,
+            fin INTEGER NOT NULL,
+            FOREIGN KEY (subida_id) REFERENCES subidas(id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_subidas_tramos_subida ON subidas_tramos(subida_id)",
+    ]),
+    (8, "metadatos e indices de archivos de trabajos", [
+        "ALTER TABLE trabajos_archivos ADD COLUMN tamano INTEGER",
+        "ALTER TABLE trabajos_archivos ADD COLUMN mime TEXT",
+        "ALTER TABLE trabajos_archivos ADD COLUMN nombre_original TEXT",
+        "ALTER TABLE trabajos_archivos ADD COLUMN subido_por TEXT",
+        "ALTER TABLE subidas ADD COLUMN mime TEXT",
+        "ALTER TABLE subidas ADD COLUMN subido_por TEXT",
+        _metadatos_archivos,
+        # Listado por trabajo ya ordenado, y descarga por nombre
+        "DROP INDEX IF EXISTS idx_trabajos_archivos_trabajo_id",
+        """
+        CREATE INDEX IF NOT EXISTS idx_trabajos_archivos_trabajo
+        ON trabajos_archivos(trabajo_id, uploaded_at)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_trabajos_archivos_filename
+        ON trabajos_archivos(filename)
+        """,
+    ]),
+    (9, "leases de escritura de subidas", [
+        # Un lease por tramo en curso en vez de un contador: si el proceso
+        # muere a mitad de un tramo, el lease vence y no traba el finalizar
+        """
+        CREATE TABLE IF NOT EXISTS subidas_escrituras (
+            id TEXT PRIMARY KEY,
+            subida_id TEXT NOT NULL,
+            vence_en REAL NOT NULL,
+            FOREIGN KEY (subida_id) REFERENCES subidas(id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_subidas_escrituras_subida ON subidas_escrituras(subida_id, vence_en)",
+        "ALTER TABLE subidas DROP COLUMN escribiendo",
+    ]),
+]
+
+
+# Consultas calientes y el indice que cada una deberia usar
+CONSULTAS_CALIENTES = [
+    ("listar_por_usuario",
+     """
+     SELECT nu.id FROM notificaciones_usuarios nu
+     WHERE nu.usuario_id = ? AND (nu.recibida_en, nu.id) < (?, ?)
+     ORDER BY nu.recibida_en DESC, nu.id DESC LIMIT 20
+     """,
+     "idx_notificaciones_usuarios_feed"),
+    ("reanudar_notificaciones",
+     """
+     SELECT nu.id FROM notificaciones_usuarios nu
+     WHERE nu.usuario_id = ? AND (nu.recibida_en, nu.id) > (?, ?)
+     ORDER BY nu.recibida_en ASC, nu.id ASC LIMIT 20
+     """,
+     "idx_notificaciones_usuarios_feed"),
+    ("contar_no_vistas",
+     "SELECT COUNT(*) FROM notificaciones_usuarios WHERE usuario_id = ? AND vista = 0",
+     "idx_notificaciones_usuarios_no_vistas"),
+    ("clases_por_usuario",
+     "SELECT p.clase_id FROM participaciones p WHERE p.usuario_id = ?",
+     "ux_participaciones_usuario_clase"),
+    ("dejar_clase",
+     "DELETE FROM participaciones WHERE usuario_id = ? AND clase_id = ?",
+     "ux_participaciones_usuario_clase"),
+    ("usuarios_de_clase",
+     "SELECT p.usuario_id FROM participaciones p WHERE p.clase_id = ?",
+     "idx_participaciones_clase"),
+    ("obtener_trabajos_por_clase",
+     """
+     SELECT t.id, ta.estado FROM trabajos t
+     LEFT JOIN trabajos_alumnos ta ON t.id = ta.trabajo_id AND ta.alumno_id = ?
+     WHERE t.clase_id = ?
+     """,
+     "idx_trabajos_clase"),
+    ("obtener_trabajos_por_clase (join)",
+     """
+     SELECT t.id, ta.estado FROM trabajos t
+     LEFT JOIN trabajos_alumnos ta ON t.id = ta.trabajo_id AND ta.alumno_id = ?
+     WHERE t.clase_id = ?
+     """,
+     "ux_trabajos_alumnos_trabajo_alumno"),
+    ("historial_chat",
+     """
+     SELECT id FROM mensajes_chat
+     WHERE clase_id = ? AND (enviado_en, id) < (?, ?)
+     ORDER BY enviado_en DESC, id DESC
+     """,
+     "idx_mensajes_chat_clase"),
+    ("login",
+     "SELECT id FROM usuarios WHERE email = ?",
+     "usuarios_email"),
+    ("archivos_de_trabajo",
+     "SELECT id FROM trabajos_archivos WHERE trabajo_id = ? ORDER BY uploaded_at DESC",
+     "idx_trabajos_archivos_trabajo"),
+    ("archivo_por_nombre",
+     "SELECT sha256 FROM trabajos_archivos WHERE filename = ?",
+     "idx_trabajos_archivos_filename"),
+    ("archivos_de_clase",
+     """
+     SELECT t.id, a.id FROM trabajos t
+     LEFT JOIN trabajos_archivos a ON a.trabajo_id = t.id
+     WHERE t.clase_id = ?
+     """,
+     "idx_trabajos_archivos_trabajo"),
+]
+
+
+def version_actual(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT,
+            aplicada_en DATETIME
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def migrar():
+    """Aplica las migraciones pendientes. Devuelve la version final."""
+    with transaccion() as cursor:
+        actual = version_actual(cursor)
+    for version, descripcion, pasos in MIGRACIONES:
+        if version <= actual:
+            continue
+        with transaccion() as cursor:
+            # Otro worker que arranco a la vez pudo aplicarla mientras esperabamos el lock
+            if version_actual(cursor) >= version:
+                actual = version
+                continue
+            for paso in pasos:
+                if callable(paso):
+                    paso(cursor)
+                else:
+                    cursor.execute(paso)
+            cursor.execute("""
+                INSERT INTO schema_version (version, descripcion, aplicada_en)
+                VALUES (?, ?, ?)
+            """, (version, descripcion, datetime.now().isoformat()))
+        log.info("Migracion aplicada", extra={"version": version, "descripcion": descripcion})
+        actual = version
+    return actual
+
+
+def plan_de_consulta(sql):
+    """Devuelve el detalle de EXPLAIN QUERY PLAN para la consulta."""
+    conn = conectar()
+    parametros = (None,) * sql.count("?")
+    filas = conn.execute("EXPLAIN QUERY PLAN " + sql, parametros).fetchall()
+    conn.close()
+    return [f[3] for f in filas]
+
+
+def verificar_indices():
+    """
+    Corre EXPLAIN QUERY PLAN sobre CONSULTAS_CALIENTES y devuelve una lista
+    de (nombre, indice_esperado, usa_indice, plan).
+    """
+    resultados = []
+    for nombre, sql, indice in CONSULTAS_CALIENTES:
+        plan = plan_de_consulta(sql)
+        usa_indice = any(indice in paso for paso in plan)
+        resultados.append((nombre, indice, usa_indice, plan))
+    return resultados
+
+
+if __name__ == "__main__":
+    import logs
+    logs.configurar()
+    print("Version del esquema:", migrar())
+    for nombre, indice, usa_indice, plan in verificar_indices():
+        estado = "OK " if usa_indice else "MAL"
+        print(f"[{estado}] {nombre}: {' | '.join(plan)}")
@@ -1,35 +1,17 @@
-from db import conectar, random_id
+from db import conectar, transaccion
+from ids import allocate
 from datetime import datetime
+import base64
+import json
 
-def crear_tablas():
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.executescript("""
-    CREATE TABLE IF NOT EXISTS notificaciones (
-        id TEXT PRIMARY KEY,
-        tipo TEXT NOT NULL CHECK (tipo IN ('tarea', 'invitacion', 'mensaje', 'otro')),
-        clase_id TEXT,
-        titulo TEXT,
-        descripcion TEXT,
-        creado_por TEXT,
-        creada_en DATETIME,
-        FOREIGN KEY (clase_id) REFERENCES clases(id),
-        FOREIGN KEY (creado_por) REFERENCES usuarios(id)
-    );
 
-    CREATE TABLE IF NOT EXISTS notificaciones_usuarios (
-        id TEXT PRIMARY KEY,
-        notificacion_id TEXT NOT NULL,
-        usuario_id TEXT NOT NULL,
-        vista BOOLEAN DEFAULT 0,
-        respondida BOOLEAN DEFAULT 0,
-        recibida_en DATETIME,
-        FOREIGN KEY (notificacion_id) REFERENCES notificaciones(id),
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
-    );
-    """)
-    conn.commit()
-    conn.close()
+class UsuariosDesconocidos(Exception):
+    """Algunos usuario_id no existen; ids tiene la lista."""
+
+    def __init__(self, ids):
+        super().__init__(f"Usuarios desconocidos: {', '.join(map(str, ids))}")
+        self.ids = ids
+
 
 def crear_notificacion(id, tipo, clase_id, titulo, descripcion, creado_por):
     conn = conectar()
@@ -42,6 +24,19 @@ def crear_notificacion(id, tipo, clase_id, titulo, descripcion, creado_por):
     conn.commit()
     conn.close()
 
+def obtener_notificacion(noti_id):
+    """Datos basicos de la notificacion (para el evento notification) o None."""
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, tipo, titulo, clase_id FROM notificaciones WHERE id = ?
+    """, (noti_id,))
+    fila = cursor.fetchone()
+    conn.close()
+    if not fila:
+        return None
+    return {"id": fila[0], "tipo": fila[1], "titulo": fila[2], "clase_id": fila[3]}
+
 def asignar_a_usuario(noti_id, usuario_id, asignacion_id):
     conn = conectar()
     cursor = conn.cursor()
@@ -52,6 +47,51 @@ def asignar_a_usuario(noti_id, usuario_id, asignacion_id):
     """, (asignacion_id, noti_id, usuario_id, recibida_en))
     conn.commit()
     conn.close()
+    return recibida_en
+
+def asignar_a_usuarios(noti_id, usuario_ids):
+    """
+    Asigna la notificacion a varios usuarios con un solo executemany y una
+    sola transaccion. Los ids repetidos se asignan una vez (en el orden de
+    su primera aparicion). Devuelve una lista de (asignacion_id, usuario_id,
+    recibida_en). Si algun id no existe no asigna nada y lanza
+    UsuariosDesconocidos.
+    """
+    usuario_ids = list(dict.fromkeys(usuario_ids))
+    recibida_en = datetime.now().isoformat()
+    asignaciones = list(zip(allocate(len(usuario_ids)), usuario_ids))
+    with transaccion() as cursor:
+        # Se valida antes del INSERT: con foreign_keys el error de sqlite no dice cual falta
+        cursor.execute("""
+            SELECT DISTINCT value FROM json_each(?)
+            WHERE value NOT IN (SELECT id FROM usuarios)
+        """, (json.dumps(usuario_ids),))
+        desconocidos = [f[0] for f in cursor.fetchall()]
+        if desconocidos:
+            raise UsuariosDesconocidos(desconocidos)
+        cursor.executemany("""
+            INSERT INTO notificaciones_usuarios (id, notificacion_id, usuario_id, recibida_en)
+            VALUES (?, ?, ?, ?)
+        """, [(asignacion_id, noti_id, usuario_id, recibida_en) for asignacion_id, usuario_id in asignaciones])
+    return [(asignacion_id, usuario_id, recibida_en) for asignacion_id, usuario_id in asignaciones]
+
+def asignar_a_clase(noti_id, clase_id, excluir_usuario_id=None):
+    """
+    Asigna la notificacion a todos los participantes de la clase con un
+    INSERT ... SELECT sobre participaciones, sin pasar la lista por Python.
+    Devuelve una lista de (asignacion_id, usuario_id, recibida_en).
+    """
+    recibida_en = datetime.now().isoformat()
+    with transaccion() as cursor:
+        cursor.execute("""
+            INSERT INTO notificaciones_usuarios (id, notificacion_id, usuario_id, recibida_en)
+            SELECT nuevo_id(), ?, p.usuario_id, ?
+            FROM participaciones p
+            WHERE p.clase_id = ? AND p.usuario_id IS NOT ?
+            RETURNING id, usuario_id, recibida_en
+        """, (noti_id, recibida_en, clase_id, excluir_usuario_id))
+        asignaciones = cursor.fetchall()
+    return asignaciones
 
 def marcar_vista(asignacion_id):
     conn = conectar()
@@ -64,16 +104,77 @@ def marcar_vista(asignacion_id):
     conn.commit()
     conn.close()
 
-def listar_por_usuario(usuario_id):
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT nu.id, n.titulo, n.descripcion, nu.vista, nu.respondida, n.tipo, n.creada_en
+def codificar_cursor(recibida_en, asignacion_id):
+    """
+    Cursor opaco para pedir la pagina siguiente del feed. El mismo valor
+    sirve como token de reanudacion (parametro desde).
+    """
+    return base64.urlsafe_b64encode(f"{recibida_en}|{asignacion_id}".encode()).decode()
+
+def decodificar_cursor(cursor_texto):
+    """Devuelve (recibida_en, asignacion_id) o None si el cursor no es valido."""
+    try:
+        recibida_en, asignacion_id = base64.urlsafe_b64decode(cursor_texto.encode()).decode().split("|", 1)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return recibida_en, asignacion_id
+
+def listar_por_usuario(usuario_id, limite=None, despues_de=None, solo_no_vistas=False, solo_sin_responder=False, desde=None):
+    """
+    Asignaciones del usuario. Sin limite ni cursores devuelve todo el
+    historial ordenado por creada_en de la notificacion, como antes.
+    Paginado, el orden es por cuando le llego al usuario: keyset sobre
+    (recibida_en, id), donde despues_de es el par (recibida_en,
+    asignacion_id) de la ultima fila ya entregada. recibida_en no siempre
+    coincide con creada_en: /api/notificaciones/asignar puede asignar mas
+    tarde una notificacion vieja, que en el feed aparece como nueva.
+    Con desde (el token de la ultima notificacion recibida por socket) se
+    devuelven solo las posteriores, de la mas vieja a la mas nueva.
+    """
+    condiciones = ["nu.usuario_id = ?"]
+    parametros = [usuario_id]
+    if despues_de:
+        condiciones.append("(nu.recibida_en, nu.id) < (?, ?)")
+        parametros.extend(despues_de)
+    if desde:
+        condiciones.append("(nu.recibida_en, nu.id) > (?, ?)")
+        parametros.extend(desde)
+    if solo_no_vistas:
+        condiciones.append("nu.vista = 0")
+    if solo_sin_responder:
+        condiciones.append("nu.respondida = 0")
+    if desde:
+        orden = "nu.recibida_en ASC, nu.id ASC"
+    elif limite is not None or despues_de:
+        orden = "nu.recibida_en DESC, nu.id DESC"
+    else:
+        orden = "n.creada_en DESC"
+    query = f"""
+        SELECT nu.id, n.titulo, n.descripcion, nu.vista, nu.respondida, n.tipo, n.creada_en, nu.recibida_en
         FROM notificaciones_usuarios nu
         JOIN notificaciones n ON nu.notificacion_id = n.id
-        WHERE nu.usuario_id = ?
-        ORDER BY n.creada_en DESC
-    """, (usuario_id,))
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY {orden}
+    """
+    if limite is not None:
+        query += " LIMIT ?"
+        parametros.append(limite)
+
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute(query, parametros)
     resultados = cursor.fetchall()
     conn.close()
     return resultados
+
+def contar_no_vistas(usuario_id):
+    """Cantidad de asignaciones sin ver; usa el indice parcial idx_notificaciones_usuarios_no_vistas."""
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) FROM notificaciones_usuarios
+        WHERE usuario_id = ? AND vista = 0
+    """, (usuario_id,))
+    cantidad = cursor.fetchone()[0]
+    conn.close()
+    return cantidad
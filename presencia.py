@@ -0,0 +1,163 @@
+"""
+Presencia: quien esta conectado en cada clase.
+
+call_signaling avisa cuando un usuario conecta su primer dispositivo y
+cuando desconecta el ultimo. En ese momento se cargan (o se sueltan) las
+clases del usuario y se actualizan los conjuntos de conectados por clase,
+asi "quien esta en linea en la clase X" cuesta O(conectados de X). A la sala
+de cada clase se manda solo el cambio (evento presencia), no la lista.
+
+El almacenamiento es intercambiable como en registro_sockets: PresenciaMemoria
+por proceso o PresenciaRedis compartida entre workers.
+"""
+
+import threading
+
+from chat import sala_clase
+from clases import clase_ids_por_usuario
+
+CONECTADO = "conectado"
+DESCONECTADO = "desconectado"
+
+
+class PresenciaMemoria:
+    def __init__(self):
+        self._en_linea = {}     # clase_id -> {usuario_id}
+        self._clases_de = {}    # usuario_id -> {clase_id}
+        self._lock = threading.Lock()
+
+    def conectar(self, usuario_id, clase_ids):
+        with self._lock:
+            self._clases_de[usuario_id] = set(clase_ids)
+            for clase_id in clase_ids:
+                self._en_linea.setdefault(clase_id, set()).add(usuario_id)
+
+    def desconectar(self, usuario_id):
+        """Saca al usuario de todas sus clases y devuelve cuales eran."""
+        with self._lock:
+            clase_ids = self._clases_de.pop(usuario_id, set())
+            for clase_id in clase_ids:
+                self._sacar(clase_id, usuario_id)
+            return clase_ids
+
+    def unir(self, usuario_id, clase_id):
+        """Suma la clase a un usuario conectado. False si no estaba conectado."""
+        with self._lock:
+            clase_ids = self._clases_de.get(usuario_id)
+            if clase_ids is None:
+                return False
+            clase_ids.add(clase_id)
+            self._en_linea.setdefault(clase_id, set()).add(usuario_id)
+            return True
+
+    def quitar(self, usuario_id, clase_id):
+        with self._lock:
+            clase_ids = self._clases_de.get(usuario_id)
+            if clase_ids is None or clase_id not in clase_ids:
+                return False
+            clase_ids.discard(clase_id)
+            self._sacar(clase_id, usuario_id)
+            return True
+
+    def _sacar(self, clase_id, usuario_id):
+        conectados = self._en_linea.get(clase_id)
+        if conectados is not None:
+            conectados.discard(usuario_id)
+            if not conectados:
+                del self._en_linea[clase_id]
+
+    def en_linea(self, clase_id):
+        with self._lock:
+            return set(self._en_linea.get(clase_id, ()))
+
+
+class PresenciaRedis:
+    """Presencia compartida entre procesos. Requiere el paquete redis."""
+
+    def __init__(self, url, prefijo="learned:presencia:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefijo = prefijo
+
+    def _clave_clase(self, clase_id):
+        return f"{self.prefijo}clase:{clase_id}"
+
+    def _clave_usuario(self, usuario_id):
+        return f"{self.prefijo}usuario:{usuario_id}"
+
+    def conectar(self, usuario_id, clase_ids):
+        pipe = self._redis.pipeline()
+        pipe.delete(self._clave_usuario(usuario_id))
+        # el conjunto del usuario existe aunque no tenga clases: marca que esta conectado
+        pipe.sadd(self._clave_usuario(usuario_id), "", *clase_ids)
+        for clase_id in clase_ids:
+            pipe.sadd(self._clave_clase(clase_id), usuario_id)
+        pipe.execute()
+
+    def desconectar(self, usuario_id):
+        clase_ids = self._redis.smembers(self._clave_usuario(usuario_id)) - {""}
+        pipe = self._redis.pipeline()
+        pipe.delete(self._clave_usuario(usuario_id))
+        for clase_id in clase_ids:
+            pipe.srem(self._clave_clase(clase_id), usuario_id)
+        pipe.execute()
+        return clase_ids
+
+    def unir(self, usuario_id, clase_id):
+        if not self._redis.exists(self._clave_usuario(usuario_id)):
+            return False
+        pipe = self._redis.pipeline()
+        pipe.sadd(self._clave_usuario(usuario_id), clase_id)
+        pipe.sadd(self._clave_clase(clase_id), usuario_id)
+        pipe.execute()
+        return True
+
+    def quitar(self, usuario_id, clase_id):
+        pipe = self._redis.pipeline()
+        pipe.srem(self._clave_usuario(usuario_id), clase_id)
+        pipe.srem(self._clave_clase(clase_id), usuario_id)
+        quitado, _ = pipe.execute()
+        return bool(quitado)
+
+    def en_linea(self, clase_id):
+        return set(self._redis.smembers(self._clave_clase(clase_id)))
+
+
+class Presencia:
+    def __init__(self, socketio, backend=None):
+        self.socketio = socketio
+        self.backend = backend if backend is not None else PresenciaMemoria()
+
+    def _avisar(self, clase_id, usuario_id, estado):
+        self.socketio.emit('presencia', {
+            "clase_id": clase_id,
+            "usuario_id": usuario_id,
+            "estado": estado,
+        }, to=sala_clase(clase_id))
+
+    def usuario_conectado(self, usuario_id):
+        clase_ids = clase_ids_por_usuario(usuario_id)
+        self.backend.conectar(usuario_id, clase_ids)
+        for clase_id in clase_ids:
+            self._avisar(clase_id, usuario_id, CONECTADO)
+
+    def usuario_desconectado(self, usuario_id):
+        for clase_id in self.backend.desconectar(usuario_id):
+            self._avisar(clase_id, usuario_id, DESCONECTADO)
+
+    def unido_a_clase(self, usuario_id, clase_id, creada=True):
+        """creada es lo que devolvio unirse_clase: si ya estaba unido no se avisa."""
+        if creada and self.backend.unir(usuario_id, clase_id):
+            self._avisar(clase_id, usuario_id, CONECTADO)
+
+    def salio_de_clase(self, usuario_id, clase_id):
+        if self.backend.quitar(usuario_id, clase_id):
+            self._avisar(clase_id, usuario_id, DESCONECTADO)
+
+    def clase_eliminada(self, clase_id):
+        for usuario_id in self.backend.en_linea(clase_id):
+            self.backend.quitar(usuario_id, clase_id)
+
+    def en_linea(self, clase_id):
+        """Usuarios conectados de la clase."""
+        return self.backend.en_linea(clase_id)
@@ -0,0 +1,118 @@
+"""
+Registro bidireccional de sockets conectados: sid -> usuario y usuario -> sids.
+
+Un usuario puede tener varios dispositivos (varias sids) a la vez. Conectar
+y desconectar son O(1): no hace falta recorrer todo el mapa para saber de
+quien era una sid.
+
+Cualquier objeto con la misma interfaz (registrar, desregistrar, sids_de,
+usuario_de, cantidad) sirve de backend; RegistroRedis guarda el mapa fuera
+del proceso para compartirlo entre workers.
+"""
+
+import threading
+
+
+class RegistroMemoria:
+    """Registro local al proceso."""
+
+    def __init__(self):
+        self._usuario_por_sid = {}
+        self._sids_por_usuario = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, usuario_id, sid):
+        """Asocia la sid al usuario. Devuelve True si es su primer dispositivo."""
+        usuario_id = str(usuario_id)
+        with self._lock:
+            anterior = self._usuario_por_sid.get(sid)
+            if anterior is not None and anterior != usuario_id:
+                self._quitar(sid, anterior)
+            self._usuario_por_sid[sid] = usuario_id
+            sids = self._sids_por_usuario.setdefault(usuario_id, set())
+            primero = not sids
+            sids.add(sid)
+            return primero
+
+    def desregistrar(self, sid):
+        """
+        Quita la sid. Devuelve (usuario_id, era_el_ultimo_dispositivo) o
+        (None, False) si la sid no estaba registrada.
+        """
+        with self._lock:
+            usuario_id = self._usuario_por_sid.get(sid)
+            if usuario_id is None:
+                return None, False
+            return usuario_id, self._quitar(sid, usuario_id)
+
+    def _quitar(self, sid, usuario_id):
+        del self._usuario_por_sid[sid]
+        sids = self._sids_por_usuario.get(usuario_id)
+        if sids is None:
+            return True
+        sids.discard(sid)
+        if not sids:
+            del self._sids_por_usuario[usuario_id]
+            return True
+        return False
+
+    def sids_de(self, usuario_id):
+        with self._lock:
+            return set(self._sids_por_usuario.get(str(usuario_id), ()))
+
+    def usuario_de(self, sid):
+        return self._usuario_por_sid.get(sid)
+
+    def cantidad(self):
+        """Cantidad de sockets registrados."""
+        return len(self._usuario_por_sid)
+
+
+class RegistroRedis:
+    """Registro compartido entre procesos. Requiere el paquete redis."""
+
+    def __init__(self, url, prefijo="learned:sockets:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefijo = prefijo
+
+    def _clave_sid(self, sid):
+        return f"{self.prefijo}sid:{sid}"
+
+    def _clave_usuario(self, usuario_id):
+        return f"{self.prefijo}usuario:{usuario_id}"
+
+    def registrar(self, usuario_id, sid):
+        usuario_id = str(usuario_id)
+        anterior = self._redis.get(self._clave_sid(sid))
+        pipe = self._redis.pipeline()
+        if anterior is not None and anterior != usuario_id:
+            pipe.srem(self._clave_usuario(anterior), sid)
+        pipe.set(self._clave_sid(sid), usuario_id)
+        pipe.sadd(self._clave_usuario(usuario_id), sid)
+        pipe.scard(self._clave_usuario(usuario_id))
+        if anterior is None:
+            pipe.incr(f"{self.prefijo}cantidad")
+        resultados = pipe.execute()
+        agregada, total = resultados[-3:-1] if anterior is None else resultados[-2:]
+        return bool(agregada) and total == 1
+
+    def desregistrar(self, sid):
+        usuario_id = self._redis.getdel(self._clave_sid(sid))
+        if usuario_id is None:
+            return None, False
+        pipe = self._redis.pipeline()
+        pipe.srem(self._clave_usuario(usuario_id), sid)
+        pipe.scard(self._clave_usuario(usuario_id))
+        pipe.decr(f"{self.prefijo}cantidad")
+        _, restantes, _ = pipe.execute()
+        return usuario_id, restantes == 0
+
+    def sids_de(self, usuario_id):
+        return set(self._redis.smembers(self._clave_usuario(usuario_id)))
+
+    def usuario_de(self, sid):
+        return self._redis.get(self._clave_sid(sid))
+
+    def cantidad(self):
+        return int(self._redis.get(f"{self.prefijo}cantidad") or 0)
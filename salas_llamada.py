@@ -0,0 +1,98 @@
+"""
+Estado de las llamadas grupales: quien esta en la llamada de cada clase.
+
+Entrar y salir son O(1): por clase se guarda {sid: usuario_id} y por sid la
+clase en la que esta. Cuando sale el ultimo participante la sala se borra;
+call_signaling llama a salir() tambien al desconectarse el socket, asi no
+quedan llamadas abandonadas.
+
+Como registro_sockets, el almacenamiento es intercambiable:
+SalasLlamadaMemoria por proceso o SalasLlamadaRedis entre workers.
+"""
+
+import threading
+
+
+class SalasLlamadaMemoria:
+    def __init__(self):
+        self._salas = {}        # clase_id -> {sid: usuario_id}
+        self._clase_de = {}     # sid -> clase_id
+        self._lock = threading.Lock()
+
+    def entrar(self, clase_id, sid, usuario_id):
+        """Suma la sid a la llamada. Devuelve los participantes que ya estaban."""
+        with self._lock:
+            sala = self._salas.setdefault(clase_id, {})
+            otros = [(s, u) for s, u in sala.items() if s != sid]
+            sala[sid] = usuario_id
+            self._clase_de[sid] = clase_id
+            return otros
+
+    def salir(self, sid):
+        """Devuelve (clase_id, usuario_id) o (None, None) si no estaba en una llamada."""
+        with self._lock:
+            clase_id = self._clase_de.pop(sid, None)
+            if clase_id is None:
+                return None, None
+            sala = self._salas.get(clase_id, {})
+            usuario_id = sala.pop(sid, None)
+            if not sala:
+                self._salas.pop(clase_id, None)
+            return clase_id, usuario_id
+
+    def clase_de(self, sid):
+        return self._clase_de.get(sid)
+
+    def participantes(self, clase_id):
+        with self._lock:
+            return list(self._salas.get(clase_id, {}).items())
+
+    def activas(self):
+        """Cantidad de llamadas con al menos un participante."""
+        return len(self._salas)
+
+
+class SalasLlamadaRedis:
+    """Llamadas compartidas entre procesos. Requiere el paquete redis."""
+
+    def __init__(self, url, prefijo="learned:llamadas:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefijo = prefijo
+
+    def _clave_sala(self, clase_id):
+        return f"{self.prefijo}sala:{clase_id}"
+
+    def _clave_sid(self, sid):
+        return f"{self.prefijo}sid:{sid}"
+
+    def entrar(self, clase_id, sid, usuario_id):
+        pipe = self._redis.pipeline()
+        pipe.hgetall(self._clave_sala(clase_id))
+        pipe.hset(self._clave_sala(clase_id), sid, usuario_id)
+        pipe.set(self._clave_sid(sid), clase_id)
+        pipe.sadd(f"{self.prefijo}activas", clase_id)
+        sala = pipe.execute()[0]
+        return [(s, u) for s, u in sala.items() if s != sid]
+
+    def salir(self, sid):
+        clase_id = self._redis.getdel(self._clave_sid(sid))
+        if clase_id is None:
+            return None, None
+        pipe = self._redis.pipeline()
+        pipe.hget(self._clave_sala(clase_id), sid)
+        pipe.hdel(self._clave_sala(clase_id), sid)
+        pipe.hlen(self._clave_sala(clase_id))
+        usuario_id, _, restantes = pipe.execute()
+        if restantes == 0:
+            self._redis.srem(f"{self.prefijo}activas", clase_id)
+        return clase_id, usuario_id
+
+    def clase_de(self, sid):
+        return self._redis.get(self._clave_sid(sid))
+
+    def participantes(self, clase_id):
+        return list(self._redis.hgetall(self._clave_sala(clase_id)).items())
+
+    def activas(self):
+        return self._redis.scard(f"{self.prefijo}activas")
@@ -1,60 +1,217 @@
+"""
+Storage endpoints for Flask app.
+Handles file uploads, downloads, and file management for tasks; the
+files themselves live in the content-addressed store of file_storage.py.
+"""
+
+import logging
 import os
-import uuid
-from flask import request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response, current_app, request, jsonify
+from werkzeug.utils import send_file
+
+from file_storage import (
+    blob_path,
+    blob_relpath,
+    save_file_for_task,
+    get_task_files,
+    get_file_record,
+    get_clase_files,
+    delete_file_from_task
+)
+from exportar_zip import exportacion_de_trabajo, exportacion_de_clase, zip_en_tramos
+from subidas import (
+    SubidaInvalida,
+    crear_subida,
+    estado_subida,
+    escribir_tramo,
+    finalizar_subida,
+    cancelar_subida
+)
+
+log = logging.getLogger(__name__)
+
+# Who sends the bytes of a download: "" (this process), "x-accel" (nginx
+# X-Accel-Redirect) or "x-sendfile" (Apache/lighttpd X-Sendfile)
+ARCHIVOS_PROXY = os.getenv("ARCHIVOS_PROXY", "").lower()
+# nginx internal location that maps to file_storage.STORAGE_DIR
+ARCHIVOS_ACCEL_PREFIJO = os.getenv("ARCHIVOS_ACCEL_PREFIJO", "/_archivos/")
+# A stored name always points to the same content, so it never goes stale
+CACHE_INMUTABLE_S = 365 * 24 * 3600
+
 
+def _add_urls(files):
+    base = request.host_url.rstrip('/')
+    for f in files:
+        f["url"] = f"{base}/api/uploads/trabajos/{f['trabajo_id']}/{f['filename']}"
+    return files
 
-BASE_DIR = os.path.dirname(__file__)
-UPLOAD_ROOT = os.path.join(BASE_DIR, "uploads")
 
-def ensure_dir(path):
-    os.makedirs(path, exist_ok=True)
+def _send_blob(record):
+    """
+    Send a stored file with its content hash as a strong ETag. Range (206)
+    and If-None-Match / If-Modified-Since (304) are answered here, or by
+    the proxy when ARCHIVOS_PROXY hands the bytes off to it.
+    """
+    sha256 = record["sha256"] if record else None
+    filepath = blob_path(sha256) if sha256 else None
+    if not filepath or not os.path.isfile(filepath):
+        return jsonify({"error": "File not found"}), 404
+    rv = send_file(filepath, request.environ, mimetype=record["mime"], as_attachment=True,
+                   download_name=record["original_name"],
+                   etag=sha256, max_age=CACHE_INMUTABLE_S, conditional=not ARCHIVOS_PROXY,
+                   use_x_sendfile=bool(ARCHIVOS_PROXY), response_class=current_app.response_class)
+    rv.cache_control.public = False
+    rv.cache_control.private = True
+    rv.cache_control.immutable = True
+    if ARCHIVOS_PROXY:
+        # The proxy serves ranges from the file itself; only 304s are decided here
+        rv = rv.make_conditional(request.environ)
+        ruta_interna = rv.headers.pop("X-Sendfile", None)
+        if rv.status_code == 200 and ARCHIVOS_PROXY == "x-accel":
+            rv.headers["X-Accel-Redirect"] = ARCHIVOS_ACCEL_PREFIJO.rstrip("/") + "/" + blob_relpath(sha256)
+        elif rv.status_code == 200:
+            rv.headers["X-Sendfile"] = ruta_interna
+    return rv
+
+
+def _zip_response(exportacion):
+    """Stream the ZIP of an export as it is built (see exportar_zip.py)."""
+    if exportacion is None:
+        return jsonify({"error": "Not found"}), 404
+    nombre, entradas = exportacion
+    rv = Response(zip_en_tramos(entradas), mimetype="application/zip")
+    # Same Content-Disposition as send_file, with an ASCII fallback name
+    download_name = f"{nombre}.zip".replace("/", "_")
+    simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+    if simple == download_name:
+        rv.headers.set("Content-Disposition", "attachment", filename=download_name)
+    else:
+        rv.headers.set("Content-Disposition", "attachment", filename=simple,
+                       **{"filename*": "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")})
+    rv.cache_control.no_store = True
+    # Keep nginx from spooling the whole archive before passing it on
+    rv.headers["X-Accel-Buffering"] = "no"
+    return rv
+
+
+def _offset_del_tramo():
+    # Content-Range: bytes <inicio>-<fin>/<total>, o ?offset=<inicio>
+    rango = request.headers.get("Content-Range", "")
+    if rango.startswith("bytes ") and "-" in rango:
+        inicio = rango[len("bytes "):].split("-", 1)[0]
+    else:
+        inicio = request.args.get("offset", "")
+    return int(inicio) if inicio.isdigit() else None
 
 
 def register_storage(app):
-    # Ensure base uploads dir exists
-    ensure_dir(UPLOAD_ROOT)
+    """Register storage endpoints."""
+
+    @app.errorhandler(SubidaInvalida)
+    def subida_invalida(e):
+        return jsonify({"error": str(e)}), e.estado
 
     @app.route('/api/trabajos/<trabajo_id>/archivos', methods=['GET'])
     def list_trabajo_files(trabajo_id):
-        dir_path = os.path.join(UPLOAD_ROOT, 'trabajos', str(trabajo_id))
-        if not os.path.isdir(dir_path):
-            return jsonify([])
-        files = []
-        for fname in os.listdir(dir_path):
-            # skip hidden
-            if fname.startswith('.'):
-                continue
-            url = request.host_url.rstrip('/') + f"/api/uploads/trabajos/{trabajo_id}/{fname}"
-            files.append({"filename": fname, "url": url})
-        return jsonify(files)
+        return jsonify(_add_urls(get_task_files(trabajo_id)))
+
+    @app.route('/api/clases/<clase_id>/archivos', methods=['GET'])
+    def list_clase_files(clase_id):
+        """Every task of the class with its files (teacher overview)."""
+        trabajos = get_clase_files(clase_id)
+        for trabajo in trabajos:
+            _add_urls(trabajo["archivos"])
+        return jsonify(trabajos)
+
+    @app.route('/api/trabajos/<trabajo_id>/archivos/zip', methods=['GET'])
+    def export_trabajo_files(trabajo_id):
+        """Every file of the task in one ZIP, streamed."""
+        return _zip_response(exportacion_de_trabajo(trabajo_id))
+
+    @app.route('/api/clases/<clase_id>/archivos/zip', methods=['GET'])
+    def export_clase_files(clase_id):
+        """Every file of every task of the class, one folder per task."""
+        return _zip_response(exportacion_de_clase(clase_id))
 
     @app.route('/api/trabajos/<trabajo_id>/archivos', methods=['POST'])
     def upload_trabajo_files(trabajo_id):
-        # Accept multiple files under key 'files'
-        if 'files' not in request.files:
-            # if no 'files' key, maybe single file keys: handle all request.files
-            if len(request.files) == 0:
-                return jsonify({"error": "No files provided"}), 400
-
-        dir_path = os.path.join(UPLOAD_ROOT, 'trabajos', str(trabajo_id))
-        ensure_dir(dir_path)
+        # Accept multiple files under key 'files' or arbitrary file keys
+        file_items = request.files.getlist('files') if 'files' in request.files else list(request.files.values())
+        file_items = [f for f in file_items if f and f.filename]
+        if not file_items:
+            return jsonify({"error": "No files provided"}), 400
 
         saved = []
-        # support both 'files' array and arbitrary file keys
-        file_items = request.files.getlist('files') if 'files' in request.files else list(request.files.values())
+        errors = []
         for f in file_items:
-            if f and f.filename:
-                filename = secure_filename(f.filename)
-                unique = f"{uuid.uuid4().hex}_{filename}"
-                dest = os.path.join(dir_path, unique)
-                f.save(dest)
-                url = request.host_url.rstrip('/') + f"/api/uploads/trabajos/{trabajo_id}/{unique}"
-                saved.append({"filename": unique, "original_name": filename, "url": url})
+            result = save_file_for_task(trabajo_id, f, request.form.get("usuario_id"))
+            if result:
+                saved.append(result)
+            else:
+                errors.append(f"Failed to upload {f.filename}")
 
-        return jsonify({"status": "ok", "files": saved})
+        response = {
+            "status": "ok" if saved else "error",
+            "files": _add_urls(saved),
+            "errors": errors if errors else None
+        }
+        return jsonify(response), 200 if saved else 400
 
     @app.route('/api/uploads/trabajos/<trabajo_id>/<path:filename>')
     def serve_trabajo_file(trabajo_id, filename):
-        dir_path = os.path.join(UPLOAD_ROOT, 'trabajos', str(trabajo_id))
-        return send_from_directory(dir_path, filename, as_attachment=True)
+        return _send_blob(get_file_record(filename, trabajo_id))
+
+    @app.route("/api/trabajos/archivos/download/<filename>", methods=["GET"])
+    def download_task_file(filename):
+        """Download a file by filename."""
+        return _send_blob(get_file_record(filename))
+
+    @app.route("/api/trabajos/archivos/<file_id>", methods=["DELETE"])
+    def delete_task_file(file_id):
+        """Delete a file from a task."""
+        if delete_file_from_task(file_id):
+            return jsonify({"status": "ok"}), 200
+        else:
+            return jsonify({"error": "File not found"}), 404
+
+    # Resumable chunked uploads (see subidas.py):
+    # POST /api/trabajos/<id>/subidas {nombre, tamano, mime?, usuario_id?} -> sesion
+    # PUT /api/subidas/<id>?offset=N (o Content-Range) con los bytes del tramo
+    # GET /api/subidas/<id> -> offset y rangos recibidos, para reanudar
+    # POST /api/subidas/<id>/finalizar {sha256 opcional} -> archivo del trabajo
+    @app.route("/api/trabajos/<trabajo_id>/subidas", methods=["POST"])
+    def create_upload_session(trabajo_id):
+        data = request.get_json(silent=True) or {}
+        estado = crear_subida(trabajo_id, data.get("nombre"), data.get("tamano"),
+                              data.get("mime"), data.get("usuario_id"))
+        return jsonify(estado), 201
+
+    @app.route("/api/subidas/<subida_id>", methods=["GET"])
+    def upload_session_status(subida_id):
+        estado = estado_subida(subida_id)
+        if estado is None:
+            return jsonify({"error": "Subida no encontrada"}), 404
+        return jsonify(estado)
+
+    @app.route("/api/subidas/<subida_id>", methods=["PUT"])
+    def upload_chunk(subida_id):
+        offset = _offset_del_tramo()
+        if offset is None:
+            return jsonify({"error": "Falta el offset del tramo"}), 400
+        # request.stream no carga el cuerpo en memoria
+        return jsonify(escribir_tramo(subida_id, offset, request.stream, request.content_length))
+
+    @app.route("/api/subidas/<subida_id>/finalizar", methods=["POST"])
+    def finish_upload(subida_id):
+        data = request.get_json(silent=True) or {}
+        result = finalizar_subida(subida_id, data.get("sha256"))
+        return jsonify(_add_urls([result])[0]), 201
+
+    @app.route("/api/subidas/<subida_id>", methods=["DELETE"])
+    def cancel_upload(subida_id):
+        if cancelar_subida(subida_id):
+            return jsonify({"status": "ok"})
+        return jsonify({"error": "Subida no encontrada"}), 404
@@ -0,0 +1,302 @@
+"""
+Subidas por tramos, reanudables, sobre el almacen de file_storage.py.
+
+1. crear_subida() abre una sesion para un trabajo con el nombre y el
+   tamano total del archivo y crea el archivo de staging (disperso, del
+   tamano final).
+2. escribir_tramo() escribe cada tramo directo en su posicion del staging
+   (sin pasar por memoria ni por un multipart) y anota el rango recibido.
+   Los tramos pueden llegar en cualquier orden y en paralelo, tambien a
+   procesos distintos; repetir uno no hace dano.
+3. estado_subida() devuelve offset (hasta donde llego lo contiguo) y los
+   rangos recibidos, para reanudar despues de un corte.
+4. finalizar_subida() verifica que este todo, calcula el sha256 y pasa el
+   staging al almacen (file_storage.store_for_task).
+
+Cada tramo renueva el vencimiento; las sesiones abandonadas se borran
+(fila y staging) con limpiar_vencidas(), que corre al abrir sesiones nuevas.
+
+Mientras se escribe, cada tramo tiene un lease en subidas_escrituras que
+renueva cada SUBIDA_LEASE_S / 2; finalizar espera a que no quede ninguno
+vigente. Si el proceso muere a mitad de un tramo el lease vence solo, y un
+tramo que no pudo renovar a tiempo se corta antes de volver a escribir.
+
+Variables de entorno:
+    SUBIDA_MAX_BYTES        tamano maximo de un archivo
+    SUBIDA_TRAMO_MAX_BYTES  tamano maximo de un tramo
+    SUBIDA_TTL_S            segundos sin actividad antes de vencer
+    SUBIDA_LEASE_S          segundos que dura el lease de un tramo en curso
+"""
+
+import os
+import time
+
+import file_storage
+from db import al_confirmar, conectar, transaccion
+from ids import nuevo_id
+
+SUBIDA_MAX_BYTES = int(os.getenv("SUBIDA_MAX_BYTES", str(4 * 1024 ** 3)))
+SUBIDA_TRAMO_MAX_BYTES = int(os.getenv("SUBIDA_TRAMO_MAX_BYTES", str(32 * 1024 ** 2)))
+SUBIDA_TTL_S = float(os.getenv("SUBIDA_TTL_S", str(24 * 3600)))
+SUBIDA_LEASE_S = float(os.getenv("SUBIDA_LEASE_S", "60"))
+# Tamano de tramo que se le sugiere al cliente
+TRAMO_SUGERIDO = 8 * 1024 ** 2
+
+
+class SubidaInvalida(Exception):
+    """Error de una subida; estado es el codigo HTTP para responder."""
+
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def ruta_staging(subida_id):
+    return os.path.join(file_storage.staging_dir(), f"subida_{subida_id}")
+
+
+def _unir_rangos(rangos):
+    unidos = []
+    for inicio, fin in sorted(rangos):
+        if unidos and inicio <= unidos[-1][1]:
+            unidos[-1][1] = max(unidos[-1][1], fin)
+        else:
+            unidos.append([inicio, fin])
+    return unidos
+
+
+def _borrar_staging(subida_ids):
+    for subida_id in subida_ids:
+        try:
+            os.unlink(ruta_staging(subida_id))
+        except FileNotFoundError:
+            pass
+
+
+def _borrar_staging_al_confirmar(subida_ids):
+    # Si la transaccion se deshace las sesiones vuelven, y su staging tambien tiene que estar
+    if subida_ids:
+        al_confirmar(lambda: _borrar_staging(subida_ids))
+
+
+def limpiar_vencidas():
+    """Borra las sesiones vencidas y sus archivos de staging. Devuelve cuantas."""
+    with transaccion() as cursor:
+        cursor.execute("DELETE FROM subidas WHERE expira_en < ? RETURNING id", (time.time(),))
+        vencidas = [f[0] for f in cursor.fetchall()]
+        _borrar_staging_al_confirmar(vencidas)
+    return len(vencidas)
+
+
+def cancelar_de_clase(cursor, clase_id):
+    """Descarta las subidas en curso de los trabajos de una clase (eliminar_clase)."""
+    cursor.execute("""
+        DELETE FROM subidas
+        WHERE trabajo_id IN (SELECT id FROM trabajos WHERE clase_id = ?)
+        RETURNING id
+    """, (clase_id,))
+    _borrar_staging_al_confirmar([f[0] for f in cursor.fetchall()])
+
+
+def crear_subida(trabajo_id, nombre, tamano, mime=None, subido_por=None):
+    """
+    Abre una sesion de subida. mime (el que declara el cliente) y
+    subido_por pasan a los metadatos del archivo. Devuelve el estado
+    inicial (ver estado_subida).
+    """
+    if not nombre or not isinstance(nombre, str):
+        raise SubidaInvalida("Falta el nombre del archivo")
+    if not isinstance(tamano, int) or isinstance(tamano, bool) or tamano <= 0:
+        raise SubidaInvalida("Falta el tamano del archivo")
+    if tamano > SUBIDA_MAX_BYTES:
+        raise SubidaInvalida(f"El archivo supera los {SUBIDA_MAX_BYTES} bytes", 413)
+    limpiar_vencidas()
+    subida_id = nuevo_id()
+    ahora = time.time()
+    with transaccion() as cursor:
+        cursor.execute("SELECT 1 FROM trabajos WHERE id = ?", (trabajo_id,))
+        if not cursor.fetchone():
+            raise SubidaInvalida("Trabajo no encontrado", 404)
+        cursor.execute("""
+            INSERT INTO subidas (id, trabajo_id, nombre, tamano, mime, subido_por, estado, creada_en, expira_en)
+            VALUES (?, ?, ?, ?, ?, ?, 'abierta', ?, ?)
+        """, (subida_id, trabajo_id, nombre, tamano, mime, subido_por, ahora, ahora + SUBIDA_TTL_S))
+        # Disperso: no ocupa disco hasta que llegan los tramos
+        with open(ruta_staging(subida_id), "wb") as f:
+            f.truncate(tamano)
+    return estado_subida(subida_id)
+
+
+def estado_subida(subida_id):
+    """
+    Devuelve {id, trabajo_id, nombre, tamano, mime, subido_por, offset,
+    recibido, rangos, tamano_tramo, expira_en} o None si la sesion no
+    existe o vencio.
+    """
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT trabajo_id, nombre, tamano, expira_en, mime, subido_por
+        FROM subidas WHERE id = ? AND expira_en >= ?
+    """, (subida_id, time.time()))
+    fila = cursor.fetchone()
+    if fila is None:
+        conn.close()
+        return None
+    cursor.execute("SELECT inicio, fin FROM subidas_tramos WHERE subida_id = ?", (subida_id,))
+    rangos = _unir_rangos(cursor.fetchall())
+    conn.close()
+    return {
+        "id": subida_id,
+        "trabajo_id": fila[0],
+        "nombre": fila[1],
+        "tamano": fila[2],
+        "mime": fila[4],
+        "subido_por": fila[5],
+        # Lo contiguo desde el principio: desde aca reanuda un cliente secuencial
+        "offset": rangos[0][1] if rangos and rangos[0][0] == 0 else 0,
+        "recibido": sum(fin - inicio for inicio, fin in rangos),
+        "rangos": rangos,
+        "tamano_tramo": min(TRAMO_SUGERIDO, SUBIDA_TRAMO_MAX_BYTES),
+        "expira_en": fila[3],
+    }
+
+
+def escribir_tramo(subida_id, offset, stream, largo=None):
+    """
+    Escribe en el staging lo que venga en stream a partir de offset. largo
+    es el Content-Length si se conoce. Devuelve el estado de la subida.
+    """
+    if not isinstance(offset, int) or offset < 0:
+        raise SubidaInvalida("Offset invalido")
+    if largo is not None and largo > SUBIDA_TRAMO_MAX_BYTES:
+        raise SubidaInvalida(f"El tramo supera los {SUBIDA_TRAMO_MAX_BYTES} bytes", 413)
+    escritura_id = nuevo_id()
+    # El lease del tramo: finalizar espera a que no haya ninguno vigente,
+    # asi nadie escribe en un staging que ya paso al almacen
+    with transaccion() as cursor:
+        ahora = time.time()
+        cursor.execute("""
+            UPDATE subidas SET expira_en = ?
+            WHERE id = ? AND estado = 'abierta' AND expira_en >= ?
+            RETURNING tamano
+        """, (ahora + SUBIDA_TTL_S, subida_id, ahora))
+        fila = cursor.fetchone()
+        if fila is not None:
+            cursor.execute("""
+                INSERT INTO subidas_escrituras (id, subida_id, vence_en) VALUES (?, ?, ?)
+            """, (escritura_id, subida_id, ahora + SUBIDA_LEASE_S))
+    if fila is None:
+        raise SubidaInvalida("Subida no encontrada o cerrada", 404)
+    tamano = fila[0]
+    renovado = ahora
+    escritos = 0
+    try:
+        if largo is not None and offset + largo > tamano:
+            raise SubidaInvalida("El tramo se pasa del tamano del archivo", 416)
+        limite = min(tamano - offset, SUBIDA_TRAMO_MAX_BYTES)
+        try:
+            f = open(ruta_staging(subida_id), "r+b")
+        except FileNotFoundError:
+            raise SubidaInvalida("Subida no encontrada o cerrada", 404)
+        with f:
+            f.seek(offset)
+            while True:
+                bloque = stream.read(file_storage.CHUNK_SIZE)
+                if not bloque:
+                    break
+                if escritos + len(bloque) > limite:
+                    raise SubidaInvalida("El tramo es mas grande que lo que falta o que el maximo", 416)
+                # Leer del cliente puede tardar: antes de escribir, el lease
+                # tiene que seguir vigente con margen
+                if time.time() - renovado > SUBIDA_LEASE_S / 2:
+                    renovado = _renovar_lease(escritura_id)
+                f.write(bloque)
+                escritos += len(bloque)
+    finally:
+        with transaccion() as cursor:
+            cursor.execute("DELETE FROM subidas_escrituras WHERE id = ?", (escritura_id,))
+            # Si el tramo se corto a la mitad, lo escrito igual queda anotado
+            # (salvo que la subida se haya cancelado o finalizado mientras tanto)
+            if escritos and cursor.rowcount:
+                cursor.execute("""
+                    INSERT INTO subidas_tramos (subida_id, inicio, fin) VALUES (?, ?, ?)
+                """, (subida_id, offset, offset + escritos))
+    return estado_subida(subida_id)
+
+
+def _renovar_lease(escritura_id):
+    """Extiende el lease de un tramo en curso; 409 si ya vencio o se esta finalizando."""
+    with transaccion() as cursor:
+        ahora = time.time()
+        cursor.execute("""
+            UPDATE subidas_escrituras SET vence_en = ?
+            WHERE id = ? AND vence_en >= ?
+              AND EXISTS (SELECT 1 FROM subidas s WHERE s.id = subida_id AND s.estado = 'abierta')
+        """, (ahora + SUBIDA_LEASE_S, escritura_id, ahora))
+        if cursor.rowcount == 0:
+            raise SubidaInvalida("El tramo tardo demasiado; volve a mandarlo", 409)
+    return ahora
+
+
+def _despues_de_error(subida_id):
+    # Si el staging sigue se puede reintentar el finalizar; si ya no esta
+    # (store_for_task lo movio o lo borro) la subida no tiene arreglo
+    with transaccion() as cursor:
+        if os.path.exists(ruta_staging(subida_id)):
+            cursor.execute("UPDATE subidas SET estado = 'abierta' WHERE id = ?", (subida_id,))
+        else:
+            cursor.execute("DELETE FROM subidas WHERE id = ?", (subida_id,))
+
+
+def finalizar_subida(subida_id, sha256=None):
+    """
+    Cierra la subida y guarda el archivo en el trabajo. Si se pasa sha256
+    se verifica contra el contenido. Devuelve el registro del archivo
+    (ver file_storage.store_for_task).
+    """
+    estado = estado_subida(subida_id)
+    if estado is None:
+        raise SubidaInvalida("Subida no encontrada", 404)
+    if estado["recibido"] < estado["tamano"]:
+        raise SubidaInvalida("Faltan tramos", 409)
+    with transaccion() as cursor:
+        cursor.execute("""
+            UPDATE subidas SET estado = 'finalizando'
+            WHERE id = ? AND estado = 'abierta' AND NOT EXISTS (
+                SELECT 1 FROM subidas_escrituras WHERE subida_id = ? AND vence_en >= ?
+            )
+        """, (subida_id, subida_id, time.time()))
+        if cursor.rowcount == 0:
+            raise SubidaInvalida("Hay tramos subiendose o la subida ya se esta finalizando", 409)
+    staging = ruta_staging(subida_id)
+    try:
+        calculado, tamano = file_storage.hash_file(staging)
+    except BaseException:
+        _despues_de_error(subida_id)
+        raise
+    if sha256 and sha256.lower() != calculado:
+        # Se reabre para que el cliente vuelva a mandar los tramos
+        with transaccion() as cursor:
+            cursor.execute("DELETE FROM subidas_tramos WHERE subida_id = ?", (subida_id,))
+            cursor.execute("UPDATE subidas SET estado = 'abierta' WHERE id = ?", (subida_id,))
+        raise SubidaInvalida("El sha256 no coincide con lo recibido", 422)
+    try:
+        with transaccion() as cursor:
+            registro = file_storage.store_for_task(estado["trabajo_id"], staging, calculado, tamano, estado["nombre"],
+                                                   estado["mime"], estado["subido_por"])
+            cursor.execute("DELETE FROM subidas WHERE id = ?", (subida_id,))
+    except BaseException:
+        _despues_de_error(subida_id)
+        raise
+    return registro
+
+
+def cancelar_subida(subida_id):
+    """Descarta la subida. Devuelve False si no existia."""
+    with transaccion() as cursor:
+        cursor.execute("DELETE FROM subidas WHERE id = ? RETURNING id", (subida_id,))
+        borrada = cursor.fetchone() is not None
+        if borrada:
+            _borrar_staging_al_confirmar([subida_id])
+    return borrada
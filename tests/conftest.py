@@ -0,0 +1,73 @@
+"""
+Fixtures comunes. Cada test corre contra una base SQLite y un almacen de
+archivos nuevos en tmp_path; nunca se usan db/app.db ni uploads/ del repo.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar la app: sin SMTP real (load_dotenv no pisa variables
+# ya definidas), bcrypt inline y sin los logs de las migraciones
+os.environ["SMTP_HOST"] = ""
+os.environ.setdefault("HASH_WORKERS", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import db  # noqa: E402
+
+# app.py migra al importarse: que no toque ./db/app.db
+db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="learned-tests-"), "app.db")
+
+
+@pytest.fixture
+def base_de_datos(tmp_path, monkeypatch):
+    """Base nueva con todas las migraciones aplicadas."""
+    from migraciones import migrar
+    db.cerrar_pool()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "app.db"))
+    migrar()
+    yield db.DB_PATH
+    db.cerrar_pool()
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    """Directorio de archivos (blobs y staging de subidas) temporal."""
+    import file_storage
+    directorio = tmp_path / "uploads"
+    directorio.mkdir()
+    monkeypatch.setattr(file_storage, "STORAGE_DIR", str(directorio))
+    return directorio
+
+
+@pytest.fixture
+def cliente(base_de_datos, almacen):
+    """Cliente de pruebas de Flask sobre la base y el almacen temporales."""
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def profesor(base_de_datos):
+    """Crea el usuario profe; devuelve su id."""
+    from db import transaccion
+    with transaccion() as cursor:
+        cursor.execute("""
+            INSERT INTO usuarios (id, nombre, email, password_hash, rol)
+            VALUES ('profe', 'Profe', 'profe@test', x'00', 'profesor')
+        """)
+    return "profe"
+
+
+@pytest.fixture
+def trabajo(profesor):
+    """Crea una clase del profesor y un trabajo; devuelve el id del trabajo."""
+    from db import transaccion
+    with transaccion() as cursor:
+        cursor.execute("INSERT INTO clases (id, nombre, profesor_id) VALUES ('clase1', 'Clase', 'profe')")
+        cursor.execute("INSERT INTO trabajos (id, titulo, clase_id) VALUES ('trabajo1', 'Trabajo 1', 'clase1')")
+    return "trabajo1"
@@ -0,0 +1,95 @@
+import time
+
+from candidatos_ice import CoalescedorIce
+from db import transaccion
+
+
+class SocketIOFalso:
+    """Lo que usa el coalescedor de flask_socketio.SocketIO, con temporizadores manuales."""
+
+    def __init__(self):
+        self.emitidos = []
+        self.tareas = []
+
+    def start_background_task(self, fn, *args):
+        self.tareas.append((fn, args))
+
+    def sleep(self, segundos):
+        pass
+
+    def emit(self, evento, data, to=None):
+        self.emitidos.append((to, [c["n"] for c in data["candidatos"]]))
+
+    def correr_tarea(self, i):
+        fn, args = self.tareas[i]
+        fn(*args)
+
+
+def test_temporizador_viejo_no_corta_el_lote_siguiente():
+    socketio = SocketIOFalso()
+    coalescedor = CoalescedorIce(socketio, ventana_ms=30, lote_max=2)
+
+    for n in range(3):
+        coalescedor.agregar("a", "b", "sala", {"n": n})
+    # El primer lote salio por tamano; el tercer candidato abrio otro
+    assert socketio.emitidos == [("sala", [0, 1])]
+
+    # Vence la ventana del primer lote: no toca el segundo
+    socketio.correr_tarea(0)
+    assert socketio.emitidos == [("sala", [0, 1])]
+
+    socketio.correr_tarea(1)
+    assert socketio.emitidos == [("sala", [0, 1]), ("sala", [2])]
+    assert coalescedor.estadisticas()["candidatos"] == 3
+    assert coalescedor.estadisticas()["lotes"] == 2
+
+
+def _conectar(usuario_id, ice_lotes):
+    import app
+    cliente = app.socketio.test_client(app.app)
+    cliente.emit("register_user", {"usuario_id": usuario_id, "ice_lotes": ice_lotes})
+    cliente.get_received()
+    return cliente
+
+
+def _candidatos(cliente, ventana):
+    time.sleep(ventana + 0.1)
+    return [(m["name"], m["args"][0]) for m in cliente.get_received()]
+
+
+def test_solo_se_cuentan_lotes_entregados(cliente, monkeypatch):
+    import app
+    from call_signaling import estadisticas_relay
+    with transaccion() as cursor:
+        for usuario_id in ("a", "viejo", "nuevo"):
+            cursor.execute("""
+                INSERT INTO usuarios (id, nombre, email, password_hash, rol)
+                VALUES (?, ?, ?, x'00', 'estudiante')
+            """, (usuario_id, usuario_id, f"{usuario_id}@test"))
+    coalescedor = app.coalescedor_ice
+    monkeypatch.setattr(coalescedor, "ventana", 0.03)
+    monkeypatch.setattr(coalescedor, "candidatos", 0)
+    monkeypatch.setattr(coalescedor, "lotes", 0)
+    origen = _conectar("a", True)
+    viejo = _conectar("viejo", False)
+    nuevo = _conectar("nuevo", True)
+    antes = estadisticas_relay()["webrtc_ice_candidate"]
+
+    for destino in ("viejo", "nuevo"):
+        for n in range(3):
+            origen.emit("webrtc_ice_candidate", {"from": "a", "to": destino, "candidate": f"c{n}"})
+
+    # Sin conexiones con lotes del destino no se arma (ni se cuenta) ningun lote
+    assert [e for e, _ in _candidatos(viejo, coalescedor.ventana)] == ["webrtc_ice_candidate"] * 3
+    lotes = _candidatos(nuevo, 0)
+    assert [(e, len(d["candidatos"])) for e, d in lotes] == [("webrtc_ice_candidates", 3)]
+    assert coalescedor.estadisticas()["candidatos"] == 3
+    assert coalescedor.estadisticas()["lotes"] == 1
+
+    origen.emit("webrtc_ice_candidate", {"from": "a", "candidate": "sin destino"})
+    relay = estadisticas_relay()["webrtc_ice_candidate"]
+    assert relay["reenviados"] == antes["reenviados"] + 6
+    assert relay["invalidos"] == antes["invalidos"] + 1
+    assert relay["latencia_ms_p50"] > 0
+    for c in (origen, viejo, nuevo):
+        c.disconnect()
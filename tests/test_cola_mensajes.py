@@ -0,0 +1,86 @@
+import queue
+import time
+
+import pytest
+import socketio
+
+from cola_mensajes import AdministradorTCP, codificar, decodificar, iniciar_broker
+
+
+@pytest.fixture
+def broker():
+    broker = iniciar_broker(puerto=0)
+    yield broker
+    broker.shutdown()
+    broker.server_close()
+
+
+def _worker(url):
+    """
+    El servidor Socket.IO de un proceso de la app, colgado de la cola, con
+    un socket en la sala llamada:1. Devuelve el servidor y una cola con los
+    (evento, datos) que le llegan a ese socket.
+    """
+    servidor = socketio.Server(async_mode="threading", client_manager=AdministradorTCP(url))
+    servidor.manager.initialize()
+    sid = servidor.manager.connect("eio-1", "/")
+    servidor.manager.enter_room(sid, "/", "llamada:1")
+    recibidos = queue.Queue()
+    paquetes = []
+
+    def enviar(eio_sid, paquete):
+        # Un evento binario sale como un paquete de texto mas un adjunto por cada bytes
+        if paquetes:
+            paquetes[0].add_attachment(paquete.data)
+        else:
+            paquetes.append(servidor.packet_class(encoded_packet=paquete.data))
+        if paquetes[0].attachment_count == len(paquetes[0].attachments):
+            recibidos.put(tuple(paquetes.pop().data))
+
+    servidor._send_eio_packet = enviar
+    return servidor, recibidos
+
+
+def _esperar(recibidos, emitir, timeout=5):
+    # El suscriptor se conecta al broker en segundo plano: reintentar hasta
+    # que el primer mensaje cruza la cola
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        emitir()
+        try:
+            return recibidos.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    raise AssertionError("el emit no llego al otro worker")
+
+
+def test_marco_con_bytes_anidados():
+    mensaje = {"canal": "c", "datos": {"data": [{"sdp": b"\x00\xff", "texto": "hola"}, b""]}}
+    assert decodificar(codificar(mensaje)) == mensaje
+
+
+def test_payload_binario_entre_dos_workers(broker):
+    url = f"tcp://127.0.0.1:{broker.server_address[1]}"
+    servidor_a, _ = _worker(url)
+    _, recibidos_b = _worker(url)
+    payload = {"offer": {"sdp": b"\x00\x01binario\xff"}, "de": "usuario_a"}
+
+    mensaje = _esperar(recibidos_b, lambda: servidor_a.emit("webrtc_offer", payload, to="llamada:1"))
+
+    assert mensaje == ("webrtc_offer", payload)
+
+
+def test_ack_binario_entre_dos_workers(broker):
+    # La respuesta a un emit con callback vuelve al worker que lo hizo con
+    # los argumentos tal cual (sin pasar por el armado de binarios de emit)
+    url = f"tcp://127.0.0.1:{broker.server_address[1]}"
+    servidor_a, _ = _worker(url)
+    servidor_b, _ = _worker(url)
+    respuestas = queue.Queue()
+    servidor_b.manager._handle_callback = respuestas.put
+    mensaje = {"method": "callback", "host_id": servidor_b.manager.host_id, "sid": "s",
+               "namespace": "/", "id": 1, "args": [b"\x00ok", {"sdp": b"\xff"}]}
+
+    recibido = _esperar(respuestas, lambda: servidor_a.manager._publish(mensaje))
+
+    assert recibido == mensaje
@@ -0,0 +1,307 @@
+import base64
+import email
+import email.policy
+import shutil
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+
+import pytest
+
+import correo
+from db import transaccion
+
+
+class ServidorSMTP(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP minimo en 127.0.0.1 para probar el remitente de punta a
+    punta (conexion, STARTTLS, AUTH PLAIN, envio, QUIT). fallar() programa
+    una respuesta de error, o un corte de la conexion, para un comando.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, contexto_tls=None):
+        super().__init__(("127.0.0.1", 0), _SesionSMTP)
+        self.contexto_tls = contexto_tls
+        self.sesiones = 0
+        self.sesiones_tls = 0
+        self.logins = []
+        self.mensajes = []
+        self._fallas = []
+        self._lock = threading.Lock()
+
+    @property
+    def puerto(self):
+        return self.server_address[1]
+
+    def fallar(self, comando, respuesta=None):
+        """La proxima vez que llegue comando responde respuesta (None: corta)."""
+        self._fallas.append((comando, respuesta))
+
+    def _falla(self, comando):
+        with self._lock:
+            for i, (esperado, respuesta) in enumerate(self._fallas):
+                if esperado == comando:
+                    del self._fallas[i]
+                    return True, respuesta
+        return False, None
+
+    def destinatarios(self):
+        return sorted(m["To"] for m in self.mensajes)
+
+
+class _SesionSMTP(socketserver.StreamRequestHandler):
+    def _responder(self, *lineas):
+        for linea in lineas[:-1]:
+            self.wfile.write(f"{linea[:3]}-{linea[4:]}\r\n".encode())
+        self.wfile.write(f"{lineas[-1]}\r\n".encode())
+        self.wfile.flush()
+
+    def handle(self):
+        servidor = self.server
+        with servidor._lock:
+            servidor.sesiones += 1
+        tls = False
+        self._responder("220 smtp.test listo")
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            comando, _, argumento = linea.decode().rstrip("\r\n").partition(" ")
+            comando = comando.upper()
+            fallar, respuesta = servidor._falla(comando)
+            if fallar and respuesta is None:
+                return
+            if fallar:
+                self._responder(respuesta)
+            elif comando in ("EHLO", "HELO"):
+                extensiones = ["AUTH PLAIN"]
+                if servidor.contexto_tls is not None and not tls:
+                    extensiones.append("STARTTLS")
+                self._responder("250 smtp.test", *(f"250 {e}" for e in extensiones))
+            elif comando == "STARTTLS":
+                self._responder("220 adelante")
+                self.connection = servidor.contexto_tls.wrap_socket(self.connection, server_side=True)
+                self.rfile = self.connection.makefile("rb")
+                self.wfile = self.connection.makefile("wb")
+                tls = True
+                with servidor._lock:
+                    servidor.sesiones_tls += 1
+            elif comando == "AUTH":
+                _, usuario, password = base64.b64decode(argumento.split(" ", 1)[1]).split(b"\0")
+                servidor.logins.append((usuario.decode(), password.decode()))
+                self._responder("235 autenticado")
+            elif comando == "DATA":
+                self._responder("354 mandar")
+                datos = []
+                for linea in iter(self.rfile.readline, b""):
+                    if linea == b".\r\n":
+                        break
+                    datos.append(linea[1:] if linea.startswith(b".") else linea)
+                servidor.mensajes.append(email.message_from_bytes(b"".join(datos), policy=email.policy.default))
+                self._responder("250 encolado")
+            elif comando == "QUIT":
+                self._responder("221 chau")
+                return
+            elif comando in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._responder("250 ok")
+            else:
+                self._responder("502 no implementado")
+
+
+@pytest.fixture
+def servidor(base_de_datos):
+    # El hilo de la app (si algun test la importo) no debe tomar estos mensajes
+    correo.detener_remitente()
+    smtp = ServidorSMTP()
+    threading.Thread(target=smtp.serve_forever, args=(0.05,), daemon=True).start()
+    yield smtp
+    smtp.shutdown()
+    smtp.server_close()
+
+
+@pytest.fixture
+def servidor_tls(servidor, tmp_path):
+    if shutil.which("openssl") is None:
+        pytest.skip("hace falta openssl para el certificado de prueba")
+    certificado, clave = tmp_path / "cert.pem", tmp_path / "clave.pem"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-keyout", str(clave), "-out", str(certificado)],
+                   check=True, capture_output=True)
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.load_cert_chain(certificado, clave)
+    servidor.contexto_tls = contexto
+    return servidor
+
+
+def _remitente(servidor, **config):
+    config = {"usuario": "u", "password": "p", "remitente": "learned@test", "starttls": False, **config}
+    return correo.RemitenteCorreo(host="127.0.0.1", port=servidor.puerto, **config)
+
+
+def _fila(email_id):
+    with transaccion() as cursor:
+        cursor.execute("""
+            SELECT estado, intentos, proximo_intento, ultimo_error, enviado_en
+            FROM emails_pendientes WHERE id = ?
+        """, (email_id,))
+        return cursor.fetchone()
+
+
+def _vencer(email_id):
+    with transaccion() as cursor:
+        cursor.execute("UPDATE emails_pendientes SET proximo_intento = 0 WHERE id = ?", (email_id,))
+
+
+def test_lote_reservado_y_enviado_en_una_sesion(servidor, monkeypatch):
+    monkeypatch.setattr(correo, "LOTE", 2)
+    ids = [correo.encolar_email(f"a{i}@test", f"asunto {i}", "hola") for i in range(3)]
+    remitente = _remitente(servidor)
+
+    assert remitente.procesar_pendientes() == 2
+    assert remitente.procesar_pendientes() == 1
+    assert remitente.procesar_pendientes() == 0
+    remitente._cerrar_sesion()
+
+    assert servidor.sesiones == 1
+    assert servidor.logins == [("u", "p")]
+    assert servidor.destinatarios() == ["a0@test", "a1@test", "a2@test"]
+    assert servidor.mensajes[0]["From"] == "learned@test"
+    assert servidor.mensajes[0].get_content().strip() == "hola"
+    for email_id in ids:
+        estado, intentos, _, error, enviado_en = _fila(email_id)
+        assert (estado, intentos, error) == ("enviado", 1, None)
+        assert enviado_en is not None
+    assert remitente.enviados == 3
+
+
+def test_starttls(servidor_tls):
+    email_id = correo.encolar_email("a@test", "asunto", "hola")
+    remitente = _remitente(servidor_tls, starttls=True)
+
+    remitente.procesar_pendientes()
+    remitente._cerrar_sesion()
+
+    assert servidor_tls.sesiones_tls == 1
+    assert servidor_tls.logins == [("u", "p")]
+    assert _fila(email_id)[0] == "enviado"
+
+
+def test_mensajes_reservados_no_los_toma_otro_remitente(servidor):
+    correo.encolar_email("a@test", "asunto", "hola")
+    assert len(_remitente(servidor)._reservar_lote()) == 1
+    assert _remitente(servidor)._reservar_lote() == []
+
+
+def test_reintento_con_backoff(servidor):
+    email_id = correo.encolar_email("a@test", "asunto", "hola")
+    remitente = _remitente(servidor)
+    servidor.fallar("DATA", "451 intente mas tarde")
+
+    antes = time.time()
+    assert remitente.procesar_pendientes() == 1
+    estado, intentos, proximo, error, enviado_en = _fila(email_id)
+    assert (estado, intentos, enviado_en) == ("pendiente", 1, None)
+    assert "intente mas tarde" in error
+    assert proximo >= antes + correo._backoff(1)
+
+    # Hasta que venza el backoff no se vuelve a intentar
+    assert remitente.procesar_pendientes() == 0
+
+    _vencer(email_id)
+    assert remitente.procesar_pendientes() == 1
+    assert _fila(email_id)[:2] == ("enviado", 2)
+    assert servidor.destinatarios() == ["a@test"]
+    # Un 451 no invalida la sesion
+    assert servidor.sesiones == 1
+
+
+def test_backoff_exponencial_con_tope():
+    assert [correo._backoff(n) for n in (1, 2, 3)] == [
+        correo.BACKOFF_BASE_S, 2 * correo.BACKOFF_BASE_S, 4 * correo.BACKOFF_BASE_S]
+    assert correo._backoff(50) == correo.BACKOFF_MAX_S
+
+
+def test_fallido_al_agotar_los_intentos(servidor, monkeypatch):
+    monkeypatch.setattr(correo, "MAX_INTENTOS", 2)
+    email_id = correo.encolar_email("a@test", "asunto", "hola")
+    remitente = _remitente(servidor)
+    servidor.fallar("RCPT", "550 no existe")
+    servidor.fallar("RCPT", "550 no existe")
+
+    remitente.procesar_pendientes()
+    assert _fila(email_id)[0] == "pendiente"
+    _vencer(email_id)
+    remitente.procesar_pendientes()
+
+    estado, intentos, _, error, enviado_en = _fila(email_id)
+    assert (estado, intentos, enviado_en) == ("fallido", 2, None)
+    assert "no existe" in error
+    assert remitente.fallidos == 1
+    assert servidor.mensajes == []
+    _vencer(email_id)
+    assert remitente.procesar_pendientes() == 0
+
+
+def test_reconecta_si_se_corto_la_sesion(servidor):
+    remitente = _remitente(servidor)
+    correo.encolar_email("a@test", "asunto", "hola")
+    remitente.procesar_pendientes()
+    # El servidor corta la sesion ociosa; el remitente no se entera hasta mandar
+    servidor.fallar("MAIL")
+    email_id = correo.encolar_email("b@test", "asunto", "hola")
+
+    remitente.procesar_pendientes()
+
+    assert servidor.sesiones == 2
+    assert _fila(email_id)[:2] == ("enviado", 1)
+    assert servidor.destinatarios() == ["a@test", "b@test"]
+
+
+def test_sin_smtp_no_conecta(servidor):
+    email_id = correo.encolar_email("a@test", "asunto", "hola")
+    remitente = correo.RemitenteCorreo(host="")
+
+    assert remitente.procesar_pendientes() == 1
+    assert servidor.sesiones == 0
+    assert _fila(email_id)[0] == "sin_smtp"
+
+
+def test_mensaje_invalido_no_traba_el_lote(servidor):
+    ok = correo.encolar_email("ok@test", "asunto", "hola")
+    # Filas anteriores a la validacion de encolar_email
+    malo = correo.encolar_email("malo@test", "asunto", "hola")
+    with transaccion() as cursor:
+        cursor.execute("UPDATE emails_pendientes SET destinatario = ? WHERE id = ?",
+                       ("malo@test\nBcc: otro@test", malo))
+    otro = correo.encolar_email("otro@test", "asunto", "hola")
+    remitente = _remitente(servidor)
+
+    assert remitente.procesar_pendientes() == 3
+
+    assert _fila(ok)[0] == "enviado"
+    assert _fila(otro)[0] == "enviado"
+    estado, intentos, _, error, _ = _fila(malo)
+    assert (estado, intentos) == ("fallido", 1)
+    assert error
+    assert servidor.destinatarios() == ["ok@test", "otro@test"]
+    for email_id in (ok, malo, otro):
+        _vencer(email_id)
+    assert remitente.procesar_pendientes() == 0
+
+
+@pytest.mark.parametrize("destinatario, asunto", [
+    ("a@test\r\nBcc: b@test", "asunto"),
+    ("a@test", "asunto\nBcc: b@test"),
+    (None, "asunto"),
+])
+def test_encolar_rechaza_encabezados_invalidos(base_de_datos, destinatario, asunto):
+    with pytest.raises(ValueError):
+        correo.encolar_email(destinatario, asunto, "hola")
+    with transaccion() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM emails_pendientes")
+        assert cursor.fetchone()[0] == 0
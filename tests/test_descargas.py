@@ -0,0 +1,84 @@
+import io
+import os
+
+import pytest
+
+import storage
+from file_storage import blob_path, blob_relpath
+
+CONTENIDO = os.urandom(64 * 1024)
+
+
+@pytest.fixture
+def archivo(cliente, trabajo):
+    rv = cliente.post(f"/api/trabajos/{trabajo}/archivos",
+                      data={"files": (io.BytesIO(CONTENIDO), "clase 1.mp4")},
+                      content_type="multipart/form-data")
+    assert rv.status_code == 200
+    return rv.get_json()["files"][0]
+
+
+def test_descarga_completa_con_etag(cliente, archivo):
+    rv = cliente.get(archivo["url"])
+    assert rv.status_code == 200
+    assert rv.data == CONTENIDO
+    assert rv.headers["ETag"] == f'"{archivo["sha256"]}"'
+    assert rv.headers["Accept-Ranges"] == "bytes"
+    assert "immutable" in rv.headers["Cache-Control"]
+    assert "private" in rv.headers["Cache-Control"]
+    assert "attachment" in rv.headers["Content-Disposition"]
+
+
+def test_range_es_206(cliente, archivo):
+    rv = cliente.get(archivo["url"], headers={"Range": "bytes=100-199"})
+    assert rv.status_code == 206
+    assert rv.data == CONTENIDO[100:200]
+    assert rv.headers["Content-Range"] == f"bytes 100-199/{len(CONTENIDO)}"
+
+    rv = cliente.get(archivo["url"], headers={"Range": f"bytes={len(CONTENIDO)}-"})
+    assert rv.status_code == 416
+
+
+def test_if_none_match_es_304(cliente, archivo):
+    etag = cliente.get(archivo["url"]).headers["ETag"]
+    rv = cliente.get(archivo["url"], headers={"If-None-Match": etag})
+    assert rv.status_code == 304
+    assert rv.data == b""
+
+    rv = cliente.get(archivo["url"], headers={"If-None-Match": '"otro"'})
+    assert rv.status_code == 200
+
+
+def test_descarga_por_nombre(cliente, archivo):
+    rv = cliente.get(f"/api/trabajos/archivos/download/{archivo['filename']}",
+                     headers={"Range": "bytes=0-9"})
+    assert rv.status_code == 206
+    assert rv.data == CONTENIDO[:10]
+
+
+def test_x_accel_redirect(cliente, archivo, monkeypatch):
+    monkeypatch.setattr(storage, "ARCHIVOS_PROXY", "x-accel")
+    rv = cliente.get(archivo["url"], headers={"Range": "bytes=0-9"})
+    # El rango lo resuelve nginx con el archivo completo
+    assert rv.status_code == 200
+    assert rv.headers["X-Accel-Redirect"] == "/_archivos/" + blob_relpath(archivo["sha256"])
+    assert "X-Sendfile" not in rv.headers
+    assert rv.headers["ETag"] == f'"{archivo["sha256"]}"'
+    assert rv.data == b""
+
+    rv = cliente.get(archivo["url"], headers={"If-None-Match": rv.headers["ETag"]})
+    assert rv.status_code == 304
+    assert "X-Accel-Redirect" not in rv.headers
+
+
+def test_x_sendfile(cliente, archivo, monkeypatch):
+    monkeypatch.setattr(storage, "ARCHIVOS_PROXY", "x-sendfile")
+    rv = cliente.get(archivo["url"])
+    assert rv.status_code == 200
+    assert rv.headers["X-Sendfile"] == blob_path(archivo["sha256"])
+    assert rv.data == b""
+
+
+def test_archivo_sin_contenido_es_404(cliente, archivo):
+    os.unlink(blob_path(archivo["sha256"]))
+    assert cliente.get(archivo["url"]).status_code == 404
@@ -0,0 +1,74 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from db import transaccion
+from file_storage import blob_path
+
+TEXTO = b"una linea que se comprime bien\n" * 2000
+VIDEO = os.urandom(200 * 1024)
+
+
+@pytest.fixture
+def archivos(cliente, trabajo):
+    subidos = []
+    for contenido, nombre in ((TEXTO, "notas.txt"), (VIDEO, "clase.mp4"), (b"segunda version", "notas.txt")):
+        rv = cliente.post(f"/api/trabajos/{trabajo}/archivos",
+                          data={"files": (io.BytesIO(contenido), nombre)},
+                          content_type="multipart/form-data")
+        assert rv.status_code == 200
+        subidos.append(rv.get_json()["files"][0])
+    return subidos
+
+
+def _zip(rv):
+    assert rv.status_code == 200
+    assert rv.mimetype == "application/zip"
+    zf = zipfile.ZipFile(io.BytesIO(rv.data))
+    assert zf.testzip() is None
+    return zf
+
+
+def test_zip_del_trabajo(cliente, trabajo, archivos):
+    rv = cliente.get(f"/api/trabajos/{trabajo}/archivos/zip")
+    assert 'filename="Trabajo 1.zip"' in rv.headers["Content-Disposition"]
+    assert "no-store" in rv.headers["Cache-Control"]
+    zf = _zip(rv)
+
+    assert sorted(zf.namelist()) == ["clase.mp4", "notas (2).txt", "notas.txt"]
+    # El primero que se subio se queda con el nombre sin sufijo
+    assert zf.read("notas.txt") == TEXTO
+    assert zf.read("notas (2).txt") == b"segunda version"
+    assert zf.read("clase.mp4") == VIDEO
+    assert zf.getinfo("notas.txt").compress_type == zipfile.ZIP_DEFLATED
+    assert zf.getinfo("clase.mp4").compress_type == zipfile.ZIP_STORED
+
+
+def test_zip_de_la_clase_con_una_carpeta_por_trabajo(cliente, archivos):
+    with transaccion() as cursor:
+        cursor.execute("INSERT INTO trabajos (id, titulo, clase_id) VALUES ('trabajo2', 'Vacio', 'clase1')")
+    zf = _zip(cliente.get("/api/clases/clase1/archivos/zip"))
+    assert sorted(zf.namelist()) == ["Trabajo 1/clase.mp4", "Trabajo 1/notas (2).txt", "Trabajo 1/notas.txt"]
+
+
+def test_archivo_sin_contenido_no_va_en_el_zip(cliente, trabajo, archivos):
+    os.unlink(blob_path(archivos[1]["sha256"]))
+    zf = _zip(cliente.get(f"/api/trabajos/{trabajo}/archivos/zip"))
+    assert sorted(zf.namelist()) == ["notas (2).txt", "notas.txt"]
+
+
+def test_nombre_no_ascii(cliente, trabajo, archivos):
+    with transaccion() as cursor:
+        cursor.execute("UPDATE trabajos SET titulo = 'Química/1' WHERE id = ?", (trabajo,))
+    rv = cliente.get(f"/api/trabajos/{trabajo}/archivos/zip")
+    disposicion = rv.headers["Content-Disposition"]
+    assert "filename=Quimica_1.zip;" in disposicion
+    assert "filename*=UTF-8''Qu%C3%ADmica_1.zip" in disposicion
+    _zip(rv)
+
+
+def test_inexistente_es_404(cliente, base_de_datos):
+    assert cliente.get("/api/trabajos/nada/archivos/zip").status_code == 404
+    assert cliente.get("/api/clases/nada/archivos/zip").status_code == 404
@@ -0,0 +1,41 @@
+import pytest
+
+import hashing
+import metricas
+
+
+def test_cuantil_interpola_dentro_del_bucket():
+    h = metricas.Histograma("learned_prueba_cuantil_segundos", "prueba", ("op",), buckets=(1, 2, 4))
+    assert h.cuantil(0.5) is None
+    for valor in (0.5, 1.5, 1.5, 3):
+        h.observar(valor, op="a")
+    h.observar(100, op="b")
+
+    assert h.total() == 5
+    assert h.total(op="a") == 4
+    # 4 observaciones de "a": la mediana cae en el bucket (1, 2]
+    assert h.cuantil(0.5, op="a") == pytest.approx(1.5)
+    assert h.cuantil(1, op="a") == pytest.approx(4)
+    # por encima del ultimo bucket se devuelve su limite
+    assert h.cuantil(1) == 4
+
+
+def test_valor_suma_las_series():
+    c = metricas.Contador("learned_prueba_valor_total", "prueba", ("evento", "resultado"))
+    c.inc(evento="x", resultado="ok")
+    c.inc(2, evento="x", resultado="error")
+    c.inc(evento="y", resultado="ok")
+    assert c.valor() == 4
+    assert c.valor(evento="x") == 3
+    assert c.valor(resultado="ok") == 2
+    assert c.valor(evento="z") == 0
+
+
+def test_estadisticas_de_hashing():
+    antes = hashing.estadisticas()["completados"]
+    password_hash = hashing.hashear("secreta")
+    assert hashing.verificar("secreta", password_hash)
+    stats = hashing.estadisticas()
+    assert stats["completados"] == antes + 2
+    assert stats["en_vuelo"] == 0
+    assert stats["computo_ms_p50"] > 0
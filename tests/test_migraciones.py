@@ -0,0 +1,14 @@
+import pytest
+
+from migraciones import CONSULTAS_CALIENTES, MIGRACIONES, migrar, verificar_indices
+
+
+def test_migrar_es_idempotente(base_de_datos):
+    assert migrar() == MIGRACIONES[-1][0]
+
+
+@pytest.mark.parametrize("nombre", [c[0] for c in CONSULTAS_CALIENTES])
+def test_consultas_calientes_usan_su_indice(base_de_datos, nombre):
+    resultados = {r[0]: r for r in verificar_indices()}
+    _, indice, usa_indice, plan = resultados[nombre]
+    assert usa_indice, f"{nombre} no usa {indice}: {' | '.join(plan)}"
@@ -0,0 +1,54 @@
+from db import transaccion
+from notificaciones import asignar_a_usuario, crear_notificacion
+
+
+def _notificacion(noti_id, creada_en):
+    crear_notificacion(noti_id, "otro", None, noti_id, "d", "profe")
+    with transaccion() as cursor:
+        cursor.execute("UPDATE notificaciones SET creada_en = ? WHERE id = ?", (creada_en, noti_id))
+
+
+def _asignar(noti_id, asignacion_id, recibida_en):
+    asignar_a_usuario(noti_id, "profe", asignacion_id)
+    with transaccion() as cursor:
+        cursor.execute("UPDATE notificaciones_usuarios SET recibida_en = ? WHERE id = ?",
+                       (recibida_en, asignacion_id))
+
+
+def test_orden_del_feed(cliente, profesor):
+    # "vieja" se creo primero pero se asigno despues (/api/notificaciones/asignar)
+    _notificacion("vieja", "2026-01-01T10:00:00")
+    _notificacion("nueva", "2026-01-02T10:00:00")
+    _asignar("nueva", "a1", "2026-01-02T10:00:00")
+    _asignar("vieja", "a2", "2026-01-03T10:00:00")
+
+    # Sin paginar, como siempre: por creacion de la notificacion
+    lista = cliente.get("/api/notificaciones/profe").get_json()
+    assert [n["titulo"] for n in lista] == ["nueva", "vieja"]
+
+    # Paginado: por cuando le llego al usuario
+    pagina = cliente.get("/api/notificaciones/profe?limit=1").get_json()
+    assert [n["titulo"] for n in pagina["notificaciones"]] == ["vieja"]
+    pagina = cliente.get(f"/api/notificaciones/profe?limit=1&cursor={pagina['siguiente']}").get_json()
+    assert [n["titulo"] for n in pagina["notificaciones"]] == ["nueva"]
+
+
+def _crear(cliente, usuarios):
+    return cliente.post("/api/notificaciones/crear", json={
+        "tipo": "otro", "titulo": "t", "descripcion": "d", "creado_por": "profe", "usuarios": usuarios})
+
+
+def test_crear_asigna_una_vez_por_usuario(cliente, profesor):
+    rv = _crear(cliente, ["profe", "profe"])
+    assert rv.status_code == 200
+    assert [a["usuario_id"] for a in rv.get_json()["asignaciones"]] == ["profe"]
+    assert len(cliente.get("/api/notificaciones/profe").get_json()) == 1
+
+
+def test_crear_con_usuarios_invalidos_es_400(cliente, profesor):
+    rv = _crear(cliente, ["profe", "nadie", "nadie"])
+    assert rv.status_code == 400
+    assert rv.get_json()["usuarios"] == ["nadie"]
+    for usuarios in ([5], ["profe", None], [""], [["profe"]], "profe"):
+        assert _crear(cliente, usuarios).status_code == 400
+    assert cliente.get("/api/notificaciones/profe").get_json() == []
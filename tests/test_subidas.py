@@ -0,0 +1,116 @@
+import hashlib
+import os
+
+import subidas
+
+CONTENIDO = os.urandom(300 * 1024)
+
+
+def _abrir(cliente, trabajo, contenido=CONTENIDO, nombre="video.mp4"):
+    rv = cliente.post(f"/api/trabajos/{trabajo}/subidas", json={"nombre": nombre, "tamano": len(contenido)})
+    assert rv.status_code == 201
+    return rv.get_json()["id"]
+
+
+def _tramo(cliente, subida_id, offset, datos):
+    return cliente.put(f"/api/subidas/{subida_id}?offset={offset}", data=datos)
+
+
+def _mandar_todo(cliente, subida_id, contenido=CONTENIDO, tramo=100 * 1024):
+    for offset in range(0, len(contenido), tramo):
+        assert _tramo(cliente, subida_id, offset, contenido[offset:offset + tramo]).status_code == 200
+
+
+def test_tramos_desordenados(cliente, trabajo):
+    subida_id = _abrir(cliente, trabajo)
+    tramos = [(o, CONTENIDO[o:o + 100 * 1024]) for o in range(0, len(CONTENIDO), 100 * 1024)]
+
+    estado = _tramo(cliente, subida_id, *tramos[2]).get_json()
+    assert (estado["offset"], estado["rangos"]) == (0, [[200 * 1024, 300 * 1024]])
+    # Content-Range en vez de ?offset
+    rv = cliente.put(f"/api/subidas/{subida_id}", data=tramos[0][1],
+                     headers={"Content-Range": f"bytes 0-{100 * 1024 - 1}/{len(CONTENIDO)}"})
+    assert rv.get_json()["offset"] == 100 * 1024
+    # Repetir un tramo no hace dano
+    _tramo(cliente, subida_id, *tramos[0])
+
+    assert cliente.post(f"/api/subidas/{subida_id}/finalizar").status_code == 409
+
+    estado = _tramo(cliente, subida_id, *tramos[1]).get_json()
+    assert (estado["offset"], estado["recibido"]) == (len(CONTENIDO), len(CONTENIDO))
+    assert cliente.get(f"/api/subidas/{subida_id}").get_json()["rangos"] == [[0, len(CONTENIDO)]]
+
+    rv = cliente.post(f"/api/subidas/{subida_id}/finalizar",
+                      json={"sha256": hashlib.sha256(CONTENIDO).hexdigest()})
+    assert rv.status_code == 201
+    archivo = rv.get_json()
+    assert (archivo["original_name"], archivo["size"]) == ("video.mp4", len(CONTENIDO))
+    assert cliente.get(archivo["url"]).data == CONTENIDO
+    assert cliente.get(f"/api/subidas/{subida_id}").status_code == 404
+    assert not os.path.exists(subidas.ruta_staging(subida_id))
+
+
+def test_sha_distinto_reabre_la_subida(cliente, trabajo):
+    subida_id = _abrir(cliente, trabajo)
+    _mandar_todo(cliente, subida_id, CONTENIDO[:-1] + b"\0")
+
+    rv = cliente.post(f"/api/subidas/{subida_id}/finalizar",
+                      json={"sha256": hashlib.sha256(CONTENIDO).hexdigest()})
+    assert rv.status_code == 422
+
+    # Reabierta y sin tramos: hay que volver a mandarlos
+    estado = cliente.get(f"/api/subidas/{subida_id}").get_json()
+    assert (estado["offset"], estado["recibido"], estado["rangos"]) == (0, 0, [])
+    _mandar_todo(cliente, subida_id)
+    rv = cliente.post(f"/api/subidas/{subida_id}/finalizar",
+                      json={"sha256": hashlib.sha256(CONTENIDO).hexdigest()})
+    assert rv.status_code == 201
+    assert rv.get_json()["sha256"] == hashlib.sha256(CONTENIDO).hexdigest()
+
+
+def test_tramo_fuera_del_archivo_es_416(cliente, trabajo):
+    subida_id = _abrir(cliente, trabajo)
+    assert _tramo(cliente, subida_id, len(CONTENIDO) - 10, b"x" * 11).status_code == 416
+    assert _tramo(cliente, subida_id, len(CONTENIDO), b"x").status_code == 416
+    assert cliente.get(f"/api/subidas/{subida_id}").get_json()["recibido"] == 0
+
+
+def test_limites_de_tamano_son_413(cliente, trabajo, monkeypatch):
+    monkeypatch.setattr(subidas, "SUBIDA_MAX_BYTES", 1024)
+    rv = cliente.post(f"/api/trabajos/{trabajo}/subidas", json={"nombre": "a.bin", "tamano": 1025})
+    assert rv.status_code == 413
+
+    monkeypatch.setattr(subidas, "SUBIDA_MAX_BYTES", len(CONTENIDO))
+    monkeypatch.setattr(subidas, "SUBIDA_TRAMO_MAX_BYTES", 1024)
+    subida_id = _abrir(cliente, trabajo)
+    assert _tramo(cliente, subida_id, 0, CONTENIDO[:1025]).status_code == 413
+    assert _tramo(cliente, subida_id, 0, CONTENIDO[:1024]).status_code == 200
+
+
+def test_finalizar_con_error_al_guardar_reabre(cliente, trabajo, monkeypatch):
+    subida_id = _abrir(cliente, trabajo)
+    _mandar_todo(cliente, subida_id)
+
+    store_for_task = subidas.file_storage.store_for_task
+
+    def disco_lleno(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(subidas.file_storage, "store_for_task", disco_lleno)
+    cliente.application.config["PROPAGATE_EXCEPTIONS"] = False
+    try:
+        assert cliente.post(f"/api/subidas/{subida_id}/finalizar").status_code == 500
+    finally:
+        cliente.application.config["PROPAGATE_EXCEPTIONS"] = None
+    monkeypatch.setattr(subidas.file_storage, "store_for_task", store_for_task)
+
+    assert cliente.get(f"/api/subidas/{subida_id}").get_json()["recibido"] == len(CONTENIDO)
+    assert cliente.post(f"/api/subidas/{subida_id}/finalizar").status_code == 201
+
+
+def test_cancelar_borra_el_staging(cliente, trabajo):
+    subida_id = _abrir(cliente, trabajo)
+    assert os.path.exists(subidas.ruta_staging(subida_id))
+    assert cliente.delete(f"/api/subidas/{subida_id}").status_code == 200
+    assert not os.path.exists(subidas.ruta_staging(subida_id))
+    assert _tramo(cliente, subida_id, 0, b"x").status_code == 404
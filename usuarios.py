@@ -1,22 +1,26 @@
-from db import conectar, random_id
+import logging
+from db import conectar
+from ids import nuevo_id
+import cache
 from datetime import datetime
-import bcrypt
+import hashing
 import os
 import jwt
 import base64
 import secrets
 from datetime import timedelta
-import smtplib
-from email.message import EmailMessage
+from correo import encolar_email
+
+log = logging.getLogger(__name__)
 
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return hashing.hashear(password)
 
 def registrar_usuario(nombre, email, password, rol):
     conn = conectar()
     cursor = conn.cursor()
-    usuario_id = random_id("usuarios")
+    usuario_id = nuevo_id()
     creado_en = datetime.now().isoformat()
     password_hash = hash_password(password)
     try:
@@ -28,7 +32,7 @@ def registrar_usuario(nombre, email, password, rol):
         return usuario_id
     except Exception as e:
         conn.rollback()
-        print("Error al registrar usuario:", e)
+        log.exception("Error al registrar usuario")
         return None  # ← devolvemos None en lugar de lanzar excepción
     finally:
         conn.close()
@@ -42,11 +46,14 @@ def login_usuario(email, password):
     """, (email,))
     usuario = cursor.fetchone()
     conn.close()
-    if usuario and bcrypt.checkpw(password.encode(), usuario[3]):
+    if usuario and hashing.verificar(password, usuario[3]):
         return usuario[:3]
     return None
 
 def obtener_usuario_por_id(usuario_id):
+    return cache.obtener(cache.clave_usuario(usuario_id), lambda: _cargar_usuario_por_id(usuario_id))
+
+def _cargar_usuario_por_id(usuario_id):
     conn = conectar()
     cursor = conn.cursor()
     cursor.execute("""
@@ -64,34 +71,23 @@ def obtener_usuario_por_id(usuario_id):
         }
     return None
 
+def obtener_usuario_por_email(email):
+    return cache.obtener(cache.clave_usuario_email(email), lambda: _cargar_usuario_por_email(email))
 
-def _enviar_email_smtp(to_email, subject, body):
-    smtp_host = os.getenv('SMTP_HOST')
-    smtp_port = int(os.getenv('SMTP_PORT', '587'))
-    smtp_user = os.getenv('SMTP_USER')
-    smtp_pass = os.getenv('SMTP_PASS')
-    email_from = os.getenv('EMAIL_FROM', smtp_user)
-
-    if not smtp_host or not smtp_user or not smtp_pass:
-        print('SMTP no configurado. Mensaje:')
-        print(body)
-        return False
-
-    msg = EmailMessage()
-    msg['Subject'] = subject
-    msg['From'] = email_from
-    msg['To'] = to_email
-    msg.set_content(body)
-
-    try:
-        with smtplib.SMTP(smtp_host, smtp_port) as s:
-            s.starttls()
-            s.login(smtp_user, smtp_pass)
-            s.send_message(msg)
-        return True
-    except Exception as e:
-        print('Error enviando SMTP:', e)
-        return False
+def _cargar_usuario_por_email(email):
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, nombre, email, rol FROM usuarios WHERE email = ?", (email,))
+    usuario = cursor.fetchone()
+    conn.close()
+    if usuario:
+        return {
+            "id": usuario[0],
+            "nombre": usuario[1],
+            "email": usuario[2],
+            "rol": usuario[3]
+        }
+    return None
 
 
 def iniciar_registro_con_verificacion(nombre, email, password, rol='estudiante', expires_minutes=15):
@@ -103,7 +99,7 @@ def iniciar_registro_con_verificacion(nombre, email, password, rol='estudiante',
     codigo = str(secrets.randbelow(10**6)).zfill(6)
 
     # crear hash de password y codificarlo para meterlo en el token
-    password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    password_hash = hashing.hashear(password)
     password_b64 = base64.b64encode(password_hash).decode()
 
     payload = {
@@ -118,10 +114,10 @@ def iniciar_registro_con_verificacion(nombre, email, password, rol='estudiante',
     secret = os.getenv('SECRET_KEY')
     token = jwt.encode(payload, secret, algorithm='HS256')
 
-    # enviar email con el codigo
+    # el email con el codigo lo manda el remitente en segundo plano
     subject = 'Código de verificación'
     body = f'Hola {nombre},\n\nTu código de verificación es: {codigo}\nEste código expira en {expires_minutes} minutos.\n\nSaludos.'
-    _enviar_email_smtp(email, subject, body)
+    encolar_email(email, subject, body)
 
     return token
 
@@ -134,7 +130,7 @@ def confirmar_registro_con_token(token, codigo):
     try:
         payload = jwt.decode(token, secret, algorithms=['HS256'])
     except Exception as e:
-        print('Token inválido o expirado:', e)
+        log.info('Token de registro inválido o expirado', extra={'error': str(e)})
         return None
 
     if payload.get('codigo') != codigo:
@@ -152,7 +148,7 @@ def confirmar_registro_con_token(token, codigo):
     # crear usuario usando hash directamente
     conn = conectar()
     cursor = conn.cursor()
-    usuario_id = random_id('usuarios')
+    usuario_id = nuevo_id()
     creado_en = datetime.now().isoformat()
     try:
         cursor.execute('''
@@ -163,7 +159,7 @@ def confirmar_registro_con_token(token, codigo):
         return usuario_id
     except Exception as e:
         conn.rollback()
-        print('Error al crear usuario desde token:', e)
+        log.exception('Error al crear usuario desde token')
         return None
     finally:
         conn.close()
\ No newline at end of file